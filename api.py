@@ -1,14 +1,28 @@
 ﻿"""
 Officina AI Assistant - REST API
 """
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict
+import re
+import json
+import hashlib
+import time
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 
 from src import OfficinaChatbot
+from src.qa_chain import abandoned_chains
+from src.admission import AdmissionController, Overloaded, RateLimiter
+from src.catalog import get_catalog
+from src.instrumentation import query_stage
+from src.metrics import CONTENT_TYPE, HTTP_REQUESTS, HTTP_SECONDS, REGISTRY, render_metrics
+from src.tracing import start_trace
+from src.query_log import get_query_logger
 from src.utils import save_query_log
+from src.warmup import Warmup
 from config import settings, validate_settings
 
 # Setup logging
@@ -33,9 +47,47 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Chatbot globale (inizializzato all'avvio)
+
+@app.middleware("http")
+async def http_metrics(request: Request, call_next):
+    """Contatori e latenza per route (template del path: nessuna serie per ogni marca/modello)"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", "other")
+        HTTP_SECONDS.observe(time.perf_counter() - start, method=request.method, route=path)
+        HTTP_REQUESTS.inc(method=request.method, route=path, status=status)
+
+# Chatbot globale (assegnato quando il warm-up è completato)
 chatbot: Optional[OfficinaChatbot] = None
 
+# Trace ID accettati dall'header X-Trace-Id
+TRACE_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# Warm-up in background: il worker accetta query solo quando è pronto
+warmup = Warmup()
+warmup_task: Optional[asyncio.Task] = None
+
+# Controllo di ammissione: domande in elaborazione limitate (con coda) e rate limit per API key
+admission = AdmissionController(
+    settings.MAX_CONCURRENT_QUERIES,
+    settings.MAX_QUEUED_QUERIES,
+    settings.QUEUE_TIMEOUT_SECONDS
+)
+rate_limiter = RateLimiter(settings.RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_BURST)
+
+REGISTRY.gauge(
+    "officina_admission_queries",
+    "Domande in elaborazione (active) e in coda (queued)",
+    ["state"],
+    lambda: {("active",): admission.active, ("queued",): admission.waiting}
+)
+
 
 # Models
 class QueryRequest(BaseModel):
@@ -45,6 +97,9 @@ class QueryRequest(BaseModel):
     modello: Optional[str] = Field(None, description="Filtro modello auto")
     anno: Optional[str] = Field(None, description="Filtro anno auto")
     return_sources: bool = Field(True, description="Restituisci documenti sorgente")
+    timeout: Optional[float] = Field(
+        None, gt=0, le=300, description="Budget di latenza in secondi (default QUERY_TIMEOUT_SECONDS)"
+    )
     
     class Config:
         json_schema_extra = {
@@ -73,6 +128,9 @@ class QueryResponse(BaseModel):
     """Risposta query"""
     answer: str = Field(..., description="Risposta alla domanda")
     sources: Optional[List[Source]] = Field(None, description="Documenti sorgente")
+    trace_id: Optional[str] = Field(None, description="ID della traccia (scripts/trace_report.py --trace-id)")
+    partial: bool = Field(False, description="Risposta parziale: budget di latenza superato, solo i passaggi dei manuali")
+    partial_reason: Optional[str] = Field(None, description="Fase scaduta (retrieval_timeout, llm_timeout)")
     
     class Config:
         json_schema_extra = {
@@ -93,12 +151,37 @@ class QueryResponse(BaseModel):
         }
 
 
+class BatchQueryRequest(BaseModel):
+    """Richiesta batch: domande indipendenti elaborate insieme"""
+    queries: List[QueryRequest] = Field(..., description="Domande (con filtri propri)", min_length=1)
+
+
+class BatchItem(BaseModel):
+    """Risultato di una domanda del batch"""
+    index: int = Field(..., description="Posizione della domanda nel batch")
+    answer: Optional[str] = Field(None, description="Risposta (assente in caso di errore)")
+    sources: Optional[List[Source]] = Field(None, description="Documenti sorgente")
+    error: Optional[str] = Field(None, description="Errore della singola domanda")
+    partial: bool = Field(False, description="Risposta parziale (budget di latenza superato)")
+
+
+class BatchQueryResponse(BaseModel):
+    """Risposta batch: un risultato per domanda, nello stesso ordine"""
+    results: List[BatchItem]
+    succeeded: int
+    failed: int
+    trace_id: Optional[str] = Field(None, description="ID della traccia del batch")
+
+
 class HealthResponse(BaseModel):
     """Health check response"""
     status: str
     version: str
     llm_provider: str
     memory_enabled: bool
+    ready: bool = False
+    warmup: Optional[str] = None
+    admission: Optional[Dict] = None
 
 
 class ErrorResponse(BaseModel):
@@ -106,34 +189,137 @@ class ErrorResponse(BaseModel):
     detail: str
 
 
+def overloaded_error(error: Overloaded, status_code: int) -> HTTPException:
+    """Richiesta rifiutata per carico: 429 (rate limit) o 503 (servizio saturo) con Retry-After"""
+    return HTTPException(
+        status_code=status_code,
+        detail=str(error),
+        headers={"Retry-After": error.retry_after_header}
+    )
+
+
 # Dependency per API key (se configurata)
-async def verify_api_key(x_api_key: Optional[str] = Header(None)):
-    """Verifica API key se configurata"""
+async def api_client(request: Request, x_api_key: Optional[str] = Header(None)) -> str:
+    """Verifica API key se configurata e restituisce il client del rate limit (API key o IP)"""
     if settings.API_SECRET_KEY:
         if not x_api_key or x_api_key != settings.API_SECRET_KEY:
             raise HTTPException(
                 status_code=401,
                 detail="API Key non valida o mancante"
             )
+        return f"key:{x_api_key}"
+    # Header non verificato: cambiandolo si aggirerebbe il limite, vale l'IP
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def charge_rate_limit(client: str, cost: int = 1):
+    """Consuma cost token del client, 429 con Retry-After se non disponibili"""
+    try:
+        rate_limiter.check(client, cost=cost)
+    except Overloaded as e:
+        raise overloaded_error(e, 429)
+
+
+async def verify_api_key(client: str = Depends(api_client)):
+    """Verifica API key se configurata e applica il rate limit per API key (o IP)"""
+    charge_rate_limit(client)
     return True
 
 
+@asynccontextmanager
+async def admit_query():
+    """
+    Posto di elaborazione per una domanda: attende in coda o risponde subito 503
+    
+    Una chain scaduta (risposta parziale) continua a chiamare l'LLM: il
+    posto resta occupato fino alla sua fine, così MAX_CONCURRENT_QUERIES
+    limita davvero il carico sul provider.
+    """
+    try:
+        async with admission.slot() as held:
+            with abandoned_chains(held):
+                yield
+    except Overloaded as e:
+        logger.warning(f"🚦 Domanda rifiutata ({e.reason}): {admission.stats()}")
+        raise overloaded_error(e, 503)
+
+
+def require_chatbot() -> OfficinaChatbot:
+    """Chatbot pronto, altrimenti 503 con Retry-After (warm-up in corso o fallito)"""
+    if not chatbot:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Servizio non pronto (warm-up: {warmup.state})",
+            headers={"Retry-After": str(settings.WARMUP_RETRY_SECONDS)}
+        )
+    return chatbot
+
+
+def request_filters(request: QueryRequest) -> Dict:
+    """Filtri marca/modello/anno di una domanda"""
+    filters = {}
+    if request.marca:
+        filters["marca"] = request.marca.upper()
+    if request.modello:
+        filters["modello"] = request.modello
+    if request.anno:
+        filters["anno"] = request.anno
+    return filters
+
+
+def remaining_budget(timeout: Optional[float], received: float) -> float:
+    """Budget di latenza residuo della richiesta (incluso il tempo in coda), 0 se senza budget"""
+    budget = timeout or settings.QUERY_TIMEOUT_SECONDS
+    if not budget or budget <= 0:
+        return 0
+    return max(0.001, budget - (time.monotonic() - received))
+
+
+def catalog_response(response: Response, if_none_match: Optional[str], build):
+    """
+    Risposta basata sul catalogo con ETag: se il client ha già la versione
+    corrente (If-None-Match) risponde 304 senza corpo
+    
+    L'ETag è calcolato sul corpo servito: con catalogo vuoto le liste
+    vengono dai nomi dei PDF e cambiano senza che cambi il catalogo.
+    """
+    body = build()
+    payload = json.dumps(body, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    etag = f'"{hashlib.sha1(payload).hexdigest()}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return body
+
+
+async def run_warmup():
+    """Warm-up in un thread, ripetuto finché non riesce (es. Pinecone o LLM non raggiungibili)"""
+    global chatbot
+    
+    while not await asyncio.to_thread(warmup.run):
+        logger.info(f"🔁 Nuovo warm-up tra {settings.WARMUP_RETRY_SECONDS}s")
+        await asyncio.sleep(settings.WARMUP_RETRY_SECONDS)
+    
+    chatbot = warmup.chatbot
+    logger.info("✅ API pronta!")
+
+
 # Startup/Shutdown events
 @app.on_event("startup")
 async def startup_event():
-    """Inizializza il chatbot all'avvio"""
-    global chatbot
+    """Valida la configurazione e avvia il warm-up senza bloccare l'avvio"""
+    global warmup_task
     
     try:
         logger.info("🚀 Inizializzazione Officina AI API...")
         
-        # Valida configurazione
+        # Valida configurazione (errori di configurazione: il worker non parte)
         validate_settings()
         
-        # Inizializza chatbot
-        chatbot = OfficinaChatbot()
-        
-        logger.info("✅ API pronta!")
+        # Client, indici locali e query di prova: /health/ready risponde 200 al termine
+        warmup_task = asyncio.create_task(run_warmup())
         
     except Exception as e:
         logger.error(f"❌ Errore inizializzazione: {e}")
@@ -144,6 +330,9 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup alla chiusura"""
     logger.info("👋 Shutdown API...")
+    get_query_logger().close()
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
 
 
 # Endpoints
@@ -154,7 +343,9 @@ async def root():
         "message": "Officina AI Assistant API",
         "version": "1.0.0",
         "docs": "/docs",
-        "health": "/health"
+        "health": "/health",
+        "liveness": "/health/live",
+        "readiness": "/health/ready"
     }
 
 
@@ -166,24 +357,71 @@ async def root():
 async def health_check():
     """Health check endpoint"""
     return {
-        "status": "healthy" if chatbot else "unhealthy",
+        "status": "healthy" if chatbot else ("unhealthy" if warmup.state == "failed" else "starting"),
         "version": "1.0.0",
         "llm_provider": settings.LLM_PROVIDER,
-        "memory_enabled": settings.ENABLE_MEMORY
+        "memory_enabled": settings.ENABLE_MEMORY,
+        "ready": chatbot is not None,
+        "warmup": warmup.state,
+        "admission": admission.stats()
     }
 
 
+@app.get("/health/live", tags=["Health"])
+async def liveness():
+    """Liveness: il processo risponde (non dipende da Pinecone né dall'LLM)"""
+    return {"status": "alive", "uptime_seconds": warmup.status()["uptime_seconds"]}
+
+
+@app.get("/health/ready", tags=["Health"])
+async def readiness(response: Response):
+    """
+    Readiness: 200 solo a warm-up completato, altrimenti 503
+    
+    Il corpo riporta il progresso del warm-up e la latenza di ogni
+    dipendenza (chatbot, indice, indici locali, embedding, ricerca, LLM).
+    """
+    status = warmup.status()
+    status["ready"] = chatbot is not None
+    if not status["ready"]:
+        response.status_code = 503
+        response.headers["Retry-After"] = str(settings.WARMUP_RETRY_SECONDS)
+    return status
+
+
+@app.get("/metrics", tags=["Health"])
+async def metrics():
+    """
+    Metriche in formato Prometheus (per processo/worker)
+    
+    Latenza per fase delle query (embedding, search, retrieval, llm,
+    llm_first_token, sources, response, total), accessi e hit rate delle
+    cache, token LLM, errori e richieste HTTP per route.
+    """
+    if not settings.ENABLE_METRICS:
+        raise HTTPException(status_code=404, detail="Metriche disabilitate")
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
+
+
 @app.post(
     "/query",
     response_model=QueryResponse,
     responses={
+        400: {"model": ErrorResponse},
         401: {"model": ErrorResponse},
-        500: {"model": ErrorResponse}
+        429: {"model": ErrorResponse},
+        500: {"model": ErrorResponse},
+        503: {"model": ErrorResponse}
     },
     tags=["Query"],
     dependencies=[Depends(verify_api_key)]
 )
-async def query(request: QueryRequest):
+async def query(
+    request: QueryRequest,
+    http_response: Response,
+    x_trace_id: Optional[str] = Header(None),
+    x_profile: Optional[str] = Header(None)
+):
     """
     Poni una domanda al chatbot
     
@@ -192,55 +430,186 @@ async def query(request: QueryRequest):
     - **modello**: Filtro opzionale per modello auto
     - **anno**: Filtro opzionale per anno auto
     - **return_sources**: Se restituire i documenti sorgente
+    
+    Header opzionali: **X-Trace-Id** (ID della traccia, altrimenti generato
+    e restituito in X-Trace-Id e trace_id) e **X-Profile: true** (profilo
+    a campionamento della richiesta in logs/profiles).
+    
+    Superato il budget di latenza (**timeout**, default QUERY_TIMEOUT_SECONDS,
+    incluso il tempo in coda) la risposta è parziale (**partial**) con i
+    passaggi dei manuali già recuperati.
     """
-    if not chatbot:
-        raise HTTPException(
-            status_code=500,
-            detail="Chatbot non inizializzato"
-        )
+    received = time.monotonic()
+    require_chatbot()
     
-    try:
-        # Prepara filtri
-        filters = {}
-        if request.marca:
-            filters["marca"] = request.marca.upper()
-        if request.modello:
-            filters["modello"] = request.modello
-        if request.anno:
-            filters["anno"] = request.anno
-        
-        # Esegui query
-        response = chatbot.ask(
-            question=request.question,
-            filters=filters if filters else None,
-            return_sources=request.return_sources
-        )
-        
-        # Log query
-        save_query_log(
-            request.question,
-            response.get("answer", ""),
-            response.get("sources", [])
-        )
-        
-        # Formatta risposta
-        result = {
-            "answer": response.get("answer", ""),
-        }
-        
-        if request.return_sources and "sources" in response:
-            result["sources"] = [
-                Source(**source) for source in response["sources"]
-            ]
-        
-        return result
+    # Prepara filtri
+    filters = request_filters(request)
+    
+    # Filtri impossibili: nessuna query al vector store né all'LLM
+    error = get_catalog().validate_filters(filters)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    
+    # Trace ID del chiamante (se valido) e profilo su richiesta (header X-Profile)
+    trace_id = x_trace_id if x_trace_id and TRACE_ID.fullmatch(x_trace_id) else None
+    profile = True if (x_profile or "").lower() in ("1", "true", "yes") else None
+    
+    with start_trace("POST /query", trace_id=trace_id, profile=profile) as trace:
+        http_response.headers["X-Trace-Id"] = trace.trace_id
+        try:
+            # Esegui query in un thread: le richieste concorrenti non bloccano il server
+            # (e quelle identiche condividono la stessa elaborazione); al massimo
+            # MAX_CONCURRENT_QUERIES alla volta, le altre in coda
+            async with admit_query():
+                response = await asyncio.to_thread(
+                    chatbot.ask,
+                    question=request.question,
+                    filters=filters if filters else None,
+                    return_sources=request.return_sources,
+                    timeout=remaining_budget(request.timeout, received)
+                )
+            
+            # Log query
+            save_query_log(
+                request.question,
+                response.get("answer", ""),
+                response.get("sources", []),
+                response.get("timings")
+            )
+            
+            # Formatta risposta
+            with query_stage("response"):
+                result = {
+                    "answer": response.get("answer", ""),
+                    "trace_id": trace.trace_id,
+                    "partial": response.get("partial", False),
+                    "partial_reason": response.get("partial_reason"),
+                }
+                
+                if request.return_sources and "sources" in response:
+                    result["sources"] = [
+                        Source(**source) for source in response["sources"]
+                    ]
+            
+            return result
         
-    except Exception as e:
-        logger.error(f"❌ Errore query: {e}")
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Errore query: {e}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Errore elaborazione query: {str(e)}"
+            )
+
+
+@app.post(
+    "/query/batch",
+    response_model=BatchQueryResponse,
+    responses={
+        400: {"model": ErrorResponse},
+        401: {"model": ErrorResponse},
+        429: {"model": ErrorResponse},
+        503: {"model": ErrorResponse}
+    },
+    tags=["Query"]
+)
+async def query_batch(request: BatchQueryRequest, http_response: Response, client: str = Depends(api_client)):
+    """
+    Poni più domande indipendenti in una sola richiesta (es. checklist)
+    
+    Un solo embedding per tutte le domande, ricerche in parallelo e al
+    massimo BATCH_LLM_CONCURRENCY chiamate all'LLM concorrenti, ognuna con
+    il proprio posto di elaborazione: il batch dura circa quanto la sua
+    domanda più lenta. Ogni domanda ha il proprio risultato o errore (anche
+    per servizio sovraccarico) e il proprio budget di latenza dall'arrivo
+    della richiesta; le domande non usano la memoria conversazionale.
+    Ogni domanda consuma un token del rate limit.
+    """
+    received = time.monotonic()
+    require_chatbot()
+    
+    if len(request.queries) > settings.BATCH_MAX_QUERIES:
         raise HTTPException(
-            status_code=500,
-            detail=f"Errore elaborazione query: {str(e)}"
+            status_code=400,
+            detail=f"Massimo {settings.BATCH_MAX_QUERIES} domande per batch (ricevute {len(request.queries)})"
         )
+    charge_rate_limit(client, cost=max(1, len(request.queries)))
+    
+    results: List[Optional[BatchItem]] = [None] * len(request.queries)
+    pending = []
+    catalog = get_catalog()
+    for i, item in enumerate(request.queries):
+        filters = request_filters(item)
+        # Filtri impossibili: errore della sola domanda, senza ricerca né LLM
+        error = catalog.validate_filters(filters)
+        if error:
+            results[i] = BatchItem(index=i, error=error)
+        else:
+            pending.append((i, item, filters or None))
+    
+    llm_calls = asyncio.Semaphore(max(1, settings.BATCH_LLM_CONCURRENCY))
+    
+    async def answer(item: QueryRequest, filters: Optional[Dict], documents: Optional[List]) -> Dict:
+        # Un posto di elaborazione per chiamata all'LLM: il batch rispetta MAX_CONCURRENT_QUERIES
+        async with llm_calls:
+            try:
+                async with admit_query():
+                    return await asyncio.to_thread(
+                        chatbot.ask,
+                        item.question,
+                        filters=filters,
+                        return_sources=item.return_sources,
+                        documents=documents,
+                        timeout=remaining_budget(item.timeout, received)
+                    )
+            except HTTPException as e:
+                return {"answer": "", "error": e.detail}
+            except Exception as e:
+                logger.error(f"❌ Errore domanda del batch: {e}")
+                return {"answer": "", "error": str(e)}
+    
+    with start_trace("POST /query/batch", queries=len(request.queries)) as trace:
+        http_response.headers["X-Trace-Id"] = trace.trace_id
+        if pending:
+            # Ricerca di gruppo (embedding e vector store, senza LLM)
+            async with admit_query():
+                documents = await asyncio.to_thread(
+                    chatbot.retrieve_many,
+                    [item.question for _, item, _ in pending],
+                    [filters for _, _, filters in pending]
+                )
+            
+            responses = await asyncio.gather(*(
+                answer(item, filters, docs) for (_, item, filters), docs in zip(pending, documents)
+            ))
+            
+            for (i, item, _), response in zip(pending, responses):
+                if "error" in response:
+                    results[i] = BatchItem(index=i, error=response["error"])
+                    continue
+                
+                save_query_log(
+                    item.question,
+                    response.get("answer", ""),
+                    response.get("sources", []),
+                    response.get("timings")
+                )
+                results[i] = BatchItem(
+                    index=i,
+                    answer=response.get("answer", ""),
+                    partial=response.get("partial", False),
+                    sources=[Source(**source) for source in response["sources"]]
+                    if item.return_sources and "sources" in response else None
+                )
+    
+    failed = sum(1 for result in results if result.error)
+    return {
+        "results": results,
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "trace_id": trace.trace_id
+    }
 
 
 @app.get(
@@ -249,10 +618,10 @@ async def query(request: QueryRequest):
     tags=["Filters"],
     dependencies=[Depends(verify_api_key)]
 )
-async def get_brands():
+async def get_brands(response: Response, if_none_match: Optional[str] = Header(None)):
     """Ottieni lista marche disponibili"""
     from src.utils import get_available_brands
-    return get_available_brands()
+    return catalog_response(response, if_none_match, get_available_brands)
 
 
 @app.get(
@@ -261,10 +630,20 @@ async def get_brands():
     tags=["Filters"],
     dependencies=[Depends(verify_api_key)]
 )
-async def get_models(brand: str):
+async def get_models(brand: str, response: Response, if_none_match: Optional[str] = Header(None)):
     """Ottieni lista modelli disponibili per una marca"""
     from src.utils import get_available_models
-    return get_available_models(brand)
+    return catalog_response(response, if_none_match, lambda: get_available_models(brand))
+
+
+@app.get(
+    "/catalog",
+    tags=["Filters"],
+    dependencies=[Depends(verify_api_key)]
+)
+async def get_catalog_tree(response: Response, if_none_match: Optional[str] = Header(None)):
+    """Ottieni il catalogo completo (marca → modello → anno → numero di chunks)"""
+    return catalog_response(response, if_none_match, lambda: get_catalog().to_dict())
 
 
 @app.post(
@@ -274,11 +653,7 @@ async def get_models(brand: str):
 )
 async def clear_memory():
     """Pulisci la memoria conversazionale"""
-    if not chatbot:
-        raise HTTPException(
-            status_code=500,
-            detail="Chatbot non inizializzato"
-        )
+    require_chatbot()
     
     if not settings.ENABLE_MEMORY:
         raise HTTPException(
@@ -297,11 +672,7 @@ async def clear_memory():
 )
 async def get_history():
     """Ottieni storico conversazione"""
-    if not chatbot:
-        raise HTTPException(
-            status_code=500,
-            detail="Chatbot non inizializzato"
-        )
+    require_chatbot()
     
     if not settings.ENABLE_MEMORY:
         raise HTTPException(
@@ -9,9 +9,11 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from src import OfficinaChatbot, get_available_brands, get_available_models
-from src.utils import save_query_log
+from src.utils import configure_logging, save_query_log
 from config import settings, validate_settings
 
+configure_logging()
+
 # Configurazione pagina
 st.set_page_config(
     page_title="Officina AI Assistant",
@@ -192,7 +194,7 @@ def main():
                         st.markdown(format_sources(sources), unsafe_allow_html=True)
                     
                     # Salva nel log
-                    save_query_log(prompt, answer, sources)
+                    save_query_log(prompt, answer, sources, response.get("timings"))
                     
                     # Aggiungi a storico
                     st.session_state.messages.append({
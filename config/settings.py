@@ -2,6 +2,7 @@
 Configurazioni centralizzate per Officina AI Assistant
 """
 import os
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
@@ -9,14 +10,16 @@ from pydantic_settings import BaseSettings
 # Carica variabili d'ambiente
 load_dotenv()
 
-# Supporto per Streamlit Cloud secrets
-try:
-    import streamlit as st
-    if hasattr(st, 'secrets'):
-        # Siamo su Streamlit Cloud, usa secrets
-        os.environ.update(st.secrets)
-except:
-    pass
+# Supporto per Streamlit Cloud secrets (solo se l'app Streamlit ha già importato streamlit:
+# API, script e test non pagano l'import della libreria)
+if "streamlit" in sys.modules:
+    try:
+        st = sys.modules["streamlit"]
+        if hasattr(st, 'secrets'):
+            # Siamo su Streamlit Cloud, usa secrets
+            os.environ.update(st.secrets)
+    except Exception:
+        pass
 
 class Settings(BaseSettings):
     """Configurazioni dell'applicazione"""
@@ -25,6 +28,7 @@ class Settings(BaseSettings):
     BASE_DIR: Path = Path(__file__).parent.parent
     DATA_DIR: Path = BASE_DIR / "data"
     MANUALS_PATH: Path = DATA_DIR / "manuali"
+    CATALOG_PATH: Path = Path(os.getenv("CATALOG_PATH", str(DATA_DIR / "catalog.json")))
     
     # ===== LLM PROVIDER =====
     LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "anthropic")
@@ -41,13 +45,71 @@ class Settings(BaseSettings):
     PINECONE_API_KEY: str = os.getenv("PINECONE_API_KEY", "")
     PINECONE_ENVIRONMENT: str = os.getenv("PINECONE_ENVIRONMENT", "")
     PINECONE_INDEX_NAME: str = os.getenv("PINECONE_INDEX_NAME", "officina-manuali")
+    NAMESPACE_BY_BRAND: bool = os.getenv("NAMESPACE_BY_BRAND", "false").lower() == "true"
+    
+    # ===== CLIENTS =====
+    # Client condivisi dal processo (src/clients.py): connessioni in pool e timeout
+    PINECONE_USE_GRPC: bool = os.getenv("PINECONE_USE_GRPC", "false").lower() == "true"
+    PINECONE_POOL_THREADS: int = int(os.getenv("PINECONE_POOL_THREADS", "4"))
+    PINECONE_POOL_SIZE: int = int(os.getenv("PINECONE_POOL_SIZE", "16"))
+    PINECONE_TIMEOUT: float = float(os.getenv("PINECONE_TIMEOUT", "10"))  # secondi (gRPC)
+    EMBEDDING_TIMEOUT: float = float(os.getenv("EMBEDDING_TIMEOUT", "15"))
+    LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", "60"))
+    CLIENT_MAX_RETRIES: int = int(os.getenv("CLIENT_MAX_RETRIES", "2"))
+    
+    # ===== EMBEDDINGS =====
+    EMBEDDING_PROVIDER: str = os.getenv("EMBEDDING_PROVIDER", "openai")  # openai, local
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+    EMBEDDING_DIMENSION: int = int(os.getenv("EMBEDDING_DIMENSION", "1536"))
+    EMBEDDING_COST_PER_1K_TOKENS: float = float(os.getenv("EMBEDDING_COST_PER_1K_TOKENS", "0.0001"))
+    EMBEDDING_CACHE_SIZE: int = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+    EMBEDDING_CACHE_PATH: str = os.getenv("EMBEDDING_CACHE_PATH", "")  # es. ./data/embedding_cache.sqlite
+    LOCAL_EMBEDDING_MODEL: str = os.getenv(
+        "LOCAL_EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+    )
+    LOCAL_EMBEDDING_BACKEND: str = os.getenv("LOCAL_EMBEDDING_BACKEND", "torch")  # torch, onnx
+    LOCAL_EMBEDDING_QUANTIZE: bool = os.getenv("LOCAL_EMBEDDING_QUANTIZE", "true").lower() == "true"
+    LOCAL_EMBEDDING_ONNX_FILE: str = os.getenv("LOCAL_EMBEDDING_ONNX_FILE", "")
+    LOCAL_EMBEDDING_BATCH_SIZE: int = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "32"))
+    LOCAL_EMBEDDING_MAX_WAIT_MS: float = float(os.getenv("LOCAL_EMBEDDING_MAX_WAIT_MS", "0"))
+    
+    # ===== VECTOR COMPRESSION =====
+    VECTOR_COMPRESSION: str = os.getenv("VECTOR_COMPRESSION", "none")  # none, truncate, pca
+    VECTOR_COMPRESSION_DIM: int = int(os.getenv("VECTOR_COMPRESSION_DIM", "256"))
+    VECTOR_RESCORE: bool = os.getenv("VECTOR_RESCORE", "true").lower() == "true"
+    VECTOR_RESCORE_OVERSAMPLE: int = int(os.getenv("VECTOR_RESCORE_OVERSAMPLE", "4"))
+    VECTOR_PCA_SAMPLE: int = int(os.getenv("VECTOR_PCA_SAMPLE", "2000"))
+    VECTOR_COMPRESSION_DIR: Path = Path(os.getenv("VECTOR_COMPRESSION_DIR", str(DATA_DIR / "compression")))
+    
+    # ===== DOCSTORE =====
+    # Testo dei chunks in locale (SQLite compresso) invece che nei metadata dell'indice
+    DOCSTORE_ENABLED: bool = os.getenv("DOCSTORE_ENABLED", "false").lower() == "true"
+    DOCSTORE_PATH: Path = Path(os.getenv("DOCSTORE_PATH", str(DATA_DIR / "docstore.sqlite")))
+    INDEX_METADATA_FIELDS: list = os.getenv("INDEX_METADATA_FIELDS", "marca,modello,anno").split(",")
     
     # ===== RAG CONFIGURATION =====
     CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "1500"))
     CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "300"))
     RETRIEVAL_K: int = int(os.getenv("RETRIEVAL_K", "5"))
+    SEARCH_MANY_WORKERS: int = int(os.getenv("SEARCH_MANY_WORKERS", "8"))  # Query concorrenti in search_many
     SIMILARITY_THRESHOLD: float = float(os.getenv("SIMILARITY_THRESHOLD", "0.7"))
     
+    # ===== SMALL-TO-BIG RETRIEVAL =====
+    # Chunks piccoli nell'indice, espansi in fase di ricerca ai chunks vicini o alla pagina
+    SMALL_TO_BIG: bool = os.getenv("SMALL_TO_BIG", "false").lower() == "true"
+    SMALL_CHUNK_SIZE: int = int(os.getenv("SMALL_CHUNK_SIZE", "400"))
+    SMALL_CHUNK_OVERLAP: int = int(os.getenv("SMALL_CHUNK_OVERLAP", "0"))
+    EXPANSION_MODE: str = os.getenv("EXPANSION_MODE", "neighbors")  # neighbors, page
+    EXPANSION_WINDOW: int = int(os.getenv("EXPANSION_WINDOW", "2"))
+    CHUNK_ADJACENCY_PATH: Path = Path(os.getenv("CHUNK_ADJACENCY_PATH", str(DATA_DIR / "chunk_adjacency.json")))
+    
+    # ===== HIERARCHICAL RETRIEVAL =====
+    # Primo stadio su vettori riassuntivi (manuale/sezione), poi ricerca sui chunks dei manuali candidati
+    HIERARCHICAL_RETRIEVAL: bool = os.getenv("HIERARCHICAL_RETRIEVAL", "false").lower() == "true"
+    HIERARCHY_TOP_MANUALS: int = int(os.getenv("HIERARCHY_TOP_MANUALS", "3"))
+    HIERARCHY_SECTION_PAGES: int = int(os.getenv("HIERARCHY_SECTION_PAGES", "10"))
+    SUMMARY_INDEX_PATH: Path = Path(os.getenv("SUMMARY_INDEX_PATH", str(DATA_DIR / "summary_index.npz")))
+    
     # ===== HYBRID SEARCH =====
     ENABLE_HYBRID_SEARCH: bool = os.getenv("ENABLE_HYBRID_SEARCH", "false").lower() == "true"
     HYBRID_KEYWORD_WEIGHT: float = float(os.getenv("HYBRID_KEYWORD_WEIGHT", "0.3"))
@@ -57,6 +119,13 @@ class Settings(BaseSettings):
     ENABLE_OCR: bool = os.getenv("ENABLE_OCR", "true").lower() == "true"
     OCR_LANGUAGE: str = os.getenv("OCR_LANGUAGE", "ita")
     EXTRACT_TABLES: bool = os.getenv("EXTRACT_TABLES", "true").lower() == "true"
+    PDF_EXTRACTOR: str = os.getenv("PDF_EXTRACTOR", "pypdf")  # pypdf, pymupdf, pdfium
+    PDF_EXTRACTOR_FALLBACK: list = os.getenv("PDF_EXTRACTOR_FALLBACK", "pypdf").split(",")
+    INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", "1"))
+    PDF_SHARD_PAGES: int = int(os.getenv("PDF_SHARD_PAGES", "200"))
+    # Testo estratto dai PDF riusato finché il file non cambia (dry run e indicizzazioni successive)
+    PARSE_CACHE_ENABLED: bool = os.getenv("PARSE_CACHE_ENABLED", "true").lower() == "true"
+    PARSE_CACHE_DIR: Path = Path(os.getenv("PARSE_CACHE_DIR", str(DATA_DIR / "parse_cache")))
     
     # ===== APPLICATION =====
     DEBUG: bool = os.getenv("DEBUG", "false").lower() == "true"
@@ -65,6 +134,49 @@ class Settings(BaseSettings):
     API_PORT: int = int(os.getenv("API_PORT", "8000"))
     STREAMLIT_PORT: int = int(os.getenv("STREAMLIT_PORT", "8501"))
     
+    # ===== WARM-UP =====
+    WARMUP_PROBE_QUESTION: str = os.getenv("WARMUP_PROBE_QUESTION", "Come si controlla il livello dell'olio motore?")
+    WARMUP_PROBE_LLM: bool = os.getenv("WARMUP_PROBE_LLM", "true").lower() == "true"
+    WARMUP_PROBE_PROMPT: str = os.getenv("WARMUP_PROBE_PROMPT", "Rispondi solo: OK")
+    WARMUP_RETRY_SECONDS: int = int(os.getenv("WARMUP_RETRY_SECONDS", "15"))
+    
+    # ===== ADMISSION CONTROL =====
+    # Domande in elaborazione per worker API (chiamate all'LLM); oltre, coda limitata e poi 503
+    MAX_CONCURRENT_QUERIES: int = int(os.getenv("MAX_CONCURRENT_QUERIES", "8"))
+    MAX_QUEUED_QUERIES: int = int(os.getenv("MAX_QUEUED_QUERIES", "16"))
+    QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("QUEUE_TIMEOUT_SECONDS", "10"))
+    # Richieste al minuto per API key (o IP senza API key), 0 = nessun limite; 429 oltre il limite
+    RATE_LIMIT_PER_MINUTE: float = float(os.getenv("RATE_LIMIT_PER_MINUTE", "60"))
+    RATE_LIMIT_BURST: int = int(os.getenv("RATE_LIMIT_BURST", "10"))
+    # /query/batch: domande per richiesta e chiamate all'LLM concorrenti per batch
+    BATCH_MAX_QUERIES: int = int(os.getenv("BATCH_MAX_QUERIES", "50"))
+    BATCH_LLM_CONCURRENCY: int = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+    
+    # ===== LATENCY BUDGET =====
+    # Budget per domanda (0 = nessuno): oltre, risposta parziale con i passaggi dei manuali recuperati
+    QUERY_TIMEOUT_SECONDS: float = float(os.getenv("QUERY_TIMEOUT_SECONDS", "45"))
+    QUERY_RETRIEVAL_TIMEOUT_SECONDS: float = float(os.getenv("QUERY_RETRIEVAL_TIMEOUT_SECONDS", "10"))
+    
+    # ===== QUERY LOG =====
+    # Scritto in background a batch (src/query_log.py), ruotato per dimensione e giorno
+    QUERY_LOG_PATH: Path = Path(os.getenv("QUERY_LOG_PATH", str(BASE_DIR / "logs" / "queries" / "query_log.jsonl")))
+    QUERY_LOG_MAX_BYTES: int = int(os.getenv("QUERY_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+    QUERY_LOG_BACKUPS: int = int(os.getenv("QUERY_LOG_BACKUPS", "30"))
+    QUERY_LOG_COMPRESS: bool = os.getenv("QUERY_LOG_COMPRESS", "true").lower() == "true"
+    QUERY_LOG_BATCH_SIZE: int = int(os.getenv("QUERY_LOG_BATCH_SIZE", "200"))
+    QUERY_LOG_FLUSH_SECONDS: float = float(os.getenv("QUERY_LOG_FLUSH_SECONDS", "1.0"))
+    QUERY_LOG_QUEUE_SIZE: int = int(os.getenv("QUERY_LOG_QUEUE_SIZE", "10000"))
+    
+    # ===== TRACING =====
+    # Span per richiesta (src/tracing.py): scritti in background, riassunti da scripts/trace_report.py
+    TRACE_ENABLED: bool = os.getenv("TRACE_ENABLED", "true").lower() == "true"
+    TRACE_PATH: Path = Path(os.getenv("TRACE_PATH", str(BASE_DIR / "logs" / "traces" / "traces.jsonl")))
+    TRACE_SAMPLE_RATE: float = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+    TRACE_SLOW_MS: float = float(os.getenv("TRACE_SLOW_MS", "5000"))  # sempre salvate
+    PROFILE_QUERIES: bool = os.getenv("PROFILE_QUERIES", "false").lower() == "true"
+    PROFILE_INTERVAL_MS: float = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+    PROFILE_DIR: Path = Path(os.getenv("PROFILE_DIR", str(BASE_DIR / "logs" / "profiles")))
+    
     # ===== ADVANCED FEATURES =====
     ENABLE_VISION: bool = os.getenv("ENABLE_VISION", "false").lower() == "true"
     VISION_MODEL: str = os.getenv("VISION_MODEL", "claude-sonnet-4-5-20250929")
@@ -72,6 +184,9 @@ class Settings(BaseSettings):
     MEMORY_TYPE: str = os.getenv("MEMORY_TYPE", "buffer")
     ENABLE_CACHE: bool = os.getenv("ENABLE_CACHE", "true").lower() == "true"
     CACHE_TTL: int = int(os.getenv("CACHE_TTL", "3600"))
+    RESULT_CACHE_SIZE: int = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+    ENABLE_QUERY_COALESCING: bool = os.getenv("ENABLE_QUERY_COALESCING", "true").lower() == "true"
+    ENABLE_METRICS: bool = os.getenv("ENABLE_METRICS", "true").lower() == "true"  # /metrics (Prometheus)
     
     # ===== SECURITY =====
     API_SECRET_KEY: str = os.getenv("API_SECRET_KEY", "")
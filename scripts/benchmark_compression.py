@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark della compressione dei vettori (recall@k rispetto a dimensione indice)
+"""
+import sys
+import json
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+
+from src.compression import evaluate_compression
+from src.embeddings import embedding_model_name, get_embeddings
+from src.utils import configure_logging, print_colored
+from config import settings
+
+
+def load_chunks(input_path: Path = None, limit: int = None) -> list:
+    """Testi dei chunks da un export JSONL (--export di index_manuals) o dai manuali"""
+    if input_path:
+        with open(input_path, encoding="utf-8") as f:
+            texts = [json.loads(line)["text"] for line in f if line.strip()]
+    else:
+        from src import ManualProcessor
+        
+        chunks = ManualProcessor().process_and_split()
+        texts = [chunks.text(i) for i in range(len(chunks))]
+    
+    texts = [text for text in texts if text.strip()]
+    if limit and len(texts) > limit:
+        texts = random.Random(0).sample(texts, limit)
+    return texts
+
+
+def embed(texts: list, batch_size: int = 100) -> np.ndarray:
+    """Embedding dei testi con il provider configurato"""
+    embeddings = get_embeddings()
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embeddings.embed_documents(texts[start:start + batch_size]))
+        print(f"   {min(start + batch_size, len(texts))}/{len(texts)}", end="\r")
+    print()
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def print_table(rows: list, k: int):
+    """Stampa i risultati come tabella"""
+    print(f"\n{'Metodo':<10} {'Dim':>6} {'Re-score':>9} {f'Recall@{k}':>10} {'Indice B/vett':>14} "
+          f"{'Locale B/vett':>14} {'Riduzione':>10}")
+    print("-" * 80)
+    for row in rows:
+        print(
+            f"{row['method']:<10} {row['dim']:>6} {'sì' if row['rescore'] else 'no':>9} "
+            f"{row['recall']:>10.3f} {row['index_bytes_per_vector']:>14} "
+            f"{row['local_bytes_per_vector']:>14} {row['compression_ratio']:>9.1f}x"
+        )
+    print("\nint8: solo riferimento (Pinecone salva vettori float32; il re-scoring usa i float32 completi)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compressione vettori")
+    parser.add_argument("--input", type=Path, help="Export JSONL dei chunks (index_manuals.py --dry-run --export)")
+    parser.add_argument("--limit", type=int, default=5000, help="Numero massimo di chunks nel corpus")
+    parser.add_argument("--queries", type=int, default=100, help="Chunks usati come query (esclusi dal corpus)")
+    parser.add_argument("--k", type=int, default=settings.RETRIEVAL_K, help="Risultati per query")
+    parser.add_argument("--dims", default="768,512,256,128", help="Dimensioni ridotte da provare")
+    parser.add_argument("--oversample", type=int, default=settings.VECTOR_RESCORE_OVERSAMPLE,
+                        help="Candidati per il re-scoring (k × oversample)")
+    parser.add_argument("--json", type=Path, help="Salva i risultati in JSON")
+    args = parser.parse_args()
+    configure_logging()
+    
+    print_colored("\n📐 BENCHMARK COMPRESSIONE VETTORI", "cyan")
+    print(f"Modello di embedding: {embedding_model_name()}")
+    
+    texts = load_chunks(args.input, args.limit + args.queries)
+    if len(texts) <= args.queries:
+        print_colored("❌ Chunks insufficienti per il benchmark", "red")
+        sys.exit(1)
+    
+    print(f"\n🧠 Embedding di {len(texts)} chunks...")
+    vectors = embed(texts)
+    queries, corpus = vectors[:args.queries], vectors[args.queries:]
+    
+    dims = [int(dim) for dim in args.dims.split(",")]
+    rows = evaluate_compression(corpus, queries, k=args.k, dims=dims, oversample=args.oversample)
+    
+    print(f"\nCorpus: {len(corpus)} vettori, query: {len(queries)}, dimensione: {corpus.shape[1]}")
+    print_table(rows, args.k)
+    
+    if args.json:
+        args.json.write_text(json.dumps({
+            "embedding_model": embedding_model_name(),
+            "corpus": len(corpus),
+            "queries": len(queries),
+            "k": args.k,
+            "oversample": args.oversample,
+            "results": rows,
+        }, indent=2), encoding="utf-8")
+        print_colored(f"\n✅ Risultati salvati in {args.json}", "green")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Benchmark dei motori di estrazione testo PDF (pagine/sec e parità del testo)
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.document_processor import PDF_EXTRACTORS, get_pdf_extractor
+from src.utils import configure_logging, print_colored
+from config import settings
+
+
+def _tokens(text: str) -> set:
+    """Insieme di token normalizzati per il confronto del testo"""
+    return set(text.lower().split())
+
+
+def text_parity(reference: list, candidate: list) -> float:
+    """
+    Similarità media pagina per pagina (Jaccard sui token) rispetto al riferimento
+    
+    Pagine mancanti o in più contano come similarità 0.
+    """
+    ref_pages = dict(reference)
+    cand_pages = dict(candidate)
+    all_pages = set(ref_pages) | set(cand_pages)
+    
+    if not all_pages:
+        return 1.0
+    
+    total = 0.0
+    for page in all_pages:
+        a = _tokens(ref_pages.get(page, ""))
+        b = _tokens(cand_pages.get(page, ""))
+        if not a and not b:
+            total += 1.0
+        else:
+            total += len(a & b) / len(a | b)
+    
+    return total / len(all_pages)
+
+
+def benchmark(pdf_files: list, engines: list, reference: str) -> dict:
+    """Esegue il benchmark e ritorna i risultati per motore"""
+    results = {name: {"files": 0, "pages": 0, "chars": 0, "seconds": 0.0, "errors": 0, "parity": []}
+               for name in engines}
+    
+    for pdf_path in pdf_files:
+        print(f"\n📄 {pdf_path.name}")
+        extracted = {}
+        
+        for name in engines:
+            extractor = get_pdf_extractor(name)
+            try:
+                start = time.perf_counter()
+                pages = extractor.extract_pages(pdf_path)
+                elapsed = time.perf_counter() - start
+            except ImportError:
+                print_colored(f"   ⚠️  {name}: non installato (pip install {extractor.package})", "yellow")
+                results[name]["errors"] += 1
+                continue
+            except Exception as e:
+                print_colored(f"   ❌ {name}: {e}", "red")
+                results[name]["errors"] += 1
+                continue
+            
+            extracted[name] = pages
+            stats = results[name]
+            stats["files"] += 1
+            stats["pages"] += len(pages)
+            stats["chars"] += sum(len(text) for _, text in pages)
+            stats["seconds"] += elapsed
+            
+            print(f"   {name:<8} {len(pages):>5} pagine in {elapsed:7.2f}s "
+                  f"({len(pages) / elapsed if elapsed else 0:8.1f} pag/s)")
+        
+        reference_pages = extracted.get(reference)
+        if reference_pages is None:
+            continue
+        
+        for name, pages in extracted.items():
+            results[name]["parity"].append(text_parity(reference_pages, pages))
+    
+    for stats in results.values():
+        parity = stats.pop("parity")
+        stats["pages_per_sec"] = stats["pages"] / stats["seconds"] if stats["seconds"] else 0.0
+        stats["text_parity"] = sum(parity) / len(parity) if parity else None
+    
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark motori di estrazione testo PDF"
+    )
+    parser.add_argument(
+        "--dir",
+        type=Path,
+        default=settings.MANUALS_PATH,
+        help="Cartella con i PDF di esempio"
+    )
+    parser.add_argument(
+        "--engines",
+        type=str,
+        default=",".join(PDF_EXTRACTORS),
+        help="Motori da confrontare (separati da virgola)"
+    )
+    parser.add_argument(
+        "--reference",
+        type=str,
+        default="pypdf",
+        help="Motore di riferimento per la parità del testo"
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="Numero massimo di PDF da elaborare"
+    )
+    parser.add_argument(
+        "--json",
+        type=Path,
+        default=None,
+        help="Salva i risultati in un file JSON"
+    )
+    
+    args = parser.parse_args()
+    configure_logging()
+    
+    engines = [name.strip() for name in args.engines.split(",") if name.strip()]
+    for name in engines + [args.reference]:
+        get_pdf_extractor(name)
+    
+    pdf_files = sorted(args.dir.glob("**/*.pdf"))[:args.limit]
+    if not pdf_files:
+        print_colored(f"⚠️  Nessun PDF trovato in: {args.dir}", "yellow")
+        return
+    
+    print("\n" + "="*80)
+    print(f"⏱️  BENCHMARK ESTRAZIONE PDF - {len(pdf_files)} file")
+    print("="*80)
+    
+    results = benchmark(pdf_files, engines, args.reference)
+    
+    print("\n" + "="*80)
+    print(f"{'Motore':<10} {'File':>5} {'Pagine':>8} {'Tempo (s)':>10} {'Pag/s':>9} {'Parità':>8}")
+    print("-"*80)
+    for name, stats in results.items():
+        parity = f"{stats['text_parity']:.3f}" if stats["text_parity"] is not None else "N/A"
+        print(f"{name:<10} {stats['files']:>5} {stats['pages']:>8} {stats['seconds']:>10.2f} "
+              f"{stats['pages_per_sec']:>9.1f} {parity:>8}")
+    print("="*80 + "\n")
+    
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print_colored(f"✅ Risultati salvati in {args.json}", "green")
+
+
+if __name__ == "__main__":
+    main()
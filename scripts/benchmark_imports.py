@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark del tempo di import dei moduli (con budget, utilizzabile in CI)
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.utils import print_colored
+
+
+# Moduli usati da CLI, API e test
+DEFAULT_MODULES = ["config", "src", "src.catalog", "src.document_processor", "src.vectorstore", "src.qa_chain"]
+
+# Dipendenze che devono essere caricate solo al primo utilizzo
+HEAVY_MODULES = [
+    "langchain.chains",
+    "langchain_pinecone",
+    "pinecone",
+    "openai",
+    "anthropic",
+    "langchain_openai",
+    "langchain_anthropic",
+    "langchain_text_splitters",
+    "streamlit",
+    "sentence_transformers",
+    "torch",
+]
+
+
+def measure(module: str) -> dict:
+    """
+    Import di un modulo in un processo nuovo
+    
+    Returns:
+        {"module", "ms", "heavy", "slowest"}: tempo di import, dipendenze
+        pesanti caricate e import diretti più lenti (da -X importtime)
+    """
+    code = (
+        "import json, sys, time; sys.stderr.write('--- import\\n'); start = time.perf_counter(); "
+        f"import {module}; "
+        "elapsed = time.perf_counter() - start; "
+        f"print(json.dumps([elapsed * 1000, [name for name in {HEAVY_MODULES!r} if name in sys.modules]]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, env=os.environ.copy()
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Import di {module} fallito:\n{result.stderr[-2000:]}")
+    
+    elapsed_ms, heavy = json.loads(result.stdout.strip().splitlines()[-1])
+    
+    # Righe "import time: self | cumulative | nome", nome indentato di 2 spazi per livello
+    lines = result.stderr.splitlines()
+    direct = []
+    for line in lines[lines.index("--- import") + 1:]:
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if len(name) - len(name.lstrip()) == 3:
+            direct.append((int(cumulative), name.strip()))
+    
+    return {
+        "module": module,
+        "ms": round(elapsed_ms, 1),
+        "heavy": heavy,
+        "slowest": [{"module": name, "ms": round(us / 1000, 1)} for us, name in sorted(direct, reverse=True)[:5]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del tempo di import")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="Moduli da importare")
+    parser.add_argument("--repeat", type=int, default=3, help="Ripetizioni per modulo (si tiene il minimo)")
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="Tempo massimo per modulo: se superato esce con codice 1")
+    parser.add_argument("--allow-heavy", action="store_true",
+                        help="Non fallire se un import carica dipendenze pesanti")
+    parser.add_argument("--json", action="store_true", help="Output JSON")
+    args = parser.parse_args()
+    
+    results = []
+    for module in args.modules:
+        runs = [measure(module) for _ in range(max(1, args.repeat))]
+        results.append(min(runs, key=lambda run: run["ms"]))
+    
+    over_budget = [r for r in results if args.budget_ms is not None and r["ms"] > args.budget_ms]
+    with_heavy = [r for r in results if r["heavy"] and not args.allow_heavy]
+    
+    if args.json:
+        print(json.dumps({"budget_ms": args.budget_ms, "results": results}, indent=2, ensure_ascii=False))
+    else:
+        print_colored("\n⏱️  TEMPO DI IMPORT", "blue")
+        print("=" * 70)
+        for r in results:
+            color = "red" if r in over_budget or r in with_heavy else "green"
+            print_colored(f"{r['module']:<28} {r['ms']:>8.1f} ms", color)
+            for dep in r["slowest"]:
+                print(f"    {dep['module']:<40} {dep['ms']:>8.1f} ms")
+            if r["heavy"]:
+                print_colored(f"    ⚠️  dipendenze pesanti caricate: {', '.join(r['heavy'])}", "yellow")
+        print("=" * 70)
+        if args.budget_ms is not None:
+            print(f"Budget: {args.budget_ms:.0f} ms per modulo")
+    
+    if over_budget or with_heavy:
+        for r in over_budget if not args.json else []:
+            print_colored(f"❌ {r['module']}: {r['ms']:.1f} ms oltre il budget di {args.budget_ms:.0f} ms", "red")
+        for r in with_heavy if not args.json else []:
+            print_colored(f"❌ {r['module']}: importa {', '.join(r['heavy'])}", "red")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,9 +8,9 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from src import VectorStoreManager
-from src.utils import print_colored
-from config import validate_settings
+from src import get_vectorstore_manager
+from src.utils import configure_logging, print_colored
+from config import validate_settings, settings
 
 
 def main():
@@ -39,10 +39,11 @@ def main():
     )
     
     args = parser.parse_args()
+    configure_logging()
     
     try:
         validate_settings()
-        manager = VectorStoreManager()
+        manager = get_vectorstore_manager()
         
         # Mostra statistiche
         if args.stats or not any([args.delete_all, args.delete_brand]):
@@ -51,7 +52,10 @@ def main():
             print("=" * 50)
             print(f"Vettori totali: {stats.get('total_vector_count', 0)}")
             print(f"Dimensione: {stats.get('dimension', 'N/A')}")
-            print(f"Namespaces: {stats.get('namespaces', {})}")
+            print(f"Partizione per marca: {'Attiva' if settings.NAMESPACE_BY_BRAND else 'Disattiva'}")
+            print("Namespaces:")
+            for namespace, info in (stats.get('namespaces') or {}).items():
+                print(f"  - {namespace or '(default)'}: {info.get('vector_count', 0)} vettori")
             print()
         
         # Elimina tutti
@@ -76,7 +80,10 @@ def main():
                     print("Operazione annullata")
                     return
             
-            print(f"🗑️  Eliminazione vettori {args.delete_brand}...")
+            if settings.NAMESPACE_BY_BRAND:
+                print(f"🗑️  Eliminazione namespace {args.delete_brand.upper()}...")
+            else:
+                print(f"🗑️  Eliminazione vettori {args.delete_brand}...")
             manager.delete_by_filter(
                 {"marca": args.delete_brand.upper()},
                 confirm=True
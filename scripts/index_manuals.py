@@ -9,11 +9,68 @@ from pathlib import Path
 # Aggiungi la root al path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from src import ManualProcessor, VectorStoreManager
-from src.utils import print_colored, check_system_requirements
+from src import ManualProcessor, get_vectorstore_manager
+from src.adjacency import ChunkAdjacency
+from src.instrumentation import IngestionReport, estimate_indexing, load_latest_report
+from src.utils import configure_logging, print_colored, check_system_requirements, format_file_size
 from config import validate_settings, settings
 
 
+def print_report_summary(report: IngestionReport):
+    """Stampa tempi per fase e contatori dell'esecuzione"""
+    data = report.to_dict()
+    
+    print(f"\n⏱️  Tempi per fase (totale {data['duration_seconds']:.1f}s):")
+    for name, stage in data["stages"].items():
+        if stage["calls"]:
+            print(f"   {name:<10} {stage['seconds']:>9.2f}s  ({stage['calls']} esecuzioni)")
+    
+    print(f"\n🔢 Contatori:")
+    for name, value in data["counters"].items():
+        print(f"   {name:<17} {value}")
+
+
+def run_dry_run(chunks, report: IngestionReport, export_path: Path = None):
+    """Stima costi e tempi dell'indicizzazione senza chiamate di rete"""
+    estimate = estimate_indexing(chunks, report, load_latest_report())
+    report.extra["estimate"] = estimate
+    
+    print("\n" + "="*80)
+    print_colored("🧪 DRY RUN - STIMA INDICIZZAZIONE", "cyan")
+    print("="*80)
+    print(f"\n   Modello embedding: {estimate['embedding_model']}")
+    print(f"   Token da embeddare: {estimate['embedding_tokens']:,} "
+          f"(media {estimate['avg_tokens_per_chunk']} per chunk)")
+    print(f"   Vettori: {estimate['vectors']:,} (dimensione {estimate['index_dimension']})")
+    print(f"   Dimensione indice: {format_file_size(estimate['index_total_bytes'])} "
+          f"(vettori {format_file_size(estimate['index_vector_bytes'])}, "
+          f"metadata {format_file_size(estimate['index_metadata_bytes'])})")
+    print(f"   Costo API stimato: ${estimate['api_cost_usd']:.4f}")
+    print(f"\n   Parsing + split (misurato): {estimate['parse_seconds']:.1f}s")
+    
+    if estimate["total_seconds"] is not None:
+        print(f"   Embedding (stimato): {estimate['embed_seconds']:.1f}s")
+        print(f"   Upsert (stimato): {estimate['upsert_seconds']:.1f}s")
+        print(f"   Tempo totale stimato: {estimate['total_seconds'] / 60:.1f} minuti")
+        print(f"   (throughput da {estimate['throughput_reference']})")
+    else:
+        print_colored("   Tempo embed/upsert: N/A (nessun report di indicizzazione precedente)", "yellow")
+    
+    if export_path:
+        suffix = export_path.suffix.lower()
+        if suffix == ".parquet":
+            exported = chunks.to_parquet(export_path)
+        elif suffix == ".jsonl":
+            exported = chunks.to_jsonl(export_path)
+        else:
+            raise ValueError(f"Formato export non supportato: {suffix} (usa .jsonl o .parquet)")
+        
+        if exported:
+            print_colored(f"\n✅ Esportati {exported} chunks in {export_path}", "green")
+    
+    report.finish("dry_run")
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Indicizza manuali PDF nel vector database"
@@ -28,6 +85,34 @@ def main():
         action="store_true",
         help="Elimina indice esistente prima di indicizzare"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processi paralleli per l'elaborazione PDF (default: INGEST_WORKERS)"
+    )
+    parser.add_argument(
+        "--report",
+        type=Path,
+        default=None,
+        help="Percorso del report JSON (default: logs/ingestion/run_<timestamp>.json)"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Solo parsing e split: stima token, vettori, costo e tempo senza chiamate di rete"
+    )
+    parser.add_argument(
+        "--reparse",
+        action="store_true",
+        help="Rielabora tutti i PDF senza usare il testo estratto in cache"
+    )
+    parser.add_argument(
+        "--export",
+        type=Path,
+        default=None,
+        help="Con --dry-run, esporta i chunks in un file .jsonl o .parquet"
+    )
     parser.add_argument(
         "--check",
         action="store_true",
@@ -35,6 +120,7 @@ def main():
     )
     
     args = parser.parse_args()
+    configure_logging()
     
     print("\n" + "="*80)
     print("🔧 OFFICINA AI - INDICIZZAZIONE MANUALI")
@@ -45,15 +131,18 @@ def main():
         check_system_requirements()
         return
     
+    report = IngestionReport()
+    
     try:
-        # Valida configurazione
-        print("⚙️  Validazione configurazione...")
-        validate_settings()
-        print_colored("✅ Configurazione valida\n", "green")
+        # Valida configurazione (le chiavi API non servono in dry run)
+        if not args.dry_run:
+            print("⚙️  Validazione configurazione...")
+            validate_settings()
+            print_colored("✅ Configurazione valida\n", "green")
         
         # Inizializza processor
         print("📚 Inizializzazione processor documenti...")
-        processor = ManualProcessor()
+        processor = ManualProcessor(workers=args.workers, report=report, parse_cache=False if args.reparse else None)
         
         # Mostra statistiche manuali
         stats = processor.get_manual_stats()
@@ -74,6 +163,7 @@ def main():
         # Processa documenti
         print(f"\n🚀 Inizio elaborazione...")
         print(f"   OCR: {'Abilitato' if args.ocr else 'Disabilitato'}")
+        print(f"   Worker: {processor.workers} (parti da {processor.shard_pages} pagine)")
         
         chunks = processor.process_and_split(use_ocr=args.ocr)
         
@@ -83,16 +173,25 @@ def main():
         
         print_colored(f"\n✅ Generati {len(chunks)} chunks", "green")
         
+        if args.dry_run:
+            run_dry_run(chunks, report, args.export)
+            print_report_summary(report)
+            print(f"\n📄 Report JSON: {report.save(args.report)}")
+            print("\n" + "="*80 + "\n")
+            return
+        
         # Inizializza vector store
         print(f"\n🗄️  Connessione a Pinecone...")
-        vectorstore_manager = VectorStoreManager()
+        vectorstore_manager = get_vectorstore_manager()
         
         # Elimina indice se richiesto
+        cleared = False
         if args.clear:
             print_colored("\n⚠️  Eliminazione indice esistente...", "yellow")
             response = input("Sei sicuro? (si/no): ")
             if response.lower() in ['si', 's', 'yes', 'y']:
                 vectorstore_manager.delete_all(confirm=True)
+                cleared = True
                 print_colored("✅ Indice eliminato\n", "green")
             else:
                 print("Eliminazione annullata\n")
@@ -101,7 +200,15 @@ def main():
         print(f"📝 Indicizzazione in Pinecone...")
         print(f"   Questo può richiedere alcuni minuti...\n")
         
-        vectorstore_manager.index_documents(chunks)
+        vectorstore_manager.index_documents(chunks, report=report)
+        
+        # Small-to-big: posizioni dei chunks per l'espansione in fase di ricerca
+        if settings.SMALL_TO_BIG:
+            adjacency = ChunkAdjacency() if cleared else ChunkAdjacency.load()
+            processor.build_chunk_adjacency(chunks, adjacency).save()
+            print(f"🧭 Indice di adiacenza salvato: {settings.CHUNK_ADJACENCY_PATH}")
+        
+        report.finish()
         
         # Mostra statistiche finali
         final_stats = vectorstore_manager.get_index_stats()
@@ -114,6 +221,9 @@ def main():
         print(f"   Vettori totali: {final_stats.get('total_vector_count', 0)}")
         print(f"   Dimensione: {final_stats.get('dimension', 'N/A')}")
         
+        print_report_summary(report)
+        print(f"\n📄 Report JSON: {report.save(args.report)}")
+        
         print(f"\n💡 Prossimi passi:")
         print(f"   1. Avvia l'app: streamlit run app.py")
         print(f"   2. Oppure testa: python scripts/test_queries.py")
@@ -123,9 +233,14 @@ def main():
         
     except KeyboardInterrupt:
         print_colored("\n\n❌ Indicizzazione interrotta dall'utente", "yellow")
+        report.finish("interrupted")
+        print(f"📄 Report JSON: {report.save(args.report)}")
         sys.exit(1)
     except Exception as e:
         print_colored(f"\n❌ Errore durante l'indicizzazione: {e}", "red")
+        report.finish("failed")
+        report.record_failure("run", "index_manuals", e)
+        print(f"📄 Report JSON: {report.save(args.report)}")
         
         if settings.DEBUG:
             import traceback
@@ -11,7 +11,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from src import OfficinaChatbot
 from src.qa_chain import format_answer_with_sources
-from src.utils import print_colored
+from src.utils import configure_logging, print_colored
 from config import validate_settings
 
 
@@ -187,6 +187,7 @@ def main():
     )
     
     args = parser.parse_args()
+    configure_logging()
     
     if args.interactive:
         interactive_mode()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Riepilogo delle tracce delle richieste: le più lente e dove va il tempo
+"""
+import sys
+import gzip
+import json
+import argparse
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.utils import print_colored
+from config import settings
+
+
+def read_traces(path: Path, include_rotated: bool = False) -> Iterator[Dict]:
+    """Tracce dal file JSONL corrente (e dai file ruotati, anche compressi)"""
+    files = []
+    if include_rotated:
+        files.extend(sorted(path.parent.glob(f"{path.stem}-*{path.suffix}*")))
+    if path.exists():
+        files.append(path)
+    
+    for file in files:
+        opener = gzip.open if file.suffix == ".gz" else open
+        with opener(file, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def self_times(trace: Dict) -> Dict[str, float]:
+    """Tempo proprio per nome di span (durata meno quella dei figli diretti)"""
+    children = defaultdict(float)
+    for span in trace.get("spans", []):
+        if span.get("parent") is not None:
+            children[span["parent"]] += span.get("duration_ms", 0.0)
+    
+    totals = defaultdict(float)
+    for span in trace.get("spans", []):
+        own = span.get("duration_ms", 0.0) - children.get(span["id"], 0.0)
+        totals[span["name"]] += max(0.0, own)
+    return dict(totals)
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(q * (len(values) - 1))))
+    return values[index]
+
+
+def print_trace(trace: Dict):
+    """Albero degli span di una traccia"""
+    attrs = trace.get("attrs") or {}
+    print_colored(f"\n🔎 Trace {trace['trace_id']} - {trace.get('name')} - {trace['duration_ms']:.0f} ms", "cyan")
+    print(f"   {trace.get('timestamp')}")
+    question = attrs.get("question") or next(
+        (span.get("attrs", {}).get("question") for span in trace.get("spans", []) if span.get("attrs")), None
+    )
+    if question:
+        print(f"   Domanda: {question}")
+    if trace.get("profile"):
+        print(f"   Profilo: {trace['profile']}")
+    
+    depth = {}
+    for span in trace.get("spans", []):
+        level = 0 if span.get("parent") is None else depth.get(span["parent"], 0) + 1
+        depth[span["id"]] = level
+        line = f"   {'  ' * level}{span['name']:<{40 - 2 * level}} {span.get('start_ms', 0):>8.1f} +{span.get('duration_ms', 0):>8.1f} ms"
+        if span.get("error"):
+            print_colored(f"{line}  ❌ {span['error']}", "red")
+        else:
+            print(line)
+
+
+def print_profile(path: Path, top: int = 15):
+    """Funzioni con più campioni in un profilo collapsed (tempo proprio)"""
+    if not path.exists():
+        print_colored(f"⚠️  Profilo non trovato: {path}", "yellow")
+        return
+    
+    own = defaultdict(int)
+    total = 0
+    for line in path.read_text(encoding="utf-8").splitlines():
+        stack, _, count = line.rpartition(" ")
+        if not stack:
+            continue
+        own[stack.split(";")[-1]] += int(count)
+        total += int(count)
+    
+    print_colored(f"\n🔬 Profilo {path.name} ({total} campioni)", "cyan")
+    for frame, count in sorted(own.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"   {count / total * 100:5.1f}%  {frame}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Riepilogo delle tracce delle richieste (più lente e tempo per fase)"
+    )
+    parser.add_argument(
+        "--path",
+        type=Path,
+        default=settings.TRACE_PATH,
+        help="File JSONL delle tracce"
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=10,
+        help="Numero di tracce più lente da mostrare"
+    )
+    parser.add_argument(
+        "--since",
+        type=float,
+        default=None,
+        help="Solo le tracce delle ultime N ore"
+    )
+    parser.add_argument(
+        "--trace-id",
+        type=str,
+        help="Mostra una sola traccia (e il suo profilo, se presente)"
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Includi i file ruotati"
+    )
+    
+    args = parser.parse_args()
+    
+    since: Optional[datetime] = datetime.now() - timedelta(hours=args.since) if args.since else None
+    traces = []
+    for trace in read_traces(Path(args.path), include_rotated=args.all or bool(args.trace_id)):
+        if args.trace_id and trace.get("trace_id") != args.trace_id:
+            continue
+        if since and datetime.fromisoformat(trace["timestamp"]) < since:
+            continue
+        traces.append(trace)
+    
+    if not traces:
+        print_colored("⚠️  Nessuna traccia trovata", "yellow")
+        return 1
+    
+    if args.trace_id:
+        for trace in traces:
+            print_trace(trace)
+            if trace.get("profile"):
+                print_profile(Path(trace["profile"]))
+        return 0
+    
+    # Tempo proprio per fase su tutte le tracce: dove va il tempo in media e nella coda
+    per_stage = defaultdict(list)
+    for trace in traces:
+        for name, ms in self_times(trace).items():
+            per_stage[name].append(ms)
+    
+    durations = [trace["duration_ms"] for trace in traces]
+    print_colored(f"\n⏱️  TRACCE: {len(traces)}", "blue")
+    print("=" * 80)
+    print(f"Durata  p50 {percentile(durations, 0.5):>8.0f} ms   p95 {percentile(durations, 0.95):>8.0f} ms   "
+          f"max {max(durations):>8.0f} ms")
+    print(f"\n{'Fase (tempo proprio)':<40} {'tracce':>7} {'p50 ms':>9} {'p95 ms':>9} {'% totale':>9}")
+    grand_total = sum(sum(values) for values in per_stage.values()) or 1.0
+    for name, values in sorted(per_stage.items(), key=lambda item: sum(item[1]), reverse=True):
+        print(f"{name:<40} {len(values):>7} {percentile(values, 0.5):>9.1f} "
+              f"{percentile(values, 0.95):>9.1f} {sum(values) / grand_total * 100:>8.1f}%")
+    
+    print_colored(f"\n🐢 LE {min(args.top, len(traces))} PIÙ LENTE", "blue")
+    print("=" * 80)
+    for trace in sorted(traces, key=lambda item: item["duration_ms"], reverse=True)[:args.top]:
+        print_trace(trace)
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,31 @@
 """
 Officina AI Assistant - Source modules
+
+Le classi vengono importate al primo utilizzo: `import src` (o di un
+modulo leggero come src.catalog) non carica LangChain, Pinecone e i
+client LLM.
 """
+from importlib import import_module
 
-from .document_processor import ManualProcessor
-from .vectorstore import VectorStoreManager
-from .qa_chain import OfficinaChatbot, SimpleChatbot
-from .utils import (
-    setup_logging,
-    validate_pdf_file,
-    get_available_brands,
-    get_available_models,
-    check_system_requirements
-)
+_EXPORTS = {
+    "ManualProcessor": ".document_processor",
+    "ChunkStore": ".document_processor",
+    "VectorStoreManager": ".vectorstore",
+    "get_vectorstore_manager": ".vectorstore",
+    "OfficinaChatbot": ".qa_chain",
+    "SimpleChatbot": ".qa_chain",
+    "setup_logging": ".utils",
+    "validate_pdf_file": ".utils",
+    "get_available_brands": ".utils",
+    "get_available_models": ".utils",
+    "check_system_requirements": ".utils",
+}
 
 __all__ = [
     "ManualProcessor",
+    "ChunkStore",
     "VectorStoreManager",
+    "get_vectorstore_manager",
     "OfficinaChatbot",
     "SimpleChatbot",
     "setup_logging",
@@ -23,4 +33,17 @@ __all__ = [
     "get_available_brands",
     "get_available_models",
     "check_system_requirements"
-]
\ No newline at end of file
+]
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,159 @@
+"""
+Indice di adiacenza dei chunks per il retrieval small-to-big
+"""
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def manual_name(metadata: Dict) -> Optional[str]:
+    """
+    Manuale di un chunk: percorso relativo alla cartella dei manuali
+    
+    Manuali con lo stesso nome in cartelle diverse restano distinti; i
+    chunks indicizzati senza percorso usano il nome del file.
+    """
+    return metadata.get("manual") or metadata.get("filename")
+
+
+def manual_key(filename: str) -> str:
+    """Chiave compatta (ASCII) di un manuale, usata negli ID dei vettori"""
+    return hashlib.sha1(filename.encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_id(filename: str, chunk_index: int) -> str:
+    """ID deterministico del vettore di un chunk (manuale + posizione)"""
+    return f"{manual_key(filename)}-{chunk_index:06d}"
+
+
+def range_id(filename: str, first: int, last: int) -> str:
+    """ID del Document espanso che copre i chunks first..last"""
+    return f"{manual_key(filename)}-{first:06d}-{last:06d}"
+
+
+class ChunkAdjacency:
+    """
+    Posizione dei chunks nei manuali indicizzati
+    
+    Per ogni manuale conserva il numero di chunks e, per ogni pagina,
+    l'intervallo di chunks che la compongono. In fase di ricerca un
+    risultato (manuale, chunk_index) viene espanso ai chunks adiacenti
+    o all'intera pagina; gli ID dei vicini si ricavano con chunk_id().
+    I manuali sono identificati da manual_name().
+    """
+    
+    def __init__(self, manuals: Optional[Dict] = None, updated_at: Optional[str] = None):
+        # {manuale: {"count": n, "pages": {pagina: [primo, ultimo]}}}
+        self.manuals: Dict[str, Dict] = manuals or {}
+        self.updated_at = updated_at
+    
+    def __len__(self) -> int:
+        return len(self.manuals)
+    
+    def add_store(self, chunks) -> "ChunkAdjacency":
+        """Registra i chunks di un ChunkStore (sostituisce i manuali già presenti)"""
+        manuals: Dict[str, Dict] = {}
+        
+        for i in range(len(chunks)):
+            position = chunks.chunk_index(i)
+            filename = manual_name(chunks.manual_metadata(chunks.manual_id(i)))
+            if position is None or not filename:
+                continue
+            
+            entry = manuals.setdefault(filename, {"count": 0, "pages": {}})
+            entry["count"] = max(entry["count"], position + 1)
+            
+            page = chunks.page(i)
+            if page is not None:
+                span = entry["pages"].setdefault(str(page), [position, position])
+                span[0] = min(span[0], position)
+                span[1] = max(span[1], position)
+        
+        self.manuals.update(manuals)
+        return self
+    
+    def expansion(
+        self,
+        filename: str,
+        chunk_index: int,
+        page: Optional[int] = None,
+        mode: str = "neighbors",
+        window: int = 2
+    ) -> Optional[Tuple[int, int]]:
+        """
+        Intervallo di chunks (primo, ultimo) in cui espandere un risultato
+        
+        Args:
+            mode: "neighbors" (±window chunks) o "page" (tutta la pagina,
+                  ±window se la pagina non è nota)
+        
+        Returns:
+            None se il manuale non è nell'indice di adiacenza
+        """
+        entry = self.manuals.get(filename)
+        if entry is None:
+            return None
+        
+        if mode == "page" and page is not None:
+            span = entry["pages"].get(str(page))
+            if span is not None:
+                return span[0], span[1]
+        
+        return max(0, chunk_index - window), min(entry["count"] - 1, chunk_index + window)
+    
+    def to_dict(self) -> Dict:
+        return {"updated_at": self.updated_at, "manuals": self.manuals}
+    
+    def save(self, path: Optional[Path] = None):
+        """Salva l'indice di adiacenza su disco"""
+        path = Path(path or settings.CHUNK_ADJACENCY_PATH)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.updated_at = datetime.now().isoformat(timespec="seconds")
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.to_dict(), ensure_ascii=False), encoding="utf-8")
+        tmp_path.replace(path)
+    
+    @classmethod
+    def load(cls, path: Optional[Path] = None) -> "ChunkAdjacency":
+        """Carica l'indice di adiacenza da disco (vuoto se il file non esiste)"""
+        path = Path(path or settings.CHUNK_ADJACENCY_PATH)
+        if not path.exists():
+            return cls()
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            return cls(manuals=data.get("manuals", {}), updated_at=data.get("updated_at"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️  Indice di adiacenza non leggibile ({path}): {e}")
+            return cls()
+
+
+_adjacency: Optional[ChunkAdjacency] = None
+_adjacency_mtime: Optional[float] = None
+_adjacency_lock = threading.Lock()
+
+
+def get_adjacency() -> ChunkAdjacency:
+    """Indice di adiacenza condiviso dal processo (ricaricato se il file cambia)"""
+    global _adjacency, _adjacency_mtime
+    
+    path = Path(settings.CHUNK_ADJACENCY_PATH)
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        mtime = None
+    
+    if _adjacency is None or mtime != _adjacency_mtime:
+        with _adjacency_lock:
+            if _adjacency is None or mtime != _adjacency_mtime:
+                _adjacency = ChunkAdjacency.load(path)
+                _adjacency_mtime = mtime
+    
+    return _adjacency
@@ -0,0 +1,201 @@
+"""
+Controllo di ammissione delle richieste API: concorrenza limitata, coda e rate limit
+"""
+import math
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from src.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+REJECTED = REGISTRY.counter(
+    "officina_admission_rejected_total",
+    "Richieste rifiutate dal controllo di ammissione (rate_limit, queue_full, queue_timeout)",
+    ["reason"]
+)
+
+
+class Overloaded(Exception):
+    """Richiesta rifiutata: da ripetere dopo retry_after secondi"""
+    
+    def __init__(self, reason: str, retry_after: float, message: str):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+    
+    @property
+    def retry_after_header(self) -> str:
+        """Valore dell'header Retry-After (secondi interi, almeno 1)"""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    """
+    Token bucket: rate token al secondo, al massimo burst accumulati
+    
+    Ogni richiesta consuma un token (cost per una richiesta che ne vale
+    più di una, es. un batch di domande); senza token sufficienti take()
+    restituisce i secondi di attesa. Un costo oltre burst è ammesso a
+    bucket pieno e lo lascia in debito: le richieste successive attendono
+    che sia ripagato, il ritmo medio resta rate.
+    """
+    
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+    
+    def take(self, now: Optional[float] = None, cost: float = 1) -> float:
+        """Consuma cost token: 0 se disponibili, altrimenti i secondi di attesa"""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        needed = min(cost, self.burst)
+        if self.tokens >= needed:
+            self.tokens -= cost
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Rate limit per client (API key): un token bucket per chiave
+    
+    Le chiavi inattive vengono scartate oltre max_keys (LRU): un bucket
+    scartato riparte pieno, come un client nuovo.
+    """
+    
+    def __init__(self, per_minute: float, burst: int, max_keys: int = 10000):
+        self.rate = per_minute / 60
+        self.burst = max(1, burst)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def check(self, key: str, cost: float = 1):
+        """Consuma cost token della chiave, Overloaded (429) se non disponibili"""
+        if self.rate <= 0:
+            return
+        
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(key)
+            wait = bucket.take(cost=cost)
+        
+        if wait:
+            REJECTED.inc(reason="rate_limit")
+            raise Overloaded("rate_limit", wait, "Troppe richieste: limite per API key superato")
+
+
+class AdmissionController:
+    """
+    Limite di richieste in elaborazione con coda limitata
+    
+    Al massimo max_concurrent richieste alla volta (le chiamate all'LLM
+    non si accumulano sul provider); le altre attendono in coda fino a
+    queue_timeout secondi. A coda piena la richiesta viene rifiutata
+    subito: chi è ammesso ha una latenza prevedibile, chi non lo è riceve
+    Retry-After stimato dal tempo medio di servizio.
+    """
+    
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.held = 0
+        self.service_seconds: Optional[float] = None
+        self._holding: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+    
+    def retry_after(self) -> float:
+        """Attesa stimata per un posto libero (tempo medio di servizio × code per slot)"""
+        service = self.service_seconds or 1.0
+        return service * (self.waiting + 1) / self.max_concurrent
+    
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[List[Future]]:
+        """
+        Posto di elaborazione: attende in coda o solleva Overloaded (503)
+        
+        I Future aggiunti alla lista restituita (lavoro che prosegue dopo
+        la risposta, es. una chiamata all'LLM scaduta) trattengono il
+        posto fino al loro termine.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                REJECTED.inc(reason="queue_full")
+                raise Overloaded("queue_full", self.retry_after(), "Servizio sovraccarico: riprova più tardi")
+            
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                REJECTED.inc(reason="queue_timeout")
+                raise Overloaded("queue_timeout", self.retry_after(), "Servizio sovraccarico: attesa in coda scaduta")
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        
+        self.active += 1
+        self.admitted += 1
+        start = time.perf_counter()
+        held: List[Future] = []
+        try:
+            yield held
+        finally:
+            pending = [future for future in held if not future.done()]
+            if pending:
+                # Lavoro ancora in corso dopo la risposta: il posto resta occupato
+                self.held += 1
+                task = asyncio.get_running_loop().create_task(self._release_after(pending, start))
+                self._holding.add(task)
+                task.add_done_callback(self._holding.discard)
+            else:
+                self._release(start)
+    
+    async def _release_after(self, futures: List[Future], start: float):
+        """Libera il posto alla fine del lavoro in background"""
+        try:
+            await asyncio.gather(*(asyncio.wrap_future(future) for future in futures), return_exceptions=True)
+        finally:
+            self.held -= 1
+            self._release(start)
+    
+    def _release(self, start: float):
+        elapsed = time.perf_counter() - start
+        # Media mobile esponenziale del tempo di servizio (per Retry-After)
+        self.service_seconds = elapsed if self.service_seconds is None else 0.8 * self.service_seconds + 0.2 * elapsed
+        self.active -= 1
+        self._semaphore.release()
+    
+    def stats(self) -> Dict:
+        """Stato corrente"""
+        return {
+            "active": self.active,
+            "held": self.held,
+            "queued": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "avg_service_seconds": round(self.service_seconds, 3) if self.service_seconds is not None else None,
+        }
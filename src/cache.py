@@ -0,0 +1,351 @@
+"""
+Cache per le ricerche sul vector store (risultati ed embedding delle query)
+e coalescing delle domande identiche in corso
+"""
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Normalizza una query per l'uso come chiave di cache (spazi e maiuscole)"""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def document_key(doc: Document) -> str:
+    """ID del vettore di un Document (hash del contenuto se assente)"""
+    if getattr(doc, "id", None):
+        return doc.id
+    payload = json.dumps([doc.page_content, doc.metadata], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+_UNSET = object()
+
+
+def _copy_document(doc: Document) -> Document:
+    return Document(id=doc.id, page_content=doc.page_content, metadata=dict(doc.metadata))
+
+
+class ResultCache:
+    """
+    Cache LRU dei risultati di ricerca
+    
+    Chiave: (query normalizzata, filtro, k). Ogni voce contiene solo
+    coppie (id vettore, score); i Document sono condivisi tra le voci e
+    rimossi quando nessuna voce li referenzia più.
+    
+    Ogni scrittura sull'indice incrementa `version`: le voci vengono
+    scartate e i risultati di ricerche iniziate prima della scrittura
+    non vengono salvati.
+    """
+    
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, List[Tuple[str, float]]]]" = OrderedDict()
+        self._documents: Dict[str, Document] = {}
+        self._refs: Counter = Counter()
+        self._source_version = _UNSET
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(query: str, filter_dict: Optional[Dict], k: int) -> Tuple:
+        """Chiave di cache di una ricerca"""
+        filter_key = json.dumps(filter_dict or {}, sort_keys=True, default=str)
+        return normalize_query(query), filter_key, k
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, key: Hashable) -> Optional[List[tuple]]:
+        """Risultati in cache come lista di (Document, score), None se assenti"""
+        if not self.max_size:
+            return None
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl and time.monotonic() - entry[0] > self.ttl):
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            documents = [(self._documents[doc_id], score) for doc_id, score in entry[1]]
+        
+        # Copie: chi riceve i risultati può modificarne i metadata
+        return [(_copy_document(doc), score) for doc, score in documents]
+    
+    def put(self, key: Hashable, results: List[tuple], version: int):
+        """
+        Salva i risultati di una ricerca
+        
+        Args:
+            version: Valore di `version` letto prima di interrogare l'indice
+        """
+        if not self.max_size:
+            return
+        
+        with self._lock:
+            if version != self.version:
+                return
+            
+            if key in self._entries:
+                self._drop(key)
+            
+            ids = []
+            for doc, score in results:
+                doc_id = document_key(doc)
+                if doc_id not in self._documents:
+                    self._documents[doc_id] = _copy_document(doc)
+                self._refs[doc_id] += 1
+                ids.append((doc_id, score))
+            self._entries[key] = (time.monotonic(), ids)
+            
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+    
+    def _drop(self, key: Hashable):
+        _, ids = self._entries.pop(key)
+        for doc_id, _ in ids:
+            self._refs[doc_id] -= 1
+            if self._refs[doc_id] <= 0:
+                del self._refs[doc_id]
+                self._documents.pop(doc_id, None)
+    
+    def invalidate(self):
+        """Invalida tutte le voci (da chiamare dopo ogni scrittura sull'indice)"""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._documents.clear()
+            self._refs.clear()
+    
+    def sync(self, source_version):
+        """
+        Invalida la cache se l'indice è stato modificato da un altro processo
+        
+        Args:
+            source_version: Marcatore dell'ultima scrittura (es. updated_at del catalogo)
+        """
+        if source_version != self._source_version:
+            if self._source_version is not _UNSET:
+                logger.info("🔄 Indice modificato: cache dei risultati invalidata")
+                self.invalidate()
+            self._source_version = source_version
+    
+    def stats(self) -> Dict:
+        """Statistiche di utilizzo"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "documents": len(self._documents),
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+        }
+
+
+class EmbeddingCache:
+    """
+    Cache degli embedding delle query
+    
+    Livello in memoria (LRU limitato) e livello opzionale su disco in
+    SQLite, condivisibile tra processi (API, app, script). La chiave è
+    (modello, query normalizzata): spazi e maiuscole non generano nuove
+    chiamate all'API di embedding.
+    """
+    
+    def __init__(self, model: str, max_size: int = 2048, path: Optional[Path] = None):
+        self.model = model
+        self.max_size = max_size
+        self.path = Path(path) if path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+    
+    def _connect(self):
+        """Connessione SQLite (aperta al primo utilizzo)"""
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT, query TEXT, vector BLOB, PRIMARY KEY (model, query))"
+            )
+        return self._db
+    
+    def _remember(self, key: str, vector: List[float]):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def get(self, query: str) -> Optional[List[float]]:
+        """Embedding in cache della query (None se assente)"""
+        key = normalize_query(query)
+        
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+            
+            if self.path:
+                try:
+                    row = self._connect().execute(
+                        "SELECT vector FROM query_embeddings WHERE model = ? AND query = ?",
+                        (self.model, key)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.warning(f"⚠️  Cache embedding su disco non disponibile: {e}")
+                    row = None
+                if row is not None:
+                    vector = array("f", row[0]).tolist()
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+            
+            self.misses += 1
+            return None
+    
+    def put(self, query: str, vector: List[float]):
+        """Salva l'embedding di una query"""
+        key = normalize_query(query)
+        
+        with self._lock:
+            self._remember(key, vector)
+            
+            if self.path:
+                try:
+                    db = self._connect()
+                    db.execute(
+                        "INSERT OR REPLACE INTO query_embeddings (model, query, vector) VALUES (?, ?, ?)",
+                        (self.model, key, array("f", vector).tobytes())
+                    )
+                    db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"⚠️  Cache embedding su disco non disponibile: {e}")
+    
+    def embed_query(self, embeddings, query: str) -> List[float]:
+        """Embedding della query (chiave normalizzata), calcolato solo se non in cache"""
+        vector = self.get(query)
+        if vector is None:
+            vector = embeddings.embed_query(query)
+            self.put(query, vector)
+        return vector
+    
+    def stats(self) -> Dict:
+        """Statistiche di utilizzo"""
+        total = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / total, 3) if total else None,
+        }
+
+
+class _Call:
+    """Elaborazione in corso condivisa da SingleFlight"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalescing delle chiamate identiche concorrenti (single-flight)
+    
+    La prima chiamata per una chiave esegue la funzione; quelle che
+    arrivano mentre è in corso la attendono e ricevono lo stesso
+    risultato (o la stessa eccezione). Terminata l'elaborazione la chiave
+    viene rimossa: nessun risultato resta in memoria.
+    """
+    
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+    
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Esegue fn() o attende l'elaborazione già in corso per la chiave
+        
+        Returns:
+            (risultato, condiviso): condiviso è True se il risultato è di
+            un'elaborazione avviata da un'altra chiamata
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                call.waiters += 1
+                self.followers += 1
+        
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        
+        if call.waiters:
+            logger.info(f"🔗 Risultato condiviso con {call.waiters} richieste identiche")
+        return call.result, False
+    
+    def in_flight(self) -> int:
+        """Elaborazioni in corso"""
+        return len(self._calls)
+    
+    def stats(self) -> Dict:
+        """Statistiche di utilizzo"""
+        total = self.leaders + self.followers
+        return {
+            "in_flight": len(self._calls),
+            "executed": self.leaders,
+            "coalesced": self.followers,
+            "coalesced_rate": round(self.followers / total, 3) if total else None,
+        }
@@ -0,0 +1,271 @@
+"""
+Catalogo dei manuali indicizzati (marca → modello → anno → numero di chunks)
+"""
+import json
+import hashlib
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import settings
+from src.adjacency import manual_name
+
+logger = logging.getLogger(__name__)
+
+
+# Chiave usata per i manuali senza anno nel nome file
+NO_YEAR = ""
+
+
+class ManualCatalog:
+    """
+    Catalogo in memoria di marche, modelli e anni presenti nell'indice
+    
+    Viene aggiornato a ogni scrittura sull'indice e salvato in JSON, così
+    API e app possono servire filtri e validarli senza scansionare i PDF.
+    """
+    
+    def __init__(self, brands: Optional[Dict] = None, updated_at: Optional[str] = None, files: Optional[Dict] = None):
+        # {marca: {modello: {anno: chunks}}}
+        self.brands: Dict[str, Dict[str, Dict[str, int]]] = brands or {}
+        # {manuale: {"marca", "modello", "anno", "chunks"}}: contributo di ogni manuale (manual_name)
+        self.files: Dict[str, Dict] = files or {}
+        self.updated_at = updated_at
+    
+    # ----- costruzione -----
+    
+    def add(self, marca: Optional[str], modello: Optional[str], anno: Optional[str], chunks: int = 1):
+        """Aggiunge chunks al catalogo"""
+        if not marca:
+            return
+        models = self.brands.setdefault(str(marca).upper(), {})
+        years = models.setdefault(str(modello or "N/A"), {})
+        year = str(anno) if anno else NO_YEAR
+        years[year] = years.get(year, 0) + chunks
+        if years[year] <= 0:
+            del years[year]
+            if not years:
+                del models[str(modello or "N/A")]
+                if not models:
+                    del self.brands[str(marca).upper()]
+    
+    def add_documents(self, documents):
+        """
+        Registra i chunks di una lista di Document (o di un ChunkStore)
+        
+        Un manuale già nel catalogo viene sostituito, non sommato: una
+        reindicizzazione senza --clear sovrascrive gli stessi vettori.
+        """
+        manuals: Dict[str, Dict] = {}
+        if hasattr(documents, "manual_metadata"):
+            # ChunkStore: si conta per manuale senza materializzare i Document
+            counts = Counter(documents.manual_id(i) for i in range(len(documents)))
+            for manual_id, count in counts.items():
+                self._count(manuals, documents.manual_metadata(manual_id), count)
+        else:
+            for doc in documents:
+                self._count(manuals, doc.metadata, 1)
+        
+        for key, entry in manuals.items():
+            previous = self.files.get(key)
+            if previous:
+                self.add(previous["marca"], previous["modello"], previous["anno"], -previous["chunks"])
+            self.add(entry["marca"], entry["modello"], entry["anno"], entry["chunks"])
+            self.files[key] = entry
+        self.updated_at = datetime.now().isoformat()
+    
+    def _count(self, manuals: Dict[str, Dict], metadata: Dict, chunks: int):
+        """Somma i chunks per manuale (senza manuale noto: aggiunti direttamente ai conteggi)"""
+        key = manual_name(metadata)
+        if not key:
+            self.add(metadata.get("marca"), metadata.get("modello"), metadata.get("anno"), chunks)
+            return
+        entry = manuals.setdefault(str(key), {
+            "marca": metadata.get("marca"),
+            "modello": metadata.get("modello"),
+            "anno": metadata.get("anno"),
+            "chunks": 0,
+        })
+        entry["chunks"] += chunks
+    
+    def remove(self, filter_dict: Dict):
+        """Rimuove le voci che corrispondono a un filtro di uguaglianza su marca/modello/anno"""
+        # Con altri campi o operatori ($in, ...) l'eliminazione può essere
+        # parziale: il catalogo resta invariato (al più mostra voci in eccesso)
+        if set(filter_dict) - {"marca", "modello", "anno"} or not all(
+            isinstance(value, (str, int)) for value in filter_dict.values()
+        ):
+            return
+        
+        marca = filter_dict.get("marca")
+        modello = filter_dict.get("modello")
+        anno = filter_dict.get("anno")
+        
+        for brand in list(self.brands):
+            if marca and brand != str(marca).upper():
+                continue
+            for model in list(self.brands[brand]):
+                if modello and model != modello:
+                    continue
+                if anno:
+                    self.brands[brand][model].pop(str(anno), None)
+                else:
+                    self.brands[brand][model].clear()
+                if not self.brands[brand][model]:
+                    del self.brands[brand][model]
+            if not self.brands[brand]:
+                del self.brands[brand]
+        
+        self.files = {
+            key: entry for key, entry in self.files.items()
+            if not (
+                (not marca or str(entry["marca"] or "").upper() == str(marca).upper())
+                and (not modello or entry["modello"] == modello)
+                and (not anno or str(entry["anno"]) == str(anno))
+            )
+        }
+        self.updated_at = datetime.now().isoformat()
+    
+    def clear(self):
+        """Svuota il catalogo"""
+        self.brands = {}
+        self.files = {}
+        self.updated_at = datetime.now().isoformat()
+    
+    # ----- lettura -----
+    
+    def __bool__(self) -> bool:
+        return bool(self.brands)
+    
+    def get_brands(self) -> List[str]:
+        """Marche disponibili"""
+        return sorted(self.brands)
+    
+    def get_models(self, brand: Optional[str] = None) -> List[str]:
+        """Modelli disponibili (opzionalmente per una marca)"""
+        if brand:
+            return sorted(self.brands.get(brand.upper(), {}))
+        return sorted({model for models in self.brands.values() for model in models})
+    
+    def get_years(self, brand: str, model: str) -> List[str]:
+        """Anni disponibili per marca e modello"""
+        years = self.brands.get(brand.upper(), {}).get(model, {})
+        return sorted(year for year in years if year != NO_YEAR)
+    
+    def validate_filters(self, filters: Optional[Dict]) -> Optional[str]:
+        """
+        Verifica che esistano manuali per i filtri richiesti
+        
+        Returns:
+            Messaggio di errore se la combinazione è impossibile, altrimenti None.
+            Con catalogo vuoto (mai indicizzato) non si rifiuta nulla.
+        """
+        if not filters or not self.brands:
+            return None
+        
+        marca = filters.get("marca")
+        modello = filters.get("modello")
+        anno = filters.get("anno")
+        
+        if not all(isinstance(value, (str, int, type(None))) for value in (marca, modello, anno)):
+            return None
+        
+        brands = [str(marca).upper()] if marca else list(self.brands)
+        if marca and brands[0] not in self.brands:
+            return f"Nessun manuale per la marca {marca}"
+        
+        # Anni disponibili per ogni (marca, modello) compatibile con i filtri
+        candidates = [
+            years
+            for brand in brands
+            for model, years in self.brands[brand].items()
+            if not modello or model == modello
+        ]
+        if modello and not candidates:
+            return f"Nessun manuale per il modello {modello}" + (f" ({marca})" if marca else "")
+        
+        if anno and not any(str(anno) in years for years in candidates):
+            return f"Nessun manuale per l'anno {anno}"
+        
+        return None
+    
+    # ----- serializzazione -----
+    
+    def to_dict(self) -> Dict:
+        return {"updated_at": self.updated_at, "brands": self.brands}
+    
+    @property
+    def etag(self) -> str:
+        """ETag del contenuto del catalogo"""
+        payload = json.dumps(self.brands, sort_keys=True).encode("utf-8")
+        return hashlib.sha1(payload).hexdigest()
+    
+    def save(self, path: Optional[Path] = None):
+        """Salva il catalogo su disco"""
+        path = Path(path or settings.CATALOG_PATH)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        data = {**self.to_dict(), "files": self.files}
+        tmp_path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+        tmp_path.replace(path)
+    
+    @classmethod
+    def load(cls, path: Optional[Path] = None) -> "ManualCatalog":
+        """Carica il catalogo da disco (vuoto se il file non esiste)"""
+        path = Path(path or settings.CATALOG_PATH)
+        if not path.exists():
+            return cls()
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            return cls(brands=data.get("brands", {}), updated_at=data.get("updated_at"), files=data.get("files", {}))
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️  Catalogo non leggibile ({path}): {e}")
+            return cls()
+
+
+_catalog: Optional[ManualCatalog] = None
+_catalog_mtime: Optional[float] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> ManualCatalog:
+    """
+    Catalogo condiviso dal processo
+    
+    Viene letto da disco una sola volta e ricaricato solo se il file è
+    stato modificato (es. da una nuova indicizzazione).
+    """
+    global _catalog, _catalog_mtime
+    
+    path = Path(settings.CATALOG_PATH)
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        mtime = None
+    
+    if _catalog is None or mtime != _catalog_mtime:
+        with _catalog_lock:
+            if _catalog is None or mtime != _catalog_mtime:
+                _catalog = ManualCatalog.load(path)
+                _catalog_mtime = mtime
+    
+    return _catalog
+
+
+def update_catalog(update) -> ManualCatalog:
+    """Applica una modifica al catalogo condiviso e la salva su disco"""
+    global _catalog_mtime
+    
+    catalog = get_catalog()
+    with _catalog_lock:
+        update(catalog)
+        catalog.save()
+        try:
+            _catalog_mtime = Path(settings.CATALOG_PATH).stat().st_mtime
+        except OSError:
+            _catalog_mtime = None
+    
+    return catalog
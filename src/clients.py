@@ -0,0 +1,125 @@
+"""
+Registro dei client condivisi dal processo (Pinecone, embedding, LLM)
+"""
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from config import settings, get_llm_config
+
+logger = logging.getLogger(__name__)
+
+
+_clients: Dict[Hashable, Any] = {}
+# Rientrante: la creazione di un client può richiederne un altro (indice → client Pinecone)
+_clients_lock = threading.RLock()
+
+
+def shared(key: Hashable, factory: Callable[[], Any]) -> Any:
+    """
+    Client condiviso dal processo: creato al primo utilizzo e poi riusato
+    
+    I client mantengono le proprie connessioni HTTP (keep-alive, pool),
+    quindi chatbot, API, app e script non le riaprono a ogni istanza.
+    """
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = factory()
+                _clients[key] = client
+    return client
+
+
+def reset_clients():
+    """Dimentica i client creati (es. dopo una modifica della configurazione)"""
+    with _clients_lock:
+        _clients.clear()
+
+
+def _grpc():
+    """Modulo pinecone.grpc (None se non installato: si usa REST)"""
+    try:
+        from pinecone import grpc
+        return grpc
+    except ImportError:
+        logger.warning("⚠️  Client gRPC non disponibile, uso REST. Installa: pip install \"pinecone-client[grpc]\"")
+        return None
+
+
+def get_pinecone_client():
+    """Client Pinecone (gRPC se PINECONE_USE_GRPC e disponibile, altrimenti REST)"""
+    def create():
+        grpc = _grpc() if settings.PINECONE_USE_GRPC else None
+        if grpc is not None:
+            logger.info("🔌 Client Pinecone gRPC")
+            return grpc.PineconeGRPC(api_key=settings.PINECONE_API_KEY)
+        
+        from pinecone import Pinecone
+        
+        logger.info("🔌 Client Pinecone REST")
+        return Pinecone(api_key=settings.PINECONE_API_KEY, pool_threads=settings.PINECONE_POOL_THREADS)
+    
+    return shared("pinecone", create)
+
+
+def get_pinecone_index(name: Optional[str] = None):
+    """Handle dell'indice Pinecone (connessioni in pool, condiviso tra i manager)"""
+    name = name or settings.PINECONE_INDEX_NAME
+    
+    def create():
+        pc = get_pinecone_client()
+        if type(pc).__name__ == "PineconeGRPC":
+            from pinecone.grpc import GRPCClientConfig
+            
+            return pc.Index(name, grpc_config=GRPCClientConfig(timeout=settings.PINECONE_TIMEOUT))
+        return pc.Index(
+            name,
+            pool_threads=settings.PINECONE_POOL_THREADS,
+            connection_pool_maxsize=settings.PINECONE_POOL_SIZE
+        )
+    
+    return shared(("pinecone_index", name), create)
+
+
+def get_embedding_client():
+    """Provider di embedding configurato (un solo modello/client per processo)"""
+    from src.embeddings import embedding_model_name, get_embeddings
+    
+    return shared(("embeddings", settings.EMBEDDING_PROVIDER, embedding_model_name()), get_embeddings)
+
+
+def get_llm_client():
+    """LLM configurato (client HTTP condiviso tra chatbot e sessioni)"""
+    llm_config = get_llm_config()
+    
+    def create():
+        logger.info(f"🤖 Inizializzazione LLM: {llm_config['provider']} - {llm_config['model']}")
+        
+        if llm_config['provider'] == "anthropic":
+            from langchain_anthropic import ChatAnthropic
+            
+            return ChatAnthropic(
+                model=llm_config['model'],
+                anthropic_api_key=llm_config['api_key'],
+                temperature=llm_config['temperature'],
+                max_tokens=llm_config['max_tokens'],
+                timeout=settings.LLM_TIMEOUT,
+                max_retries=settings.CLIENT_MAX_RETRIES
+            )
+        if llm_config['provider'] == "openai":
+            from langchain_openai import ChatOpenAI
+            
+            return ChatOpenAI(
+                model=llm_config['model'],
+                openai_api_key=llm_config['api_key'],
+                temperature=llm_config['temperature'],
+                max_tokens=llm_config['max_tokens'],
+                timeout=settings.LLM_TIMEOUT,
+                max_retries=settings.CLIENT_MAX_RETRIES
+            )
+        raise ValueError(f"Provider non supportato: {llm_config['provider']}")
+    
+    key = ("llm", llm_config['provider'], llm_config['model'], llm_config['temperature'], llm_config['max_tokens'])
+    return shared(key, create)
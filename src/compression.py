@@ -0,0 +1,412 @@
+"""
+Compressione dei vettori: riduzione di dimensionalità e quantizzazione int8
+"""
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config import settings
+from src.docstore import filter_column
+
+logger = logging.getLogger(__name__)
+
+
+COMPRESSION_METHODS = ["none", "truncate", "pca"]
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Normalizza i vettori (righe) a norma 1"""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple:
+    """
+    Quantizzazione int8 simmetrica con una scala per vettore
+    
+    Returns:
+        Tupla (codici int8, scale float32)
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=-1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.round(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize_int8(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """Ricostruisce i vettori float32 dai codici int8"""
+    return codes.astype(np.float32) * scales[:, None]
+
+
+class VectorReducer:
+    """
+    Riduzione di dimensionalità dei vettori salvati nell'indice
+    
+    - truncate: prime `dim` componenti (modelli Matryoshka, es. text-embedding-3)
+    - pca: proiezione sulle prime `dim` componenti principali del corpus
+    
+    I vettori ridotti vengono rinormalizzati (metrica coseno).
+    """
+    
+    def __init__(self, method: str = "none", dim: Optional[int] = None):
+        if method not in COMPRESSION_METHODS:
+            raise ValueError(f"Metodo di compressione non supportato: {method} (usa {COMPRESSION_METHODS})")
+        self.method = method
+        self.dim = dim
+        self.mean: Optional[np.ndarray] = None
+        self.components: Optional[np.ndarray] = None
+    
+    @property
+    def enabled(self) -> bool:
+        return self.method != "none"
+    
+    @property
+    def is_fitted(self) -> bool:
+        return self.method != "pca" or self.components is not None
+    
+    def output_dim(self, input_dim: int) -> int:
+        """Dimensione dei vettori ridotti"""
+        return min(self.dim, input_dim) if self.enabled else input_dim
+    
+    def fit(self, vectors: np.ndarray) -> "VectorReducer":
+        """Calcola le componenti principali (solo per pca)"""
+        if self.method != "pca":
+            return self
+        
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) < self.dim:
+            raise ValueError(
+                f"PCA a {self.dim} dimensioni richiede almeno {self.dim} vettori "
+                f"(disponibili {len(vectors)}): usa il troncamento o riduci la dimensione"
+            )
+        
+        self.mean = vectors.mean(axis=0)
+        _, _, vt = np.linalg.svd(vectors - self.mean, full_matrices=False)
+        self.components = vt[:self.dim].astype(np.float32)
+        return self
+    
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        """Riduce i vettori (righe)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.method == "truncate":
+            vectors = vectors[..., :self.dim]
+        elif self.method == "pca":
+            if self.components is None:
+                raise ValueError("Modello PCA non addestrato: indicizza i manuali per calcolarlo")
+            vectors = (vectors - self.mean) @ self.components.T
+        return normalize(vectors)
+    
+    def save(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {"method": np.array(self.method), "dim": np.array(self.dim or 0)}
+        if self.components is not None:
+            arrays.update(mean=self.mean, components=self.components)
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+    
+    @classmethod
+    def load(cls, path: Path) -> "VectorReducer":
+        with np.load(Path(path)) as data:
+            reducer = cls(str(data["method"]), int(data["dim"]) or None)
+            if "components" in data:
+                reducer.mean = data["mean"]
+                reducer.components = data["components"]
+        return reducer
+
+
+class FullVectorStore:
+    """
+    Vettori a piena dimensione float32, per ID vettore (SQLite)
+    
+    Servono solo a ricalcolare lo score esatto dei candidati restituiti
+    dall'indice ridotto (4 byte per componente, in locale). Marca, modello
+    e anno permettono di eliminarli insieme ai vettori dell'indice.
+    Le righe int8 (scale valorizzata) di versioni precedenti restano
+    leggibili fino alla reindicizzazione.
+    """
+    
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._db = None
+        self._lock = threading.Lock()
+    
+    def _connect(self):
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS vectors ("
+                "id TEXT PRIMARY KEY, scale REAL, codes BLOB, marca TEXT, modello TEXT, anno TEXT)"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(vectors)")}
+            for column in ("marca", "modello", "anno"):
+                if column not in columns:
+                    self._db.execute(f"ALTER TABLE vectors ADD COLUMN {column} TEXT")
+            self._db.execute("CREATE INDEX IF NOT EXISTS vectors_marca ON vectors (marca, modello, anno)")
+        return self._db
+    
+    def add(self, ids: Sequence[str], vectors: np.ndarray, metadatas: Optional[Sequence[Dict]] = None):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        metadatas = metadatas or [{}] * len(ids)
+        rows = [
+            (
+                id_,
+                vector.tobytes(),
+                filter_column(metadata.get("marca"), upper=True),
+                filter_column(metadata.get("modello")),
+                filter_column(metadata.get("anno")),
+            )
+            for id_, vector, metadata in zip(ids, vectors, metadatas)
+        ]
+        with self._lock:
+            db = self._connect()
+            db.executemany(
+                "INSERT OR REPLACE INTO vectors (id, scale, codes, marca, modello, anno) VALUES (?, NULL, ?, ?, ?, ?)",
+                rows
+            )
+            db.commit()
+    
+    def get(self, ids: Sequence[str]) -> Dict[str, np.ndarray]:
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT id, scale, codes FROM vectors WHERE id IN ({placeholders})", list(ids)
+            ).fetchall()
+        return {
+            id_: np.frombuffer(codes, dtype=np.float32) if scale is None
+            else np.frombuffer(codes, dtype=np.int8).astype(np.float32) * scale
+            for id_, scale, codes in rows
+        }
+    
+    def delete_where(self, filter_dict: Dict) -> Optional[int]:
+        """
+        Elimina i vettori che corrispondono a un filtro di uguaglianza su marca/modello/anno
+        
+        Returns:
+            Numero di vettori eliminati, None se il filtro non è supportato
+        """
+        columns = {"marca", "modello", "anno"}
+        if not filter_dict or set(filter_dict) - columns or not all(
+            isinstance(value, (str, int)) for value in filter_dict.values()
+        ):
+            return None
+        
+        where = " AND ".join(f"{column} = ?" for column in sorted(filter_dict))
+        values = [filter_column(filter_dict[column], upper=column == "marca") for column in sorted(filter_dict)]
+        with self._lock:
+            db = self._connect()
+            deleted = db.execute(f"DELETE FROM vectors WHERE {where}", values).rowcount
+            db.commit()
+        return deleted
+    
+    def clear(self):
+        with self._lock:
+            db = self._connect()
+            db.execute("DELETE FROM vectors")
+            db.commit()
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+
+class VectorCompression:
+    """
+    Compressione dei vettori dell'indice con re-scoring dei candidati
+    
+    L'indice Pinecone contiene i vettori ridotti (float32, `dim`
+    componenti). Con il re-scoring attivo la query recupera
+    k × oversample candidati, che vengono riordinati con il prodotto
+    scalare esatto tra l'embedding completo della query e i vettori
+    completi float32 salvati in locale.
+    """
+    
+    def __init__(
+        self,
+        method: str = "none",
+        dim: Optional[int] = None,
+        rescore: bool = False,
+        oversample: int = 4,
+        directory: Optional[Path] = None
+    ):
+        self.directory = Path(directory) if directory else None
+        self.reducer_path = self.directory / "reducer.npz" if self.directory else None
+        
+        if self.reducer_path and self.reducer_path.exists():
+            self.reducer = VectorReducer.load(self.reducer_path)
+            if (self.reducer.method, self.reducer.dim) != (method, dim):
+                logger.warning(
+                    f"⚠️  Compressione salvata ({self.reducer.method}, {self.reducer.dim}) diversa dalla "
+                    f"configurazione ({method}, {dim}): uso quella dell'indice esistente"
+                )
+        else:
+            self.reducer = VectorReducer(method, dim)
+        
+        self.rescore_enabled = rescore and self.reducer.enabled and self.directory is not None
+        self.oversample = max(1, oversample)
+        self.store = FullVectorStore(self.directory / "full_vectors.sqlite") if self.rescore_enabled else None
+    
+    @classmethod
+    def from_settings(cls) -> "VectorCompression":
+        return cls(
+            method=settings.VECTOR_COMPRESSION,
+            dim=settings.VECTOR_COMPRESSION_DIM,
+            rescore=settings.VECTOR_RESCORE,
+            oversample=settings.VECTOR_RESCORE_OVERSAMPLE,
+            directory=settings.VECTOR_COMPRESSION_DIR
+        )
+    
+    @property
+    def enabled(self) -> bool:
+        return self.reducer.enabled
+    
+    @property
+    def needs_fit(self) -> bool:
+        return not self.reducer.is_fitted
+    
+    def index_dimension(self, full_dimension: int) -> int:
+        """Dimensione dei vettori nell'indice"""
+        return self.reducer.output_dim(full_dimension)
+    
+    def fit(self, vectors: List[List[float]]):
+        """Addestra la riduzione su un campione di embedding e la salva"""
+        logger.info(f"📐 Calcolo PCA a {self.reducer.dim} dimensioni su {len(vectors)} vettori...")
+        self.reducer.fit(np.asarray(vectors, dtype=np.float32))
+        if self.reducer_path:
+            self.reducer.save(self.reducer_path)
+    
+    def prepare(
+        self,
+        ids: List[str],
+        vectors: List[List[float]],
+        metadatas: Optional[List[Dict]] = None
+    ) -> List[List[float]]:
+        """Vettori da caricare nell'indice (salva i completi per il re-scoring)"""
+        if not self.enabled:
+            return vectors
+        
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.store is not None:
+            self.store.add(ids, vectors, metadatas)
+        return self.reducer.transform(vectors).tolist()
+    
+    def query_vector(self, embedding: List[float]) -> List[float]:
+        """Vettore da usare per interrogare l'indice"""
+        if not self.enabled:
+            return embedding
+        return self.reducer.transform(np.asarray([embedding], dtype=np.float32))[0].tolist()
+    
+    def fetch_k(self, k: int) -> int:
+        """Numero di candidati da recuperare dall'indice"""
+        return k * self.oversample if self.rescore_enabled else k
+    
+    def rescore(self, embedding: List[float], results: List[tuple], k: int) -> List[tuple]:
+        """Riordina i candidati con lo score sui vettori completi"""
+        if not self.rescore_enabled or not results:
+            return results[:k]
+        
+        full = self.store.get([doc.id for doc, _ in results if getattr(doc, "id", None)])
+        query = normalize(np.asarray(embedding, dtype=np.float32))
+        
+        rescored = []
+        for doc, score in results:
+            vector = full.get(getattr(doc, "id", None))
+            if vector is not None:
+                score = float(query @ normalize(vector))
+            rescored.append((doc, score))
+        
+        rescored.sort(key=lambda item: item[1], reverse=True)
+        return rescored[:k]
+    
+    def delete_where(self, filter_dict: Dict):
+        """Elimina i vettori completi dei manuali eliminati dall'indice"""
+        if self.store is not None and self.store.delete_where(filter_dict) is None:
+            logger.warning(f"⚠️  Filtro non supportato per i vettori completi, restano in locale: {filter_dict}")
+    
+    def clear(self):
+        """Elimina i vettori completi salvati (la riduzione resta valida per l'indice)"""
+        if self.store is not None:
+            self.store.clear()
+
+
+def evaluate_compression(
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    k: int = 5,
+    dims: Sequence[int] = (768, 512, 256, 128),
+    methods: Sequence[str] = ("truncate", "pca"),
+    oversample: int = 4
+) -> List[Dict]:
+    """
+    Recall@k e dimensione per vettore delle configurazioni di compressione
+    
+    Il riferimento è la ricerca esatta sui vettori float32 completi.
+    Ogni configurazione viene valutata senza e con re-scoring sui
+    vettori completi float32 (come VectorCompression.rescore).
+    """
+    corpus = normalize(np.asarray(corpus, dtype=np.float32))
+    queries = normalize(np.asarray(queries, dtype=np.float32))
+    full_dim = corpus.shape[1]
+    k = min(k, len(corpus))
+    
+    def top(scores: np.ndarray, n: int) -> np.ndarray:
+        n = min(n, scores.shape[1])
+        return np.argsort(-scores, axis=1)[:, :n]
+    
+    truth = top(queries @ corpus.T, k)
+    
+    def recall(found: np.ndarray) -> float:
+        hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+        return round(hits / truth.size, 4)
+    
+    codes, scales = quantize_int8(corpus)
+    corpus_int8 = normalize(dequantize_int8(codes, scales))
+    
+    rows = [{
+        "method": "none", "dim": full_dim, "rescore": False,
+        "recall": 1.0, "index_bytes_per_vector": full_dim * 4, "local_bytes_per_vector": 0,
+    }, {
+        "method": "int8", "dim": full_dim, "rescore": False,
+        "recall": recall(top(queries @ corpus_int8.T, k)),
+        "index_bytes_per_vector": full_dim + 4, "local_bytes_per_vector": 0,
+    }]
+    
+    for method in methods:
+        for dim in dims:
+            if dim >= full_dim or (method == "pca" and dim > len(corpus)):
+                continue
+            
+            reducer = VectorReducer(method, dim).fit(corpus)
+            reduced_scores = reducer.transform(queries) @ reducer.transform(corpus).T
+            
+            rows.append({
+                "method": method, "dim": dim, "rescore": False,
+                "recall": recall(top(reduced_scores, k)),
+                "index_bytes_per_vector": dim * 4, "local_bytes_per_vector": 0,
+            })
+            
+            # Re-scoring dei k × oversample candidati sui vettori completi
+            candidates = top(reduced_scores, k * oversample)
+            rescored = np.array([
+                cand[np.argsort(-(corpus[cand] @ query))[:k]]
+                for cand, query in zip(candidates, queries)
+            ])
+            rows.append({
+                "method": method, "dim": dim, "rescore": True,
+                "recall": recall(rescored),
+                "index_bytes_per_vector": dim * 4, "local_bytes_per_vector": full_dim * 4,
+            })
+    
+    for row in rows:
+        row["compression_ratio"] = round(full_dim * 4 / row["index_bytes_per_vector"], 1)
+    
+    return rows
@@ -0,0 +1,172 @@
+"""
+Docstore locale: testo e metadata dei chunks per ID vettore (SQLite compresso)
+"""
+import json
+import zlib
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Prefisso del codec nei blob compressi
+ZSTD = b"Z"
+ZLIB = b"D"
+
+
+def _zstd():
+    """Modulo zstandard (None se non installato: si usa zlib)"""
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+class DocStore:
+    """
+    Testo e metadata dei chunks fuori dall'indice vettoriale
+    
+    L'indice conserva solo ID e campi filtrabili; dopo la ricerca i
+    Document vengono ricostruiti leggendo da qui. Testo e metadata sono
+    compressi con zstd (zlib se zstandard non è installato).
+    Richiede: zstandard (opzionale)
+    """
+    
+    def __init__(self, path: Path, level: int = 3):
+        self.path = Path(path)
+        self.level = level
+        self._db = None
+        self._lock = threading.Lock()
+        
+        zstandard = _zstd()
+        self._compressor = zstandard.ZstdCompressor(level=level) if zstandard else None
+        self._decompressor = zstandard.ZstdDecompressor() if zstandard else None
+    
+    def _connect(self):
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "id TEXT PRIMARY KEY, marca TEXT, modello TEXT, anno TEXT, payload BLOB)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS chunks_marca ON chunks (marca, modello, anno)")
+        return self._db
+    
+    def _compress(self, data: bytes) -> bytes:
+        if self._compressor is not None:
+            return ZSTD + self._compressor.compress(data)
+        return ZLIB + zlib.compress(data, 6)
+    
+    def _decompress(self, blob: bytes) -> bytes:
+        codec, data = blob[:1], blob[1:]
+        if codec == ZSTD:
+            if self._decompressor is None:
+                raise RuntimeError("Docstore compresso con zstd. Installa: pip install zstandard")
+            return self._decompressor.decompress(data)
+        return zlib.decompress(data)
+    
+    def add(self, ids: Sequence[str], texts: Sequence[str], metadatas: Sequence[Dict]):
+        """Salva testo e metadata dei chunks"""
+        payloads = [
+            json.dumps({"text": text, "metadata": metadata}, ensure_ascii=False, default=str).encode("utf-8")
+            for text, metadata in zip(texts, metadatas)
+        ]
+        
+        # I (de)compressori zstd non vanno usati da più thread insieme
+        with self._lock:
+            rows = [
+                (
+                    id_,
+                    filter_column(metadata.get("marca"), upper=True),
+                    filter_column(metadata.get("modello")),
+                    filter_column(metadata.get("anno")),
+                    self._compress(payload),
+                )
+                for id_, metadata, payload in zip(ids, metadatas, payloads)
+            ]
+            db = self._connect()
+            db.executemany(
+                "INSERT OR REPLACE INTO chunks (id, marca, modello, anno, payload) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            db.commit()
+    
+    def get(self, ids: Sequence[str]) -> Dict[str, Tuple[str, Dict]]:
+        """Testo e metadata per ID (gli ID assenti vengono omessi)"""
+        ids = list(ids)
+        if not ids:
+            return {}
+        
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT id, payload FROM chunks WHERE id IN ({placeholders})", ids
+            ).fetchall()
+            payloads = [(id_, self._decompress(blob)) for id_, blob in rows]
+        
+        result = {}
+        for id_, data in payloads:
+            payload = json.loads(data)
+            result[id_] = (payload["text"], payload["metadata"])
+        return result
+    
+    def delete_where(self, filter_dict: Dict) -> Optional[int]:
+        """
+        Elimina i chunks che corrispondono a un filtro di uguaglianza su marca/modello/anno
+        
+        Returns:
+            Numero di chunks eliminati, None se il filtro non è supportato
+            (i chunks restano ma non vengono più restituiti dall'indice)
+        """
+        columns = {"marca", "modello", "anno"}
+        if not filter_dict or set(filter_dict) - columns or not all(
+            isinstance(value, (str, int)) for value in filter_dict.values()
+        ):
+            return None
+        
+        where = " AND ".join(f"{column} = ?" for column in sorted(filter_dict))
+        values = [filter_column(filter_dict[column], upper=column == "marca") for column in sorted(filter_dict)]
+        with self._lock:
+            db = self._connect()
+            deleted = db.execute(f"DELETE FROM chunks WHERE {where}", values).rowcount
+            db.commit()
+        return deleted
+    
+    def clear(self):
+        """Elimina tutti i chunks"""
+        with self._lock:
+            db = self._connect()
+            db.execute("DELETE FROM chunks")
+            db.commit()
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+    
+    def stats(self) -> Dict:
+        """Numero di chunks e byte compressi"""
+        with self._lock:
+            count, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM chunks"
+            ).fetchone()
+        return {"chunks": count, "payload_bytes": size, "codec": "zstd" if self._compressor else "zlib"}
+
+
+def filter_column(value, upper: bool = False) -> Optional[str]:
+    """Valore di una colonna filtrabile (marca in maiuscolo, come nei filtri)"""
+    if value is None:
+        return None
+    return str(value).upper() if upper else str(value)
+
+
+def index_metadata(metadata: Dict, fields: List[str]) -> Dict:
+    """Metadata da salvare nell'indice: solo i campi filtrabili"""
+    return {key: metadata[key] for key in fields if metadata.get(key) is not None}
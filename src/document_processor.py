@@ -2,28 +2,464 @@
 Modulo per l'elaborazione e preprocessing dei manuali PDF
 """
 import os
+import gzip
+import json
+import hashlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Optional
-from langchain.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
+from typing import List, Dict, Optional, Iterator, Sequence, Union, NamedTuple
+from langchain_core.documents import Document
 from tqdm import tqdm
 import logging
 
 from config import settings
+from src.adjacency import ChunkAdjacency, manual_name
+from src.instrumentation import IngestionReport
 
-logging.basicConfig(level=settings.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
 
+class ChunkStore:
+    """
+    Contenitore colonnare compatto per pagine e chunks
+    
+    I metadata di base (filename, marca, modello, file_path, ...) sono
+    condivisi da tutte le pagine di un manuale: vengono internati una sola
+    volta per manuale. Il testo è salvato in un unico buffer UTF-8 contiguo
+    con un array di offset, il numero di pagina e la posizione del chunk
+    nel manuale in array di interi.
+    I Document LangChain vengono creati solo on-demand.
+    """
+    
+    NO_PAGE = -1
+    NO_CHUNK = -1
+    
+    def __init__(self, manuals: Optional[List[Dict]] = None):
+        # Tabella metadata internati (condivisa tra store derivati)
+        self._manuals: List[Dict] = manuals if manuals is not None else []
+        self._manual_keys: Dict[tuple, int] = {}
+        self._buffer = bytearray()
+        self._offsets = array("Q", [0])
+        self._manual_ids = array("I")
+        self._pages = array("i")
+        self._chunk_indices = array("i")
+    
+    # ----- costruzione -----
+    
+    def intern_metadata(self, metadata: Dict) -> int:
+        """Registra (una sola volta) i metadata di un manuale e ne ritorna l'id"""
+        try:
+            key = tuple(sorted(metadata.items()))
+            hash(key)
+        except TypeError:
+            key = (repr(sorted(metadata.items(), key=lambda item: item[0])),)
+        
+        manual_id = self._manual_keys.get(key)
+        if manual_id is None:
+            manual_id = len(self._manuals)
+            self._manuals.append(dict(metadata))
+            self._manual_keys[key] = manual_id
+        return manual_id
+    
+    def append(
+        self,
+        text: str,
+        manual_id: int,
+        page: Optional[int] = None,
+        chunk_index: Optional[int] = None
+    ):
+        """Aggiunge un elemento (pagina o chunk) allo store"""
+        self._buffer.extend(text.encode("utf-8"))
+        self._offsets.append(len(self._buffer))
+        self._manual_ids.append(manual_id)
+        self._pages.append(self.NO_PAGE if page is None else int(page))
+        self._chunk_indices.append(self.NO_CHUNK if chunk_index is None else int(chunk_index))
+    
+    def add_document(self, doc: Document):
+        """Aggiunge un Document separando metadata di manuale e pagina"""
+        metadata = dict(doc.metadata)
+        page = metadata.pop("page", None)
+        chunk_index = metadata.pop("chunk_index", None)
+        self.append(doc.page_content, self.intern_metadata(metadata), page, chunk_index)
+    
+    def extend_documents(self, documents: Sequence[Document]):
+        """Aggiunge una lista di Document"""
+        for doc in documents:
+            self.add_document(doc)
+    
+    @classmethod
+    def from_documents(cls, documents: Sequence[Document]) -> "ChunkStore":
+        """Crea uno store a partire da una lista di Document"""
+        store = cls()
+        store.extend_documents(documents)
+        return store
+    
+    # ----- accesso -----
+    
+    def __len__(self) -> int:
+        return len(self._manual_ids)
+    
+    def text(self, i: int) -> str:
+        """Testo dell'elemento i-esimo"""
+        return self._buffer[self._offsets[i]:self._offsets[i + 1]].decode("utf-8")
+    
+    def text_length(self, i: int) -> int:
+        """Lunghezza in byte UTF-8 dell'elemento i-esimo (senza decodifica)"""
+        return self._offsets[i + 1] - self._offsets[i]
+    
+    def page(self, i: int) -> Optional[int]:
+        """Numero di pagina dell'elemento i-esimo (None se assente)"""
+        page = self._pages[i]
+        return None if page == self.NO_PAGE else page
+    
+    def chunk_index(self, i: int) -> Optional[int]:
+        """Posizione del chunk i-esimo nel proprio manuale (None se assente)"""
+        chunk_index = self._chunk_indices[i]
+        return None if chunk_index == self.NO_CHUNK else chunk_index
+    
+    def manual_id(self, i: int) -> int:
+        """Id del manuale (metadata internati) dell'elemento i-esimo"""
+        return self._manual_ids[i]
+    
+    def manual_metadata(self, manual_id: int) -> Dict:
+        """Metadata internati di un manuale (non modificare)"""
+        return self._manuals[manual_id]
+    
+    def metadata(self, i: int) -> Dict:
+        """Metadata completi dell'elemento i-esimo (copia)"""
+        metadata = dict(self._manuals[self._manual_ids[i]])
+        page = self.page(i)
+        if page is not None:
+            metadata["page"] = page
+        chunk_index = self.chunk_index(i)
+        if chunk_index is not None:
+            metadata["chunk_index"] = chunk_index
+        return metadata
+    
+    def document(self, i: int) -> Document:
+        """Converte l'elemento i-esimo in Document LangChain"""
+        return Document(page_content=self.text(i), metadata=self.metadata(i))
+    
+    def __getitem__(self, i: Union[int, slice]) -> Union[Document, List[Document]]:
+        if isinstance(i, slice):
+            return [self.document(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("ChunkStore index out of range")
+        return self.document(i)
+    
+    def __iter__(self) -> Iterator[Document]:
+        for i in range(len(self)):
+            yield self.document(i)
+    
+    def iter_batches(self, batch_size: int = 100) -> Iterator[List[Document]]:
+        """Itera a batch di Document (conversione lazy al confine LangChain)"""
+        for start in range(0, len(self), batch_size):
+            yield self[start:start + batch_size]
+    
+    def to_documents(self) -> List[Document]:
+        """Materializza tutti gli elementi come Document"""
+        return list(self)
+    
+    # ----- trasformazioni -----
+    
+    def split(self, text_splitter) -> "ChunkStore":
+        """
+        Divide ogni elemento in chunks con il text splitter dato
+        
+        Lo store risultante condivide la tabella dei metadata di manuale.
+        Ogni chunk riceve la propria posizione nel file (chunk_index),
+        usata dall'indice di adiacenza per l'espansione small-to-big.
+        """
+        chunks = ChunkStore(manuals=self._manuals)
+        chunks._manual_keys = self._manual_keys
+        
+        # Contatore per manuale (percorso relativo: file omonimi in cartelle
+        # diverse restano distinti); pagine OCR/tabelle hanno metadata internati diversi
+        counters: Dict[str, int] = {}
+        
+        for i in range(len(self)):
+            manual_id = self._manual_ids[i]
+            page = self.page(i)
+            manual = manual_name(self._manuals[manual_id]) or ""
+            for piece in text_splitter.split_text(self.text(i)):
+                chunk_index = counters.get(manual, 0)
+                counters[manual] = chunk_index + 1
+                chunks.append(piece, manual_id, page, chunk_index)
+        
+        return chunks
+    
+    def memory_usage(self) -> int:
+        """Stima in byte della memoria occupata dalle colonne"""
+        return (
+            len(self._buffer)
+            + self._offsets.itemsize * len(self._offsets)
+            + self._manual_ids.itemsize * len(self._manual_ids)
+            + self._pages.itemsize * len(self._pages)
+            + self._chunk_indices.itemsize * len(self._chunk_indices)
+        )
+    
+    def to_arrow(self):
+        """
+        Esporta lo store come tabella Arrow (metadata dictionary-encoded)
+        Richiede: pyarrow
+        """
+        try:
+            import pyarrow as pa
+        except ImportError:
+            logger.warning("Export Arrow non disponibile. Installa: pip install pyarrow")
+            return None
+        
+        keys = sorted({key for manual in self._manuals for key in manual})
+        columns = {
+            "text": pa.array([self.text(i) for i in range(len(self))], type=pa.large_string()),
+            "page": pa.array([self.page(i) for i in range(len(self))], type=pa.int32()),
+            "chunk_index": pa.array([self.chunk_index(i) for i in range(len(self))], type=pa.int32()),
+        }
+        indices = pa.array(self._manual_ids, type=pa.int32())
+        for key in keys:
+            values = pa.array([
+                None if manual.get(key) is None else str(manual.get(key))
+                for manual in self._manuals
+            ], type=pa.string())
+            columns[key] = pa.DictionaryArray.from_arrays(indices, values)
+        
+        return pa.table(columns)
+    
+    def to_jsonl(self, path: Path) -> int:
+        """Esporta lo store in JSONL (una riga per elemento: testo + metadata)"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        
+        with open(path, "w", encoding="utf-8") as f:
+            for i in range(len(self)):
+                f.write(json.dumps({"text": self.text(i), **self.metadata(i)}, ensure_ascii=False) + "\n")
+        
+        return len(self)
+    
+    def to_parquet(self, path: Path) -> int:
+        """
+        Esporta lo store in Parquet
+        Richiede: pyarrow
+        """
+        table = self.to_arrow()
+        if table is None:
+            return 0
+        
+        import pyarrow.parquet as pq
+        
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pq.write_table(table, str(path))
+        return len(self)
+
+
+class PDFExtractor:
+    """
+    Interfaccia per i motori di estrazione testo dai PDF
+    
+    Ogni motore restituisce una lista di tuple (indice_pagina, testo),
+    con indice di pagina 0-based e assoluto rispetto al file, anche quando
+    si estrae solo un intervallo [start, end).
+    """
+    
+    name = "base"
+    package = ""
+    
+    def page_count(self, pdf_path: Path) -> int:
+        raise NotImplementedError
+    
+    def extract_pages(self, pdf_path: Path, start: int = 0, end: Optional[int] = None) -> List[tuple]:
+        raise NotImplementedError
+
+
+class PyPDFExtractor(PDFExtractor):
+    """Estrazione con pypdf (puro Python, sempre disponibile)"""
+    
+    name = "pypdf"
+    package = "pypdf"
+    
+    def page_count(self, pdf_path: Path) -> int:
+        from pypdf import PdfReader
+        
+        return len(PdfReader(str(pdf_path)).pages)
+    
+    def extract_pages(self, pdf_path: Path, start: int = 0, end: Optional[int] = None) -> List[tuple]:
+        from pypdf import PdfReader
+        
+        reader = PdfReader(str(pdf_path))
+        end = len(reader.pages) if end is None else min(end, len(reader.pages))
+        return [(i, reader.pages[i].extract_text()) for i in range(start, end)]
+
+
+class PyMuPDFExtractor(PDFExtractor):
+    """
+    Estrazione con MuPDF (nativo, molto più veloce)
+    Richiede: pymupdf
+    """
+    
+    name = "pymupdf"
+    package = "pymupdf"
+    
+    def page_count(self, pdf_path: Path) -> int:
+        import pymupdf
+        
+        with pymupdf.open(str(pdf_path)) as pdf:
+            return pdf.page_count
+    
+    def extract_pages(self, pdf_path: Path, start: int = 0, end: Optional[int] = None) -> List[tuple]:
+        import pymupdf
+        
+        with pymupdf.open(str(pdf_path)) as pdf:
+            end = pdf.page_count if end is None else min(end, pdf.page_count)
+            return [(i, pdf[i].get_text()) for i in range(start, end)]
+
+
+class PdfiumExtractor(PDFExtractor):
+    """
+    Estrazione con PDFium (nativo, molto più veloce)
+    Richiede: pypdfium2
+    """
+    
+    name = "pdfium"
+    package = "pypdfium2"
+    
+    def page_count(self, pdf_path: Path) -> int:
+        import pypdfium2 as pdfium
+        
+        pdf = pdfium.PdfDocument(str(pdf_path))
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    
+    def extract_pages(self, pdf_path: Path, start: int = 0, end: Optional[int] = None) -> List[tuple]:
+        import pypdfium2 as pdfium
+        
+        pdf = pdfium.PdfDocument(str(pdf_path))
+        try:
+            end = len(pdf) if end is None else min(end, len(pdf))
+            pages = []
+            for i in range(start, end):
+                page = pdf[i]
+                textpage = page.get_textpage()
+                pages.append((i, textpage.get_text_range()))
+                textpage.close()
+                page.close()
+            return pages
+        finally:
+            pdf.close()
+
+
+PDF_EXTRACTORS = {
+    PyPDFExtractor.name: PyPDFExtractor,
+    PyMuPDFExtractor.name: PyMuPDFExtractor,
+    PdfiumExtractor.name: PdfiumExtractor,
+}
+
+
+def get_pdf_extractor(name: str) -> PDFExtractor:
+    """Ritorna il motore di estrazione PDF per nome"""
+    try:
+        return PDF_EXTRACTORS[name.strip().lower()]()
+    except KeyError:
+        raise ValueError(
+            f"Motore estrazione PDF non supportato: {name} "
+            f"(disponibili: {', '.join(PDF_EXTRACTORS)})"
+        )
+
+
+class ParseCache:
+    """
+    Testo estratto dai PDF, per file (JSON gzip in PARSE_CACHE_DIR)
+    
+    La chiave comprende percorso, dimensione e data di modifica del PDF,
+    motori di estrazione e OCR: un manuale modificato viene rielaborato.
+    Dry run ripetuti e l'indicizzazione che li segue non ripetono il parsing.
+    """
+    
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+    
+    def _path(self, pdf_path: Path, variant: str) -> Path:
+        stat = pdf_path.stat()
+        key = f"{pdf_path.resolve()}|{stat.st_size}|{stat.st_mtime_ns}|{variant}"
+        return self.directory / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.json.gz"
+    
+    def get(self, pdf_path: Path, variant: str) -> Optional[List[Document]]:
+        """Pagine già estratte del PDF (None se assenti o non più valide)"""
+        path = self._path(pdf_path, variant)
+        if not path.exists():
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                pages = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️  Cache del testo non leggibile ({path.name}): {e}")
+            return None
+        return [Document(page_content=text, metadata=metadata) for metadata, text in pages]
+    
+    def put(self, pdf_path: Path, variant: str, documents: List[Document]):
+        """Salva le pagine estratte del PDF"""
+        path = self._path(pdf_path, variant)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump([[doc.metadata, doc.page_content] for doc in documents], f, ensure_ascii=False, default=str)
+        tmp_path.replace(path)
+
+
+class PageRange(NamedTuple):
+    """Unità di lavoro: intervallo di pagine [start, end) di un PDF"""
+    pdf_path: Path
+    start: int = 0
+    end: Optional[int] = None
+    ocr: bool = False
+
+
+def _load_page_range(task: tuple) -> List[Document]:
+    """Worker (processo separato): carica un intervallo di pagine"""
+    extractor, unit = task
+    processor = ManualProcessor(unit.pdf_path.parent, extractor=extractor, workers=1)
+    return processor.load_page_range(unit)
+
+
 class ManualProcessor:
     """Processa manuali PDF e li prepara per l'indicizzazione"""
     
-    def __init__(self, manuals_dir: Optional[Path] = None):
+    def __init__(
+        self,
+        manuals_dir: Optional[Path] = None,
+        extractor: Optional[str] = None,
+        workers: Optional[int] = None,
+        shard_pages: Optional[int] = None,
+        report: Optional[IngestionReport] = None,
+        parse_cache: Optional[bool] = None
+    ):
         self.manuals_dir = manuals_dir or settings.MANUALS_PATH
+        self.extractors = self._build_extractor_chain(extractor or settings.PDF_EXTRACTOR)
+        self.workers = max(1, workers or settings.INGEST_WORKERS)
+        self.shard_pages = shard_pages or settings.PDF_SHARD_PAGES
+        self.report = report or IngestionReport(live=False)
+        use_cache = settings.PARSE_CACHE_ENABLED if parse_cache is None else parse_cache
+        self.parse_cache = ParseCache(settings.PARSE_CACHE_DIR) if use_cache else None
+        self.report.config.update({
+            "pdf_extractor": self.extractors[0].name,
+            "ingest_workers": self.workers,
+            "pdf_shard_pages": self.shard_pages,
+        })
+        # Small-to-big: chunks piccoli nell'indice, il contesto si recupera in ricerca
+        if settings.SMALL_TO_BIG:
+            self.chunk_size, chunk_overlap = settings.SMALL_CHUNK_SIZE, settings.SMALL_CHUNK_OVERLAP
+        else:
+            self.chunk_size, chunk_overlap = settings.CHUNK_SIZE, settings.CHUNK_OVERLAP
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=settings.CHUNK_SIZE,
-            chunk_overlap=settings.CHUNK_OVERLAP,
+            chunk_size=self.chunk_size,
+            chunk_overlap=chunk_overlap,
             separators=settings.TEXT_SEPARATORS,
             length_function=len,
         )
@@ -54,29 +490,118 @@ class ManualProcessor:
         
         return metadata
     
-    def load_pdf(self, pdf_path: Path) -> List[Document]:
-        """Carica un singolo PDF"""
+    def manual_path(self, pdf_path: Path) -> str:
+        """Percorso del manuale relativo alla cartella dei manuali (chiave dei chunks)"""
+        try:
+            return Path(pdf_path).relative_to(self.manuals_dir).as_posix()
+        except ValueError:
+            return Path(pdf_path).as_posix()
+    
+    def _build_extractor_chain(self, primary: str) -> List[PDFExtractor]:
+        """Motore principale seguito dai fallback configurati (senza duplicati)"""
+        names = [primary] + [name for name in settings.PDF_EXTRACTOR_FALLBACK if name.strip()]
+        
+        extractors = []
+        for name in names:
+            extractor = get_pdf_extractor(name)
+            if extractor.name not in [e.name for e in extractors]:
+                extractors.append(extractor)
+        
+        return extractors
+    
+    def extract_pages(self, pdf_path: Path, start: int = 0, end: Optional[int] = None) -> tuple:
+        """
+        Estrae il testo pagina per pagina con fallback per-file
+        
+        Args:
+            pdf_path: File PDF
+            start: Prima pagina (0-based, inclusa)
+            end: Ultima pagina (esclusa), None = fino alla fine
+        
+        Returns:
+            Tupla (nome_motore, lista di (indice_pagina, testo))
+        """
+        last_error = None
+        
+        for extractor in self.extractors:
+            try:
+                return extractor.name, extractor.extract_pages(pdf_path, start, end)
+            except ImportError:
+                logger.warning(
+                    f"Motore PDF '{extractor.name}' non disponibile. "
+                    f"Installa: pip install {extractor.package}"
+                )
+                last_error = ImportError(extractor.name)
+            except Exception as e:
+                logger.warning(f"⚠️  Motore PDF '{extractor.name}' fallito su {pdf_path.name}: {e}")
+                last_error = e
+        
+        raise RuntimeError(f"Nessun motore PDF ha elaborato il file ({last_error})")
+    
+    def page_count(self, pdf_path: Path) -> Optional[int]:
+        """Numero di pagine del PDF (None se nessun motore riesce a leggerlo)"""
+        for extractor in self.extractors:
+            try:
+                return extractor.page_count(pdf_path)
+            except Exception:
+                continue
+        return None
+    
+    def plan_work_units(self, pdf_files: List[Path], ocr: bool = False) -> List[PageRange]:
+        """
+        Divide i PDF in intervalli di pagine da elaborare in parallelo
+        
+        I manuali più lunghi di shard_pages vengono spezzati, così nessun
+        singolo file monopolizza un worker. L'ordine è (file, pagina).
+        """
+        units = []
+        
+        for pdf_path in pdf_files:
+            total = self.page_count(pdf_path) if self.workers > 1 else None
+            
+            if not total or total <= self.shard_pages:
+                units.append(PageRange(pdf_path, 0, None, ocr))
+                continue
+            
+            for start in range(0, total, self.shard_pages):
+                units.append(PageRange(pdf_path, start, min(start + self.shard_pages, total), ocr))
+            
+            logger.info(f"✂️  {pdf_path.name}: {total} pagine divise in {-(-total // self.shard_pages)} parti")
+        
+        return units
+    
+    def load_page_range(self, unit: PageRange) -> List[Document]:
+        """Carica un'unità di lavoro (testo o OCR)"""
+        if unit.ocr:
+            return self.load_pdf_with_ocr(unit.pdf_path, unit.start, unit.end)
+        return self.load_pdf(unit.pdf_path, unit.start, unit.end)
+    
+    def load_pdf(self, pdf_path: Path, start: int = 0, end: Optional[int] = None) -> List[Document]:
+        """Carica un singolo PDF (o un intervallo di pagine)"""
         try:
             logger.info(f"Caricamento PDF: {pdf_path.name}")
             
-            loader = PyPDFLoader(str(pdf_path))
-            documents = loader.load()
+            extractor_name, pages = self.extract_pages(pdf_path, start, end)
             
             # Aggiungi metadata
             base_metadata = self.extract_metadata_from_filename(pdf_path.name)
+            base_metadata["file_path"] = str(pdf_path)
+            base_metadata["source"] = str(pdf_path)
+            base_metadata["extractor"] = extractor_name
             
-            for doc in documents:
-                doc.metadata.update(base_metadata)
-                doc.metadata["file_path"] = str(pdf_path)
+            documents = [
+                Document(page_content=text, metadata={**base_metadata, "page": page})
+                for page, text in pages
+            ]
             
-            logger.info(f"✅ Caricato {len(documents)} pagine da {pdf_path.name}")
+            logger.info(f"✅ Caricato {len(documents)} pagine da {pdf_path.name} ({extractor_name})")
             return documents
             
         except Exception as e:
             logger.error(f"❌ Errore caricamento {pdf_path.name}: {e}")
             return []
     
-    def load_pdf_with_ocr(self, pdf_path: Path) -> List[Document]:
+    def load_pdf_with_ocr(self, pdf_path: Path, start: int = 0, end: Optional[int] = None) -> List[Document]:
         """
         Carica PDF usando OCR (per PDF scansionati)
         Richiede: pytesseract e pdf2image
@@ -87,7 +612,7 @@ class ManualProcessor:
             
             logger.info(f"Caricamento PDF con OCR: {pdf_path.name}")
             
-            images = convert_from_path(str(pdf_path))
+            images = convert_from_path(str(pdf_path), first_page=start + 1, last_page=end)
             documents = []
             
             base_metadata = self.extract_metadata_from_filename(pdf_path.name)
@@ -102,7 +627,7 @@ class ManualProcessor:
                         page_content=text,
                         metadata={
                             **base_metadata,
-                            "page": i + 1,
+                            "page": start + i + 1,
                             "source": str(pdf_path)
                         }
                     )
@@ -113,7 +638,7 @@ class ManualProcessor:
             
         except ImportError:
             logger.warning("OCR non disponibile. Installa: pip install pdf2image pytesseract")
-            return self.load_pdf(pdf_path)
+            return self.load_pdf(pdf_path, start, end)
         except Exception as e:
             logger.error(f"❌ Errore OCR {pdf_path.name}: {e}")
             return []
@@ -150,63 +675,163 @@ class ManualProcessor:
             logger.warning(f"Impossibile estrarre tabelle da {pdf_path.name}: {e}")
             return []
     
-    def process_all_manuals(self, use_ocr: bool = None) -> List[Document]:
+    def process_all_manuals(self, use_ocr: bool = None) -> ChunkStore:
         """
         Processa tutti i manuali nella directory
         
         Args:
             use_ocr: Se True usa OCR, se False usa estrazione testo normale,
                     se None decide automaticamente
+        
+        Returns:
+            ChunkStore con una riga per pagina
         """
         if use_ocr is None:
             use_ocr = settings.ENABLE_OCR
         
-        all_documents = []
-        pdf_files = list(self.manuals_dir.glob("**/*.pdf"))
+        report = self.report
+        all_documents = ChunkStore()
+        
+        with report.stage("discovery"):
+            pdf_files = list(self.manuals_dir.glob("**/*.pdf"))
+            report.incr("files", len(pdf_files))
         
         if not pdf_files:
             logger.warning(f"⚠️  Nessun PDF trovato in {self.manuals_dir}")
             logger.info(f"💡 Aggiungi i tuoi manuali in: {self.manuals_dir}")
-            return []
+            return all_documents
         
         logger.info(f"\n📚 Trovati {len(pdf_files)} manuali da processare\n")
         
-        for pdf_path in pdf_files:
+        # Testo già estratto (es. da un dry run): questi PDF non vengono riletti
+        variant = f"{','.join(e.name for e in self.extractors)}|ocr={use_ocr}|{settings.OCR_LANGUAGE}"
+        to_parse = pdf_files
+        if self.parse_cache is not None:
+            to_parse = []
+            for pdf_path in pdf_files:
+                docs = self.parse_cache.get(pdf_path, variant)
+                if docs is None:
+                    to_parse.append(pdf_path)
+                    continue
+                report.incr("files_cached")
+                report.incr("pages_cached", len(docs))
+                for doc in docs:
+                    doc.metadata["manual"] = self.manual_path(pdf_path)
+                all_documents.extend_documents(docs)
+            if len(to_parse) < len(pdf_files):
+                logger.info(f"♻️  Testo in cache per {len(pdf_files) - len(to_parse)} manuali")
+        
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 and to_parse else None
+        
+        try:
             # Prova prima estrazione normale
-            docs = self.load_pdf(pdf_path)
+            with report.stage("discovery"):
+                units = self.plan_work_units(to_parse)
+            results = report.timed_iter("parse", self._run_units(units, executor))
             
-            # Se OCR è abilitato e il testo estratto è scarso, usa OCR
-            if use_ocr and docs:
-                avg_length = sum(len(doc.page_content) for doc in docs) / len(docs)
-                if avg_length < 100:  # Testo troppo scarso, probabilmente scansionato
-                    logger.info(f"📄 PDF scansionato rilevato, uso OCR...")
-                    docs = self.load_pdf_with_ocr(pdf_path)
+            for pdf_path, docs in self._merge_by_file(units, results):
+                if not docs:
+                    report.record_failure("parse", pdf_path.name, "nessuna pagina estratta")
+                report.incr("pages_parsed", len(docs))
+                manual = self.manual_path(pdf_path)
             
-            all_documents.extend(docs)
+                # Se OCR è abilitato e il testo estratto è scarso, usa OCR
+                if use_ocr and docs:
+                    avg_length = sum(len(doc.page_content) for doc in docs) / len(docs)
+                    if avg_length < 100:  # Testo troppo scarso, probabilmente scansionato
+                        logger.info(f"📄 PDF scansionato rilevato, uso OCR...")
+                        with report.stage("ocr"):
+                            ocr_units = self.plan_work_units([pdf_path], ocr=True)
+                            docs = [
+                                doc
+                                for _, ocr_docs in self._merge_by_file(ocr_units, self._run_units(ocr_units, executor))
+                                for doc in ocr_docs
+                            ]
+                            report.incr("pages_ocr", len(docs))
             
-            # Estrai tabelle (opzionale)
-            if settings.EXTRACT_TABLES:
-                tables = self.extract_tables(pdf_path)
-                # TODO: Converti tabelle in Documents e aggiungi
+                for doc in docs:
+                    doc.metadata["manual"] = manual
+                all_documents.extend_documents(docs)
+                if self.parse_cache is not None and docs:
+                    self.parse_cache.put(pdf_path, variant, docs)
+                
+                # Estrai tabelle (opzionale)
+                if settings.EXTRACT_TABLES:
+                    with report.stage("tables"):
+                        tables = self.extract_tables(pdf_path)
+                        report.incr("tables", len(tables))
+                    # TODO: Converti tabelle in Documents e aggiungi
+        finally:
+            if executor is not None:
+                executor.shutdown()
         
         logger.info(f"\n✅ Totale documenti caricati: {len(all_documents)}")
         return all_documents
     
-    def split_documents(self, documents: List[Document]) -> List[Document]:
-        """Divide i documenti in chunks"""
+    def _run_units(self, units: List[PageRange], executor: Optional[ProcessPoolExecutor]) -> Iterator[List[Document]]:
+        """Esegue le unità di lavoro (in parallelo se c'è un executor), risultati in ordine"""
+        if executor is None:
+            return map(self.load_page_range, units)
+        
+        extractor = self.extractors[0].name
+        return executor.map(_load_page_range, [(extractor, unit) for unit in units])
+    
+    @staticmethod
+    def _merge_by_file(units: List[PageRange], results: Iterator[List[Document]]) -> Iterator[tuple]:
+        """Riunisce i risultati delle unità consecutive dello stesso file in ordine di pagina"""
+        current_path = None
+        current_docs = []
+        
+        for unit, docs in zip(units, results):
+            if unit.pdf_path != current_path:
+                if current_path is not None:
+                    yield current_path, current_docs
+                current_path, current_docs = unit.pdf_path, []
+            current_docs.extend(docs)
+        
+        if current_path is not None:
+            yield current_path, current_docs
+    
+    def split_documents(
+        self,
+        documents: Union[ChunkStore, List[Document]]
+    ) -> Union[ChunkStore, List[Document]]:
+        """Divide i documenti in chunks (ChunkStore in ingresso -> ChunkStore in uscita)"""
         logger.info(f"🔪 Suddivisione documenti in chunks...")
         
-        chunks = self.text_splitter.split_documents(documents)
+        with self.report.stage("split"):
+            if isinstance(documents, ChunkStore):
+                chunks = documents.split(self.text_splitter)
+            else:
+                chunks = self.text_splitter.split_documents(documents)
+            self.report.incr("chunks", len(chunks))
         
-        logger.info(f"✅ Creati {len(chunks)} chunks (dimensione media: {settings.CHUNK_SIZE} caratteri)")
+        logger.info(f"✅ Creati {len(chunks)} chunks (dimensione media: {self.chunk_size} caratteri)")
         return chunks
     
-    def process_and_split(self, use_ocr: bool = None) -> List[Document]:
+    def build_chunk_adjacency(
+        self,
+        chunks: ChunkStore,
+        adjacency: Optional[ChunkAdjacency] = None
+    ) -> ChunkAdjacency:
+        """
+        Indice di adiacenza dei chunks (posizione nel manuale e pagine)
+        
+        Args:
+            adjacency: Indice esistente da aggiornare (i manuali presenti
+                       in `chunks` vengono sostituiti)
+        """
+        adjacency = adjacency if adjacency is not None else ChunkAdjacency()
+        adjacency.add_store(chunks)
+        logger.info(f"🧭 Indice di adiacenza: {len(adjacency)} manuali")
+        return adjacency
+    
+    def process_and_split(self, use_ocr: bool = None) -> ChunkStore:
         """Pipeline completa: carica e divide tutti i manuali"""
         documents = self.process_all_manuals(use_ocr=use_ocr)
         
         if not documents:
-            return []
+            return documents
         
         chunks = self.split_documents(documents)
         return chunks
@@ -239,7 +864,7 @@ class ManualProcessor:
 
 
 # Utility functions
-def preview_chunks(chunks: List[Document], n: int = 3):
+def preview_chunks(chunks: Union[ChunkStore, List[Document]], n: int = 3):
     """Visualizza un'anteprima dei primi n chunks"""
     print(f"\n{'='*80}")
     print(f"ANTEPRIMA CHUNKS (primi {n})")
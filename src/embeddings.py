@@ -0,0 +1,269 @@
+"""
+Provider di embedding: OpenAI (API) o modello locale su CPU
+"""
+import json
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Dimensioni dei modelli OpenAI più comuni
+OPENAI_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+
+class EmbeddingBatcher:
+    """
+    Raggruppa le richieste di embedding concorrenti in un unico batch
+    
+    Un thread in background raccoglie le query in coda (fino a
+    max_batch_size) e le calcola con una sola chiamata al modello. Con
+    max_wait_ms=0 non aggiunge latenza: una query isolata parte subito,
+    sotto carico le richieste arrivate nel frattempo vengono accorpate.
+    """
+    
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 0.0
+    ):
+        self.embed_fn = embed_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    def submit(self, text: str) -> List[float]:
+        """Embedding di un testo (bloccante)"""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+        
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future.result()
+    
+    def _collect(self) -> list:
+        """Prima richiesta in coda più quelle arrivate entro max_wait"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                vectors = self.embed_fn([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            self.batches += 1
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    Embedding con sentence-transformers su CPU
+    Richiede: sentence-transformers (backend onnx: sentence-transformers[onnx])
+    
+    Con il backend torch i layer lineari vengono quantizzati int8
+    (quantizzazione dinamica); con il backend onnx si può indicare un
+    modello ONNX già quantizzato (es. onnx/model_qint8_avx2.onnx).
+    """
+    
+    def __init__(
+        self,
+        model_name: str = None,
+        backend: str = None,
+        quantize: bool = None,
+        onnx_file: str = None,
+        batch_size: int = None,
+        max_wait_ms: float = None
+    ):
+        self.model_name = model_name or settings.LOCAL_EMBEDDING_MODEL
+        self.backend = backend or settings.LOCAL_EMBEDDING_BACKEND
+        self.quantize = settings.LOCAL_EMBEDDING_QUANTIZE if quantize is None else quantize
+        self.batch_size = batch_size or settings.LOCAL_EMBEDDING_BATCH_SIZE
+        
+        self.model = self._load_model(onnx_file if onnx_file is not None else settings.LOCAL_EMBEDDING_ONNX_FILE)
+        self.batcher = EmbeddingBatcher(
+            self._encode,
+            max_batch_size=self.batch_size,
+            max_wait_ms=settings.LOCAL_EMBEDDING_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms
+        )
+    
+    def _load_model(self, onnx_file: str):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            logger.error("Embedding locali non disponibili. Installa: pip install sentence-transformers")
+            raise
+        
+        logger.info(f"🧠 Caricamento modello di embedding locale {self.model_name} ({self.backend})...")
+        
+        if self.backend == "onnx":
+            model_kwargs = {"file_name": onnx_file} if onnx_file else None
+            model = SentenceTransformer(self.model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+        else:
+            model = SentenceTransformer(self.model_name, device="cpu")
+            if self.quantize:
+                import torch
+                
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        
+        logger.info(f"✅ Modello caricato (dimensione {model.get_sentence_embedding_dimension()})")
+        return model
+    
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+    
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return vectors.tolist()
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(list(texts))
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self.batcher.submit(text)
+    
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embedding di più query in un batch (stessa codifica di embed_query)"""
+        return self._encode(list(texts))
+
+
+def embed_queries(embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Embedding di più query con la semantica di embed_query
+    
+    Usa il metodo batch per le query del provider se presente; OpenAI
+    non distingue query e documenti (embed_query è embed_documents di
+    un solo testo), quindi il batch va in una sola richiesta. Per gli
+    altri provider una chiamata embed_query per query.
+    """
+    texts = list(texts)
+    batch = getattr(embeddings, "embed_queries", None)
+    if callable(batch):
+        return batch(texts)
+    
+    try:
+        from langchain_openai import OpenAIEmbeddings
+    except ImportError:
+        OpenAIEmbeddings = None
+    if OpenAIEmbeddings is not None and isinstance(embeddings, OpenAIEmbeddings):
+        return embeddings.embed_documents(texts)
+    
+    return [embeddings.embed_query(text) for text in texts]
+
+
+def embedding_model_name() -> str:
+    """Nome del modello di embedding configurato"""
+    if settings.EMBEDDING_PROVIDER == "local":
+        return settings.LOCAL_EMBEDDING_MODEL
+    return settings.EMBEDDING_MODEL
+
+
+def embedding_dimension(embeddings) -> int:
+    """Dimensione dei vettori prodotti da un provider"""
+    dimension = getattr(embeddings, "dimension", None) or getattr(embeddings, "dimensions", None)
+    if dimension:
+        return dimension
+    return OPENAI_DIMENSIONS.get(getattr(embeddings, "model", None), settings.EMBEDDING_DIMENSION)
+
+
+def local_embedding_dimension(model_name: str) -> Optional[int]:
+    """
+    Dimensione di un modello sentence-transformers dai suoi file di
+    configurazione (directory locale o cache Hugging Face), senza
+    caricarlo né scaricarlo; None se i file non sono disponibili
+    """
+    def read(filename: str) -> Optional[dict]:
+        path = Path(model_name) / filename
+        if not path.is_file():
+            try:
+                from huggingface_hub import try_to_load_from_cache
+            except ImportError:
+                return None
+            cached = try_to_load_from_cache(model_name, filename)
+            if not isinstance(cached, str):
+                return None
+            path = Path(cached)
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    
+    dimension = None
+    # Dimensione dell'ultimo modulo che la dichiara (pooling, poi eventuali Dense)
+    for module in read("modules.json") or []:
+        config = read(f"{module['path']}/config.json") if module.get("path") else None
+        if config:
+            dimension = config.get("out_features", config.get("word_embedding_dimension", dimension))
+    return dimension
+
+
+def configured_embedding_dimension() -> int:
+    """Dimensione dei vettori del provider configurato, senza crearlo (stime offline)"""
+    if settings.EMBEDDING_PROVIDER == "local":
+        return local_embedding_dimension(settings.LOCAL_EMBEDDING_MODEL) or settings.EMBEDDING_DIMENSION
+    return OPENAI_DIMENSIONS.get(settings.EMBEDDING_MODEL, settings.EMBEDDING_DIMENSION)
+
+
+def get_embeddings() -> Embeddings:
+    """
+    Crea il provider di embedding configurato (EMBEDDING_PROVIDER)
+    
+    Per riusare lo stesso client nel processo usare
+    src.clients.get_embedding_client().
+    """
+    if settings.EMBEDDING_PROVIDER == "local":
+        return LocalEmbeddings()
+    
+    if settings.EMBEDDING_PROVIDER == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        
+        return OpenAIEmbeddings(
+            model=settings.EMBEDDING_MODEL,
+            openai_api_key=settings.OPENAI_API_KEY,
+            request_timeout=settings.EMBEDDING_TIMEOUT,
+            max_retries=settings.CLIENT_MAX_RETRIES
+        )
+    
+    raise ValueError(f"Provider di embedding non supportato: {settings.EMBEDDING_PROVIDER}")
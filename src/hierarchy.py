@@ -0,0 +1,253 @@
+"""
+Retrieval gerarchico: vettori riassuntivi per manuale e per sezione
+"""
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config import settings
+from src.compression import normalize
+
+logger = logging.getLogger(__name__)
+
+
+# Campi dei manuali su cui il primo stadio sa applicare i filtri
+SUMMARY_FIELDS = ("marca", "modello", "anno")
+
+# Sezione delle voci che riassumono l'intero manuale
+WHOLE_MANUAL = -1
+
+
+class SummaryBuilder:
+    """
+    Accumula gli embedding dei chunks durante l'indicizzazione
+    
+    Il vettore riassuntivo di un manuale (e di ogni sezione di
+    section_pages pagine) è il centroide normalizzato degli embedding dei
+    suoi chunks: non servono chiamate aggiuntive al modello.
+    """
+    
+    def __init__(self, section_pages: int = 10):
+        self.section_pages = max(1, section_pages)
+        # {(filename, sezione): [somma, numero di chunks, metadata]}
+        self._sums: Dict[tuple, list] = {}
+    
+    def add(self, metadatas: Sequence[Dict], vectors: Sequence[Sequence[float]]):
+        """Aggiunge gli embedding di un batch di chunks"""
+        for metadata, vector in zip(metadatas, vectors):
+            filename = metadata.get("filename")
+            if not filename:
+                continue
+            
+            vector = np.asarray(vector, dtype=np.float32)
+            page = metadata.get("page")
+            sections = [WHOLE_MANUAL]
+            if page is not None:
+                sections.append(int(page) // self.section_pages)
+            
+            for section in sections:
+                entry = self._sums.get((filename, section))
+                if entry is None:
+                    fields = {field: metadata.get(field) for field in SUMMARY_FIELDS}
+                    self._sums[(filename, section)] = [vector.copy(), 1, fields]
+                else:
+                    entry[0] += vector
+                    entry[1] += 1
+    
+    def build(self) -> "SummaryIndex":
+        """Indice dei vettori riassuntivi accumulati"""
+        if not self._sums:
+            return SummaryIndex()
+        
+        entries = []
+        vectors = []
+        for (filename, section), (total, count, fields) in self._sums.items():
+            entries.append({"filename": filename, "section": section, "chunks": count, **fields})
+            vectors.append(total / count)
+        
+        return SummaryIndex(normalize(np.vstack(vectors)), entries)
+
+
+class SummaryIndex:
+    """
+    Indice locale dei vettori riassuntivi (manuali e sezioni)
+    
+    Primo stadio del retrieval gerarchico: la query viene confrontata con
+    pochi vettori per manuale e i manuali migliori restringono la ricerca
+    sui chunks nell'indice Pinecone.
+    """
+    
+    def __init__(self, vectors: Optional[np.ndarray] = None, entries: Optional[List[Dict]] = None):
+        self.vectors = vectors if vectors is not None else np.zeros((0, 0), dtype=np.float32)
+        self.entries: List[Dict] = entries or []
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    @property
+    def manuals(self) -> int:
+        return sum(1 for entry in self.entries if entry["section"] == WHOLE_MANUAL)
+    
+    def merge(self, other: "SummaryIndex"):
+        """Aggiunge le voci di un altro indice (sostituisce i manuali già presenti)"""
+        if not len(other):
+            return
+        if len(self) and self.vectors.shape[1] != other.vectors.shape[1]:
+            logger.warning("⚠️  Dimensione dei vettori riassuntivi cambiata: indice ricostruito")
+            self.clear()
+        
+        replaced = {entry["filename"] for entry in other.entries}
+        keep = [i for i, entry in enumerate(self.entries) if entry["filename"] not in replaced]
+        self.entries = [self.entries[i] for i in keep] + list(other.entries)
+        self.vectors = np.vstack([self.vectors[keep], other.vectors]) if keep else other.vectors
+    
+    def remove(self, filter_dict: Dict):
+        """Rimuove i manuali che corrispondono a un filtro di uguaglianza su marca/modello/anno"""
+        if set(filter_dict) - set(SUMMARY_FIELDS) or not all(
+            isinstance(value, (str, int)) for value in filter_dict.values()
+        ):
+            return
+        
+        keep = [i for i, entry in enumerate(self.entries) if not _matches(entry, _allowed_values(filter_dict))]
+        self.entries = [self.entries[i] for i in keep]
+        self.vectors = self.vectors[keep] if keep else np.zeros((0, 0), dtype=np.float32)
+    
+    def clear(self):
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.entries = []
+    
+    def candidates(
+        self,
+        embedding: Sequence[float],
+        top_manuals: int = 3,
+        filter_dict: Optional[Dict] = None
+    ) -> Optional[List[Dict]]:
+        """
+        Manuali più vicini alla query (score = miglior voce del manuale)
+        
+        Args:
+            filter_dict: Filtro della ricerca; sono supportati uguaglianza,
+                         $eq e $in su marca/modello/anno
+        
+        Returns:
+            Lista di {"filename", "marca", "score"}, None se l'indice è
+            vuoto o il filtro non è applicabile (ricerca piatta)
+        """
+        allowed = _allowed_values(filter_dict or {})
+        if allowed is None or not len(self):
+            return None
+        
+        query = normalize(np.asarray(embedding, dtype=np.float32))
+        if query.shape[0] != self.vectors.shape[1]:
+            logger.warning("⚠️  Indice riassuntivo con dimensione diversa dagli embedding: ignorato")
+            return None
+        
+        scores = self.vectors @ query
+        manuals: Dict[str, Dict] = {}
+        for i in np.argsort(-scores):
+            entry = self.entries[i]
+            if entry["filename"] in manuals or not _matches(entry, allowed):
+                continue
+            manuals[entry["filename"]] = {
+                "filename": entry["filename"],
+                "marca": entry.get("marca"),
+                "score": float(scores[i]),
+            }
+            if len(manuals) >= top_manuals:
+                break
+        
+        return list(manuals.values())
+    
+    def save(self, path: Optional[Path] = None):
+        """Salva l'indice su disco (npz)"""
+        path = Path(path or settings.SUMMARY_INDEX_PATH)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp.npz")
+        np.savez(tmp_path, vectors=self.vectors, entries=np.array(json.dumps(self.entries, ensure_ascii=False)))
+        tmp_path.replace(path)
+    
+    @classmethod
+    def load(cls, path: Optional[Path] = None) -> "SummaryIndex":
+        """Carica l'indice da disco (vuoto se il file non esiste)"""
+        path = Path(path or settings.SUMMARY_INDEX_PATH)
+        if not path.exists():
+            return cls()
+        try:
+            with np.load(path) as data:
+                return cls(data["vectors"].astype(np.float32), json.loads(str(data["entries"])))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️  Indice riassuntivo non leggibile ({path}): {e}")
+            return cls()
+
+
+def _allowed_values(filter_dict: Dict) -> Optional[Dict[str, set]]:
+    """Valori ammessi per campo (None se il filtro usa campi o operatori non supportati)"""
+    allowed = {}
+    for field, value in filter_dict.items():
+        if field not in SUMMARY_FIELDS:
+            return None
+        if isinstance(value, dict):
+            if set(value) == {"$eq"}:
+                values = [value["$eq"]]
+            elif set(value) == {"$in"}:
+                values = list(value["$in"])
+            else:
+                return None
+        else:
+            values = [value]
+        allowed[field] = {str(v).upper() if field == "marca" else str(v) for v in values}
+    return allowed
+
+
+def _matches(entry: Dict, allowed: Dict[str, set]) -> bool:
+    for field, values in allowed.items():
+        value = entry.get(field)
+        if value is None:
+            return False
+        if (str(value).upper() if field == "marca" else str(value)) not in values:
+            return False
+    return True
+
+
+_summaries: Optional[SummaryIndex] = None
+_summaries_mtime: Optional[float] = None
+_summaries_lock = threading.Lock()
+
+
+def get_summary_index() -> SummaryIndex:
+    """Indice riassuntivo condiviso dal processo (ricaricato se il file cambia)"""
+    global _summaries, _summaries_mtime
+    
+    path = Path(settings.SUMMARY_INDEX_PATH)
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        mtime = None
+    
+    if _summaries is None or mtime != _summaries_mtime:
+        with _summaries_lock:
+            if _summaries is None or mtime != _summaries_mtime:
+                _summaries = SummaryIndex.load(path)
+                _summaries_mtime = mtime
+    
+    return _summaries
+
+
+def update_summary_index(update) -> SummaryIndex:
+    """Applica una modifica all'indice riassuntivo condiviso e lo salva su disco"""
+    global _summaries_mtime
+    
+    summaries = get_summary_index()
+    with _summaries_lock:
+        update(summaries)
+        summaries.save()
+        try:
+            _summaries_mtime = Path(settings.SUMMARY_INDEX_PATH).stat().st_mtime
+        except OSError:
+            _summaries_mtime = None
+    
+    return summaries
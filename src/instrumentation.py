@@ -0,0 +1,366 @@
+"""
+Strumentazione della pipeline di indicizzazione e delle query (tempi per fase e contatori)
+"""
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from config import settings
+from src.metrics import CACHE_REQUESTS, STAGE_SECONDS
+from src.tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+# Fasi della pipeline, nell'ordine in cui vengono riportate
+INGESTION_STAGES = ["discovery", "parse", "ocr", "tables", "split", "embed", "upsert"]
+
+
+_ENCODINGS: Dict[str, object] = {}
+_encodings_lock = threading.Lock()
+
+
+def _load_encoding(model: str):
+    import tiktoken
+    
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def _refuse_download(blobpath: str):
+    raise ConnectionError(f"download disattivato ({blobpath})")
+
+
+def _get_encoding(model: str, download: bool = True):
+    """
+    Tokenizer tiktoken del modello (None se non disponibile, es. offline)
+    
+    Con download=False si usano solo i file BPE già nella cache di tiktoken
+    (TIKTOKEN_CACHE_DIR): nessuna chiamata di rete, altrimenti None.
+    """
+    if _ENCODINGS.get(model) is not None:
+        return _ENCODINGS[model]
+    
+    key = model if download else f"{model}:offline"
+    if key not in _ENCODINGS:
+        with _encodings_lock:
+            try:
+                if download:
+                    _ENCODINGS[key] = _load_encoding(model)
+                else:
+                    import tiktoken.load
+                    
+                    # tiktoken scarica i file BPE mancanti con read_file: qui viene rifiutato
+                    read_file = tiktoken.load.read_file
+                    tiktoken.load.read_file = _refuse_download
+                    try:
+                        _ENCODINGS[key] = _load_encoding(model)
+                    finally:
+                        tiktoken.load.read_file = read_file
+            except ImportError:
+                _ENCODINGS[key] = None
+            except Exception as e:
+                logger.warning(f"Tokenizer {model} non disponibile, uso stima: {e}")
+                _ENCODINGS[key] = None
+    return _ENCODINGS[key]
+
+
+def count_tokens(texts: Iterable[str], model: str = "text-embedding-ada-002", download: bool = True) -> int:
+    """
+    Conta i token con il tokenizer del modello di embedding
+    Richiede: tiktoken (stima 4 caratteri/token se non disponibile o,
+    con download=False, se il tokenizer non è già in cache locale)
+    """
+    texts = list(texts)
+    encoding = _get_encoding(model, download)
+    
+    if encoding is None:
+        return sum(len(text) for text in texts) // 4
+    
+    return sum(len(tokens) for tokens in encoding.encode_batch(texts, disallowed_special=()))
+
+
+class IngestionReport:
+    """
+    Raccoglie tempi per fase e contatori di un'esecuzione di indicizzazione
+    
+    I tempi di ogni fase vengono accumulati (una fase può essere eseguita
+    più volte, es. una volta per file) e mostrati nel log al termine di
+    ogni esecuzione se live=True. Il report completo può essere salvato
+    in JSON per confrontare il throughput tra esecuzioni.
+    """
+    
+    def __init__(self, live: bool = True):
+        self.live = live
+        self.started_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        self.status = "running"
+        self.stages: Dict[str, Dict[str, float]] = {
+            stage: {"seconds": 0.0, "calls": 0} for stage in INGESTION_STAGES
+        }
+        self.counters: Dict[str, int] = {
+            "files": 0,
+            "pages_parsed": 0,
+            "pages_ocr": 0,
+            "tables": 0,
+            "chunks": 0,
+            "embedding_calls": 0,
+            "embedding_tokens": 0,
+            "upsert_batches": 0,
+            "vectors_upserted": 0,
+            "failures": 0,
+        }
+        self.failures: List[Dict[str, str]] = []
+        self.config: Dict = {
+            "pdf_extractor": settings.PDF_EXTRACTOR,
+            "ingest_workers": settings.INGEST_WORKERS,
+            "pdf_shard_pages": settings.PDF_SHARD_PAGES,
+            "chunk_size": settings.CHUNK_SIZE,
+            "chunk_overlap": settings.CHUNK_OVERLAP,
+        }
+        self.extra: Dict = {}
+    
+    def add_time(self, stage: str, seconds: float, calls: int = 1):
+        """Accumula tempo su una fase"""
+        entry = self.stages.setdefault(stage, {"seconds": 0.0, "calls": 0})
+        entry["seconds"] += seconds
+        entry["calls"] += calls
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Context manager che misura una fase"""
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - start
+            self.add_time(name, elapsed)
+            if self.live:
+                logger.info(
+                    f"⏱️  {name}: {elapsed:.2f}s "
+                    f"(totale {self.stages[name]['seconds']:.2f}s) | {self._counters_summary()}"
+                )
+    
+    def timed_iter(self, name: str, iterable: Iterable) -> Iterator:
+        """Itera misurando solo il tempo speso ad attendere ogni elemento"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, time.perf_counter() - start, calls=0)
+                return
+            self.add_time(name, time.perf_counter() - start)
+            yield item
+    
+    def incr(self, counter: str, n: int = 1):
+        """Incrementa un contatore"""
+        self.counters[counter] = self.counters.get(counter, 0) + n
+    
+    def record_failure(self, stage: str, item: str, error):
+        """Registra un errore (file o batch) senza interrompere il report"""
+        self.incr("failures")
+        self.failures.append({"stage": stage, "item": str(item), "error": str(error)})
+        if self.live:
+            logger.warning(f"⚠️  Errore in {stage} ({item}): {error}")
+    
+    def finish(self, status: str = "completed"):
+        """Chiude il report"""
+        self.finished_at = datetime.now()
+        self.status = status
+    
+    def _counters_summary(self) -> str:
+        keys = ["files", "pages_parsed", "pages_ocr", "chunks", "embedding_tokens", "upsert_batches", "failures"]
+        return ", ".join(f"{key}={self.counters.get(key, 0)}" for key in keys)
+    
+    def to_dict(self) -> Dict:
+        """Report in formato serializzabile"""
+        finished_at = self.finished_at or datetime.now()
+        duration = (finished_at - self.started_at).total_seconds()
+        
+        def rate(counter: str, stage: str) -> Optional[float]:
+            seconds = self.stages.get(stage, {}).get("seconds", 0.0)
+            return round(self.counters.get(counter, 0) / seconds, 2) if seconds else None
+        
+        return {
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": finished_at.isoformat(),
+            "duration_seconds": round(duration, 3),
+            "stages": {
+                name: {"seconds": round(entry["seconds"], 3), "calls": entry["calls"]}
+                for name, entry in self.stages.items()
+            },
+            "counters": dict(self.counters),
+            "throughput": {
+                "pages_per_sec_parse": rate("pages_parsed", "parse"),
+                "pages_per_sec_ocr": rate("pages_ocr", "ocr"),
+                "tokens_per_sec_embed": rate("embedding_tokens", "embed"),
+                "vectors_per_sec_upsert": rate("vectors_upserted", "upsert"),
+            },
+            "config": dict(self.config),
+            "failures": self.failures,
+            **self.extra,
+        }
+    
+    def save(self, path: Optional[Path] = None) -> Path:
+        """Salva il report JSON (default: logs/ingestion/run_<timestamp>.json)"""
+        if path is None:
+            path = (
+                settings.BASE_DIR / "logs" / "ingestion"
+                / f"run_{self.started_at.strftime('%Y%m%d_%H%M%S')}.json"
+            )
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict(), indent=2, ensure_ascii=False), encoding="utf-8")
+        return path
+
+
+def load_latest_report(reports_dir: Optional[Path] = None) -> Optional[Dict]:
+    """Ultimo report completato con throughput di embed/upsert misurato"""
+    reports_dir = Path(reports_dir or settings.BASE_DIR / "logs" / "ingestion")
+    
+    for path in sorted(reports_dir.glob("run_*.json"), reverse=True):
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        
+        throughput = data.get("throughput", {})
+        if data.get("status") == "completed" and throughput.get("tokens_per_sec_embed"):
+            data["_path"] = str(path)
+            return data
+    
+    return None
+
+
+def estimate_indexing(
+    chunks,
+    report: IngestionReport,
+    reference: Optional[Dict] = None,
+    dimension: Optional[int] = None
+) -> Dict:
+    """
+    Stima token, vettori, dimensione indice, costo e tempo di un'indicizzazione
+    
+    Il tempo di parsing/split è quello misurato nel report corrente; i tempi
+    di embedding e upsert usano il throughput di un'esecuzione precedente
+    (reference), se disponibile. Con il provider locale il costo API è nullo.
+    
+    La dimensione dei vettori è quella salvata nell'indice: quella del
+    provider configurato (o dimension), ridotta da VECTOR_COMPRESSION.
+    """
+    from src.compression import VectorReducer
+    from src.embeddings import configured_embedding_dimension, embedding_model_name
+    
+    model = embedding_model_name()
+    cost_per_1k = 0.0 if settings.EMBEDDING_PROVIDER == "local" else settings.EMBEDDING_COST_PER_1K_TOKENS
+    
+    texts = (chunks.text(i) for i in range(len(chunks))) if hasattr(chunks, "text") else (
+        doc.page_content for doc in chunks
+    )
+    # Nessuna chiamata di rete: senza tokenizer in cache locale si stima
+    tokens = count_tokens(texts, model, download=False)
+    vectors = len(chunks)
+    
+    # Metadata salvati con ogni vettore (con il docstore solo i campi filtrabili, senza testo)
+    def index_payload(doc) -> Dict:
+        if settings.DOCSTORE_ENABLED:
+            return {key: doc.metadata[key] for key in settings.INDEX_METADATA_FIELDS if key in doc.metadata}
+        return {**doc.metadata, "text": doc.page_content}
+    
+    metadata_bytes = sum(
+        len(json.dumps(index_payload(doc), ensure_ascii=False).encode("utf-8"))
+        for doc in chunks
+    )
+    reducer = VectorReducer(settings.VECTOR_COMPRESSION, settings.VECTOR_COMPRESSION_DIM)
+    index_dimension = reducer.output_dim(dimension or configured_embedding_dimension())
+    vector_bytes = vectors * index_dimension * 4
+    
+    local_stages = ["discovery", "parse", "ocr", "tables", "split"]
+    parse_seconds = sum(report.stages.get(stage, {}).get("seconds", 0.0) for stage in local_stages)
+    
+    throughput = (reference or {}).get("throughput", {})
+    embed_rate = throughput.get("tokens_per_sec_embed")
+    upsert_rate = throughput.get("vectors_per_sec_upsert")
+    embed_seconds = tokens / embed_rate if embed_rate else None
+    upsert_seconds = vectors / upsert_rate if upsert_rate else None
+    
+    total_seconds = None
+    if embed_seconds is not None and upsert_seconds is not None:
+        total_seconds = parse_seconds + embed_seconds + upsert_seconds
+    
+    return {
+        "embedding_model": model,
+        "embedding_tokens": tokens,
+        "vectors": vectors,
+        "avg_tokens_per_chunk": round(tokens / vectors, 1) if vectors else 0,
+        "index_dimension": index_dimension,
+        "index_vector_bytes": vector_bytes,
+        "index_metadata_bytes": metadata_bytes,
+        "index_total_bytes": vector_bytes + metadata_bytes,
+        "api_cost_usd": round(tokens / 1000 * cost_per_1k, 4),
+        "parse_seconds": round(parse_seconds, 2),
+        "embed_seconds": round(embed_seconds, 2) if embed_seconds is not None else None,
+        "upsert_seconds": round(upsert_seconds, 2) if upsert_seconds is not None else None,
+        "total_seconds": round(total_seconds, 2) if total_seconds is not None else None,
+        "throughput_reference": (reference or {}).get("_path"),
+    }
+
+
+# Tempi della richiesta in corso (None fuori da request_timings)
+_request_timings: ContextVar[Optional[Dict]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def request_timings():
+    """
+    Raccoglie tempi per fase e uso delle cache di una richiesta (domanda)
+    
+    Le fasi misurate con query_stage() e le cache registrate con
+    record_cache() nel contesto della richiesta finiscono nel dict
+    restituito: {"stages": {fase: ms}, "cache": {cache: "hit"/"miss"}}.
+    """
+    timings = {"stages": {}, "cache": {}}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def record_stage(name: str, seconds: float):
+    """Accumula tempo su una fase della richiesta corrente (e nell'istogramma della fase)"""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        stages = timings["stages"]
+        stages[name] = round(stages.get(name, 0.0) + seconds * 1000, 1)
+
+
+@contextmanager
+def query_stage(name: str):
+    """Context manager che misura una fase della richiesta corrente (span nella traccia)"""
+    start = time.perf_counter()
+    try:
+        with span(name):
+            yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def record_cache(name: str, hit: bool):
+    """Registra hit/miss di una cache nella richiesta corrente (e nei contatori)"""
+    CACHE_REQUESTS.inc(cache=name, result="hit" if hit else "miss")
+    timings = _request_timings.get()
+    if timings is not None:
+        timings["cache"][name] = "hit" if hit else "miss"
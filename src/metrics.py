@@ -0,0 +1,317 @@
+"""
+Metriche del processo (contatori e istogrammi) in formato Prometheus
+"""
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# Bucket (secondi) degli istogrammi di latenza: da pochi ms (cache) a oltre un minuto (LLM)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """Metrica con etichette (una serie per combinazione di valori)"""
+    
+    kind = "untyped"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+    
+    def _key(self, labels: Dict) -> Tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: etichette attese {self.labelnames}, ricevute {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+    
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+    
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+    
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(Metric):
+    """Gauge calcolato alla lettura (callback che restituisce {valori etichette: valore})"""
+    
+    kind = "gauge"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], read: Callable[[], Dict]):
+        super().__init__(name, documentation, labelnames)
+        self.read = read
+    
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+            for key, value in sorted(self.read().items())
+            if value is not None
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # {etichette: [conteggi per bucket (non cumulativi), somma, numero]}
+        self._series: Dict[Tuple, list] = {}
+    
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+    
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+    
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total, n)) for key, (counts, total, n) in self._series.items())
+        
+        lines = []
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metriche registrate nel processo, esposte con render()"""
+    
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+    
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+    
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+    
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, **kwargs))
+    
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str], read: Callable[[], Dict]) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, read))
+    
+    def render(self) -> str:
+        """Tutte le metriche nel formato testuale di Prometheus (0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "officina_query_stage_seconds",
+    "Latenza per fase delle query (embedding, search, retrieval, llm, llm_first_token, sources, response, total)",
+    ["stage"]
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "officina_cache_requests_total",
+    "Accessi alle cache di query (results, embedding) per esito",
+    ["cache", "result"]
+)
+LLM_TOKENS = REGISTRY.counter(
+    "officina_llm_tokens_total",
+    "Token scambiati con l'LLM",
+    ["type"]
+)
+QUERIES = REGISTRY.counter(
+    "officina_queries_total",
+    "Domande elaborate dal chatbot per esito",
+    ["status"]
+)
+ERRORS = REGISTRY.counter(
+    "officina_errors_total",
+    "Errori per componente",
+    ["component"]
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    "officina_http_requests_total",
+    "Richieste HTTP all'API",
+    ["method", "route", "status"]
+)
+HTTP_SECONDS = REGISTRY.histogram(
+    "officina_http_request_duration_seconds",
+    "Latenza delle richieste HTTP all'API",
+    ["method", "route"]
+)
+
+
+def _cache_hit_ratio() -> Dict[Tuple, Optional[float]]:
+    ratios = {}
+    with CACHE_REQUESTS._lock:
+        values = dict(CACHE_REQUESTS._values)
+    for cache in sorted({key[0] for key in values}):
+        hits = values.get((cache, "hit"), 0)
+        total = hits + values.get((cache, "miss"), 0)
+        ratios[(cache,)] = hits / total if total else None
+    return ratios
+
+
+REGISTRY.gauge(
+    "officina_cache_hit_ratio",
+    "Quota di hit delle cache di query dall'avvio",
+    ["cache"],
+    _cache_hit_ratio
+)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
+
+
+_llm_handler_class = None
+
+
+def llm_metrics_handler(record_stage: Callable[[str, float], None]):
+    """
+    Callback LangChain che misura le chiamate all'LLM
+    
+    Registra la durata di ogni chiamata (llm_call), il tempo al primo
+    token (llm_first_token: con lo streaming al primo token, altrimenti
+    alla risposta completa) e i token di input/output.
+    """
+    global _llm_handler_class
+    
+    if _llm_handler_class is None:
+        import time
+        from langchain_core.callbacks import BaseCallbackHandler
+        
+        class LLMMetricsHandler(BaseCallbackHandler):
+            def __init__(self, record):
+                self.record = record
+                self._starts: Dict = {}
+                self._first_token: set = set()
+            
+            def _start(self, run_id):
+                self._starts[run_id] = time.perf_counter()
+            
+            def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+                self._start(run_id)
+            
+            def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+                self._start(run_id)
+            
+            def on_llm_new_token(self, token, *, run_id, **kwargs):
+                if run_id in self._starts and run_id not in self._first_token:
+                    self._first_token.add(run_id)
+                    self.record("llm_first_token", time.perf_counter() - self._starts[run_id])
+            
+            def on_llm_end(self, response, *, run_id, **kwargs):
+                start = self._starts.pop(run_id, None)
+                if start is not None:
+                    elapsed = time.perf_counter() - start
+                    if run_id not in self._first_token:
+                        self.record("llm_first_token", elapsed)
+                    self.record("llm_call", elapsed)
+                self._first_token.discard(run_id)
+                
+                input_tokens, output_tokens = _token_usage(response)
+                if input_tokens:
+                    LLM_TOKENS.inc(input_tokens, type="input")
+                if output_tokens:
+                    LLM_TOKENS.inc(output_tokens, type="output")
+            
+            def on_llm_error(self, error, *, run_id, **kwargs):
+                self._starts.pop(run_id, None)
+                self._first_token.discard(run_id)
+                ERRORS.inc(component="llm")
+        
+        _llm_handler_class = LLMMetricsHandler
+    
+    return _llm_handler_class(record_stage)
+
+
+def _token_usage(response) -> Tuple[int, int]:
+    """Token di input/output di un LLMResult (usage_metadata o llm_output del provider)"""
+    input_tokens = output_tokens = 0
+    for generations in getattr(response, "generations", None) or []:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+    if input_tokens or output_tokens:
+        return input_tokens, output_tokens
+    
+    # OpenAI: token_usage (prompt/completion); Anthropic: usage (input/output)
+    usage = (response.llm_output or {}).get("token_usage") or (response.llm_output or {}).get("usage") or {}
+    if not isinstance(usage, dict):
+        usage = getattr(usage, "__dict__", {})
+    return (
+        usage.get("prompt_tokens", usage.get("input_tokens", 0)) or 0,
+        usage.get("completion_tokens", usage.get("output_tokens", 0)) or 0,
+    )
@@ -1,26 +1,106 @@
 ﻿"""
 Modulo per la gestione delle chain RAG e interazione con LLM
 """
+import json
+import time
 import logging
-from typing import Dict, List, Optional
-from langchain.chains import RetrievalQA, ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
-from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
 
-from config import settings, get_llm_config
-from src.vectorstore import VectorStoreManager
+from config import settings
+from src.cache import SingleFlight, normalize_query
+from src.catalog import get_catalog
+from src.clients import get_llm_client
+from src.instrumentation import query_stage, record_cache, record_stage, request_timings
+from src.metrics import ERRORS, QUERIES, llm_metrics_handler
+from src.tracing import profile_thread, start_trace, tracing_handler
+from src.vectorstore import get_vectorstore_manager
 
-logging.basicConfig(level=settings.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
+# Domande identiche in corso, condivise da tutti i chatbot del processo
+_inflight = SingleFlight()
+
+# Chain scadute ma ancora in esecuzione, raccolte per la richiesta corrente
+_abandoned_chains: contextvars.ContextVar[Optional[List[Future]]] = contextvars.ContextVar(
+    "abandoned_chains", default=None
+)
+
+
+@contextmanager
+def abandoned_chains(futures: Optional[List[Future]] = None) -> Iterator[List[Future]]:
+    """
+    Raccoglie in futures le chain scadute durante il blocco (risposta parziale)
+    
+    Le chain abbandonate continuano a chiamare l'LLM: il chiamante usa i
+    loro Future per trattenere le proprie risorse (es. il posto di
+    elaborazione dell'API) fino alla loro fine.
+    """
+    futures = [] if futures is None else futures
+    token = _abandoned_chains.set(futures)
+    try:
+        yield futures
+    finally:
+        _abandoned_chains.reset(token)
+
+
+class Deadline:
+    """Budget di latenza di una richiesta, ripartito tra le fasi"""
+    
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+    
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+    
+    def stage(self, seconds: Optional[float] = None) -> float:
+        """Tempo concesso a una fase: il suo limite, entro il budget residuo"""
+        return min(self.remaining(), seconds) if seconds else self.remaining()
+
+
+class DeadlineExceeded(Exception):
+    """Fase non terminata entro la scadenza, con i documenti già recuperati"""
+    
+    def __init__(self, stage: str, documents: List):
+        super().__init__(f"Scadenza superata nella fase {stage}")
+        self.stage = stage
+        self.documents = documents
+
+
+_retrieval_handler_class = None
+
+
+def retrieval_handler(documents: List, progress: threading.Event):
+    """Callback LangChain che conserva i documenti recuperati dalla chain e segnala la fine del retrieval"""
+    global _retrieval_handler_class
+    
+    if _retrieval_handler_class is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+        
+        class RetrievalHandler(BaseCallbackHandler):
+            def __init__(self, documents, progress):
+                self.documents = documents
+                self.progress = progress
+            
+            def on_retriever_end(self, documents, *, run_id, **kwargs):
+                self.documents[:] = documents
+                self.progress.set()
+        
+        _retrieval_handler_class = RetrievalHandler
+    
+    return _retrieval_handler_class(documents, progress)
+
 
 class OfficinaChatbot:
     """Chatbot principale per officine meccaniche"""
     
     def __init__(self):
-        self.vectorstore_manager = VectorStoreManager()
+        # Manager e LLM condivisi: un nuovo chatbot (es. sessione Streamlit) non riapre connessioni
+        self.vectorstore_manager = get_vectorstore_manager()
         self.llm = self._initialize_llm()
         self.memory = None
         self.qa_chain = None
@@ -33,26 +113,7 @@ class OfficinaChatbot:
     def _initialize_llm(self):
         """Inizializza il modello LLM"""
         try:
-            llm_config = get_llm_config()
-            logger.info(f"🤖 Inizializzazione LLM: {llm_config['provider']} - {llm_config['model']}")
-            
-            if llm_config['provider'] == "anthropic":
-                llm = ChatAnthropic(
-                    model=llm_config['model'],
-                    anthropic_api_key=llm_config['api_key'],
-                    temperature=llm_config['temperature'],
-                    max_tokens=llm_config['max_tokens']
-                )
-            elif llm_config['provider'] == "openai":
-                llm = ChatOpenAI(
-                    model=llm_config['model'],
-                    openai_api_key=llm_config['api_key'],
-                    temperature=llm_config['temperature'],
-                    max_tokens=llm_config['max_tokens']
-                )
-            else:
-                raise ValueError(f"Provider non supportato: {llm_config['provider']}")
-            
+            llm = get_llm_client()
             logger.info("✅ LLM inizializzato")
             return llm
             
@@ -66,6 +127,8 @@ class OfficinaChatbot:
             logger.info(f"🧠 Inizializzazione memoria: {settings.MEMORY_TYPE}")
             
             if settings.MEMORY_TYPE == "buffer":
+                from langchain.memory import ConversationBufferMemory
+                
                 self.memory = ConversationBufferMemory(
                     memory_key="chat_history",
                     return_messages=True,
@@ -83,6 +146,10 @@ class OfficinaChatbot:
         try:
             logger.info("⛓️  Inizializzazione RAG chain...")
             
+            # Import alla prima chain: langchain.chains è il modulo più lento da caricare
+            from langchain.chains import RetrievalQA, ConversationalRetrievalChain
+            from langchain.prompts import PromptTemplate
+            
             retriever = self.vectorstore_manager.get_retriever()
             
             prompt_template = PromptTemplate(
@@ -118,39 +185,217 @@ class OfficinaChatbot:
         self,
         question: str,
         filters: Optional[Dict] = None,
-        return_sources: bool = True
+        return_sources: bool = True,
+        profile: Optional[bool] = None,
+        documents: Optional[List] = None,
+        timeout: Optional[float] = None
+    ) -> Dict:
+        """
+        Poni una domanda al chatbot
+        
+        La risposta include "timings": tempi per fase in ms (retrieval,
+        embedding, search, llm, llm_call, llm_first_token, sources, total)
+        e hit/miss delle cache; gli stessi tempi alimentano le metriche.
+        "trace_id" identifica la traccia della richiesta (span di
+        retrieval, chain e chiamate all'LLM).
+        
+        Domande identiche (stessi filtri) poste mentre una è già in
+        elaborazione ne attendono la risposta invece di ripetere
+        embedding, ricerca e chiamata all'LLM (ENABLE_QUERY_COALESCING):
+        la risposta ha "coalesced": True e il tempo di attesa è la fase
+        "coalesced".
+        
+        Con un budget di latenza (timeout, default QUERY_TIMEOUT_SECONDS)
+        il retrieval deve terminare entro QUERY_RETRIEVAL_TIMEOUT_SECONDS e
+        la risposta entro il budget: altrimenti la risposta è parziale
+        ("partial": True, "partial_reason") con i passaggi dei manuali già
+        recuperati invece della risposta dell'LLM.
+        
+        Args:
+            profile: Profilo a campionamento della richiesta (None: PROFILE_QUERIES)
+            documents: Documenti già recuperati (es. ask_many): nessuna ricerca,
+                domanda indipendente dalla conversazione
+            timeout: Budget di latenza in secondi (None: QUERY_TIMEOUT_SECONDS, 0: nessuno)
+        """
+        timeout = settings.QUERY_TIMEOUT_SECONDS if timeout is None else timeout
+        deadline = Deadline(timeout) if timeout and timeout > 0 else None
+        
+        with start_trace("ask", profile=profile, question=question[:200], filters=filters) as trace, \
+                request_timings() as timings:
+            start = time.perf_counter()
+            if settings.ENABLE_QUERY_COALESCING:
+                result, shared = _inflight.do(
+                    self._coalescing_key(question, filters, return_sources, documents is not None),
+                    lambda: self._ask(question, filters, return_sources, timings, documents, deadline)
+                )
+                record_cache("inflight", shared)
+                # Copia: ogni richiesta aggiunge i propri tempi e trace_id
+                response = dict(result)
+                if shared:
+                    record_stage("coalesced", time.perf_counter() - start)
+                    response["coalesced"] = True
+            else:
+                response = self._ask(question, filters, return_sources, timings, documents, deadline)
+            record_stage("total", time.perf_counter() - start)
+        
+        if "error" in response:
+            ERRORS.inc(component="chatbot")
+        QUERIES.inc(status="error" if "error" in response else ("partial" if response.get("partial") else "ok"))
+        
+        if response.get("partial"):
+            # La chain scaduta può ancora registrare fasi: la risposta ne riceve una copia
+            timings = {"stages": dict(timings["stages"]), "cache": dict(timings["cache"])}
+        response["timings"] = timings
+        response["trace_id"] = trace.trace_id
+        return response
+    
+    def _coalescing_key(self, question: str, filters: Optional[Dict], return_sources: bool, stateless: bool) -> tuple:
+        """Chiave delle domande identiche: con la memoria solo per la stessa conversazione"""
+        conversation = id(self.memory) if self.memory and not stateless else None
+        filter_key = json.dumps(filters or {}, sort_keys=True, default=str)
+        return conversation, normalize_query(question), filter_key, return_sources
+    
+    def ask_many(self, queries: List[Dict], max_workers: Optional[int] = None) -> List[Dict]:
+        """
+        Risponde a più domande indipendenti (es. checklist pre-consegna)
+        
+        Le ricerche di tutte le domande usano una sola chiamata di embedding
+        e interrogano l'indice in parallelo (similarity_search_many); le
+        risposte vengono generate con al massimo max_workers chiamate
+        all'LLM concorrenti. Le domande non usano né aggiornano la memoria
+        conversazionale.
+        
+        Args:
+            queries: Dict con "question" e opzionali "filters", "return_sources",
+                "timeout" (budget della singola domanda, dal suo avvio)
+            max_workers: Chiamate all'LLM concorrenti (default BATCH_LLM_CONCURRENCY)
+        
+        Returns:
+            Una risposta per domanda, nello stesso ordine; gli errori sono
+            per domanda ("error") e non interrompono le altre
+        """
+        if not queries:
+            return []
+        
+        max_workers = max(1, min(max_workers or settings.BATCH_LLM_CONCURRENCY, len(queries)))
+        
+        with start_trace("ask_many", queries=len(queries)):
+            questions = [query["question"] for query in queries]
+            filters = [query.get("filters") or None for query in queries]
+            documents = self.retrieve_many(questions, filters)
+            
+            def answer(i: int) -> Dict:
+                try:
+                    return self.ask(
+                        questions[i],
+                        filters=filters[i],
+                        return_sources=queries[i].get("return_sources", True),
+                        documents=documents[i],
+                        timeout=queries[i].get("timeout")
+                    )
+                except Exception as e:
+                    logger.error(f"❌ Errore domanda {i + 1} del batch: {e}")
+                    return {"answer": "", "error": str(e)}
+            
+            # Ogni thread eredita la traccia del batch (span "ask" per domanda)
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ask-many") as executor:
+                futures = [executor.submit(contextvars.copy_context().run, answer, i) for i in range(len(queries))]
+                responses = [future.result() for future in futures]
+        
+        failed = sum(1 for response in responses if "error" in response)
+        logger.info(f"📦 Batch: {len(responses)} domande, {failed} con errori")
+        return responses
+    
+    def retrieve_many(self, questions: List[str], filters: List[Optional[Dict]]) -> List[Optional[List]]:
+        """
+        Documenti di più domande con una sola ricerca di gruppo (per ask(documents=...))
+        
+        Returns:
+            Documenti per domanda; None per tutte se la ricerca di gruppo non
+            riesce (ogni domanda esegue allora la propria ricerca)
+        """
+        try:
+            with query_stage("batch_retrieval"):
+                return [
+                    [doc for doc, _ in results]
+                    for results in self.vectorstore_manager.similarity_search_many(
+                        questions, k=settings.RETRIEVAL_K, filters=filters
+                    )
+                ]
+        except Exception as e:
+            logger.warning(f"⚠️  Ricerca multipla non riuscita, ricerche singole: {e}")
+            ERRORS.inc(component="search")
+            return [None] * len(questions)
+    
+    def _ask(
+        self,
+        question: str,
+        filters: Optional[Dict],
+        return_sources: bool,
+        timings: Dict,
+        documents: Optional[List] = None,
+        deadline: Optional[Deadline] = None
     ) -> Dict:
-        """Poni una domanda al chatbot"""
         try:
             logger.info(f"💬 Domanda: {question}")
             
             if filters:
                 logger.info(f"🔍 Filtri applicati: {filters}")
+                
+                # Combinazione marca/modello/anno non presente nell'indice
+                error = get_catalog().validate_filters(filters)
+                if error:
+                    logger.info(f"🚫 {error}")
+                    response = {"answer": f"{error} tra quelli indicizzati. Verifica marca, modello e anno selezionati."}
+                    if return_sources:
+                        response["sources"] = []
+                    return response
+            
+            inputs = {"question": question} if self.memory else {"query": question}
+            if documents is not None:
+                from src.retriever import StaticRetriever
+                
+                # Documenti già recuperati: nessuna ricerca e nessuna memoria (chat_history vuota)
+                qa_chain = self.qa_chain.model_copy(
+                    update={"retriever": StaticRetriever(documents=documents), "memory": None}
+                )
+                if self.memory:
+                    inputs["chat_history"] = []
+            elif filters:
                 search_kwargs = {"k": settings.RETRIEVAL_K, "filter": filters}
                 retriever = self.vectorstore_manager.get_retriever(search_kwargs)
                 
-                if self.memory:
-                    self.qa_chain.retriever = retriever
-                else:
-                    self.qa_chain = RetrievalQA.from_chain_type(
-                        llm=self.llm,
-                        chain_type="stuff",
-                        retriever=retriever,
-                        return_source_documents=True,
-                        verbose=settings.DEBUG
-                    )
+                # Copia della chain con il retriever filtrato (stessi prompt e memoria):
+                # la chain condivisa non cambia, anche con domande concorrenti
+                qa_chain = self.qa_chain.model_copy(update={"retriever": retriever})
+            else:
+                qa_chain = self.qa_chain
             
-            if self.memory:
-                result = self.qa_chain({"question": question})
+            chain_start = time.perf_counter()
+            callbacks = [llm_metrics_handler(record_stage)]
+            handler = tracing_handler()
+            if handler is not None:
+                callbacks.append(handler)
+            if deadline is None:
+                result = qa_chain(inputs, callbacks=callbacks)
             else:
-                result = self.qa_chain({"query": question})
+                try:
+                    result = self._run_chain(qa_chain, inputs, callbacks, deadline)
+                except DeadlineExceeded as e:
+                    logger.warning(f"⏱️  {e} ({deadline.seconds:.0f}s): risposta parziale con {len(e.documents)} documenti")
+                    return self._partial_response(e.stage, e.documents, return_sources)
+            
+            # Tempo della chain al netto del retrieval: condense della domanda e LLM
+            retrieval_seconds = timings["stages"].get("retrieval", 0.0) / 1000
+            record_stage("llm", max(0.0, time.perf_counter() - chain_start - retrieval_seconds))
             
             response = {
                 "answer": result.get("answer", result.get("result", "")),
             }
             
             if return_sources and "source_documents" in result:
-                response["sources"] = self._format_sources(result["source_documents"])
+                with query_stage("sources"):
+                    response["sources"] = self._format_sources(result["source_documents"])
             
             logger.info(f"✅ Risposta generata ({len(response['answer'])} caratteri)")
             
@@ -163,6 +408,78 @@ class OfficinaChatbot:
                 "error": str(e)
             }
     
+    def _run_chain(self, qa_chain, inputs: Dict, callbacks: List, deadline: Deadline) -> Dict:
+        """
+        Esegue la chain entro la scadenza (DeadlineExceeded altrimenti)
+        
+        La chain gira in un thread: scaduto il tempo la richiesta risponde
+        subito, mentre la chiamata in corso termina in background. La
+        chiamata abbandonata non scrive nella memoria conversazionale (la
+        risposta non è mai stata vista) ed è registrata in
+        abandoned_chains(): chi ha concesso il posto di elaborazione lo
+        trattiene fino alla sua fine.
+        """
+        memory = qa_chain.memory
+        if memory is not None:
+            # La memoria si aggiorna qui, solo per le risposte consegnate
+            qa_chain = qa_chain.model_copy(update={"memory": None})
+            inputs = {**inputs, **memory.load_memory_variables(inputs)}
+        
+        documents: List = []
+        progress = threading.Event()
+        future: Future = Future()
+        context = contextvars.copy_context()
+        callbacks = callbacks + [retrieval_handler(documents, progress)]
+        
+        def call() -> Dict:
+            with profile_thread():
+                return qa_chain(inputs, callbacks=callbacks)
+        
+        def run():
+            try:
+                future.set_result(context.run(call))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                progress.set()
+        
+        threading.Thread(target=run, name="ask-chain", daemon=True).start()
+        
+        try:
+            # Retrieval (con la memoria anche il condense della domanda) entro la sua scadenza
+            if not progress.wait(deadline.stage(settings.QUERY_RETRIEVAL_TIMEOUT_SECONDS)):
+                raise DeadlineExceeded("retrieval", [])
+            
+            try:
+                result = future.result(timeout=deadline.remaining())
+            except FuturesTimeout:
+                raise DeadlineExceeded("llm", list(documents))
+        except DeadlineExceeded:
+            abandoned = _abandoned_chains.get()
+            if abandoned is not None:
+                abandoned.append(future)
+            raise
+        
+        if memory is not None:
+            memory.save_context(inputs, result)
+        return result
+    
+    def _partial_response(self, stage: str, documents: List, return_sources: bool) -> Dict:
+        """Risposta parziale: i passaggi dei manuali recuperati al posto della risposta dell'LLM"""
+        sources = self._format_sources(documents)
+        
+        if sources:
+            answer = "⏱️ La risposta completa non è pronta entro il tempo previsto. Ecco i passaggi più pertinenti dei manuali:\n"
+            for source in sources:
+                answer += f"\n{source['index']}. {source['marca']} {source['modello']} - Pagina {source['pagina']}: {source['excerpt']}\n"
+        else:
+            answer = "⏱️ La ricerca nei manuali non è terminata entro il tempo previsto. Riprova tra poco."
+        
+        response = {"answer": answer, "partial": True, "partial_reason": f"{stage}_timeout"}
+        if return_sources:
+            response["sources"] = sources
+        return response
+    
     def _format_sources(self, source_docs: List) -> List[Dict]:
         """Formatta i documenti sorgente per la risposta"""
         sources = []
@@ -198,28 +515,13 @@ class SimpleChatbot:
     """Versione semplificata del chatbot senza memoria"""
     
     def __init__(self):
-        self.vectorstore_manager = VectorStoreManager()
+        self.vectorstore_manager = get_vectorstore_manager()
         self.llm = self._initialize_llm()
         self.retriever = self.vectorstore_manager.get_retriever()
     
     def _initialize_llm(self):
         """Inizializza LLM"""
-        llm_config = get_llm_config()
-        
-        if llm_config['provider'] == "anthropic":
-            return ChatAnthropic(
-                model=llm_config['model'],
-                anthropic_api_key=llm_config['api_key'],
-                temperature=llm_config['temperature'],
-                max_tokens=llm_config['max_tokens']
-            )
-        else:
-            return ChatOpenAI(
-                model=llm_config['model'],
-                openai_api_key=llm_config['api_key'],
-                temperature=llm_config['temperature'],
-                max_tokens=llm_config['max_tokens']
-            )
+        return get_llm_client()
     
     def ask(self, question: str, filters: Optional[Dict] = None) -> str:
         """Versione semplice: restituisce solo la risposta"""
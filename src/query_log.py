@@ -0,0 +1,221 @@
+"""
+Log delle query su file JSONL: scritture in background, a batch, con rotazione
+"""
+import gzip
+import json
+import time
+import queue
+import atexit
+import shutil
+import logging
+import threading
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class QueryLogger:
+    """
+    Logger delle query che non blocca le richieste
+    
+    log() accoda la voce (senza I/O) e ritorna subito; un thread di
+    background scrive le voci a batch con una sola apertura del file.
+    Il file viene ruotato quando supera max_bytes o cambia il giorno e i
+    file ruotati vengono compressi (gzip). Se la coda è piena (disco
+    lento o bloccato) le voci vengono scartate e contate, mai attese.
+    """
+    
+    def __init__(
+        self,
+        path: Path,
+        max_bytes: int = 50 * 1024 * 1024,
+        backups: int = 30,
+        compress: bool = True,
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        queue_size: int = 10000
+    ):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.compress = compress
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._day: Optional[date] = None
+    
+    def log(self, entry: Dict) -> bool:
+        """Accoda una voce (False se scartata perché la coda è piena)"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f"⚠️  Coda del log query piena: {self.dropped} voci scartate")
+            return False
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Attende che le voci accodate siano scritte (True se la coda è vuota)"""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        
+        def wait():
+            self._queue.join()
+            done.set()
+        
+        threading.Thread(target=wait, daemon=True).start()
+        return done.wait(timeout)
+    
+    def close(self, timeout: float = 5.0):
+        """Scrive le voci rimaste e ferma il thread di scrittura"""
+        with self._start_lock:
+            thread = self._thread
+            if thread is None:
+                return
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                logger.warning("⚠️  Log query: chiusura con coda piena, voci non scritte")
+                return
+            thread.join(timeout)
+            self._thread = None
+    
+    def stats(self) -> Dict:
+        return {
+            "path": str(self.path),
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "rotations": self.rotations,
+        }
+    
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="query-log", daemon=True)
+                    self._thread.start()
+    
+    def _run(self):
+        """Thread di scrittura: raccoglie un batch (fino a batch_size o flush_interval) e lo scrive"""
+        stop = False
+        while not stop:
+            batch: List[Dict] = []
+            item = self._queue.get()
+            pending = 1
+            if item is None:
+                stop = True
+            else:
+                batch.append(item)
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    pending += 1
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+            
+            try:
+                if batch:
+                    self._write(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                logger.warning(f"⚠️  Scrittura log query fallita ({len(batch)} voci perse): {e}")
+            finally:
+                for _ in range(pending):
+                    self._queue.task_done()
+    
+    def _write(self, batch: List[Dict]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._rotate_if_needed()
+        
+        data = "".join(json.dumps(entry, ensure_ascii=False, default=str) + "\n" for entry in batch)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
+        self.written += len(batch)
+    
+    def _rotate_if_needed(self):
+        """Ruota il file se ha superato max_bytes o è di un giorno precedente"""
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            self._day = date.today()
+            return
+        
+        if self._day is None:
+            self._day = datetime.fromtimestamp(stat.st_mtime).date()
+        
+        today = date.today()
+        if stat.st_size < self.max_bytes and self._day == today:
+            return
+        
+        # Più rotazioni nello stesso secondo (file piccoli): suffisso progressivo
+        base = f"{self.path.stem}-{self._day:%Y%m%d}-{datetime.now():%H%M%S}"
+        rotated = self.path.with_name(f"{base}{self.path.suffix}")
+        n = 1
+        while rotated.exists() or Path(f"{rotated}.gz").exists():
+            rotated = self.path.with_name(f"{base}-{n}{self.path.suffix}")
+            n += 1
+        self.path.replace(rotated)
+        self._day = today
+        self.rotations += 1
+        
+        if self.compress:
+            with open(rotated, "rb") as source, gzip.open(f"{rotated}.gz", "wb") as target:
+                shutil.copyfileobj(source, target)
+            rotated.unlink()
+        
+        self._prune()
+    
+    def _prune(self):
+        """Elimina i file ruotati più vecchi oltre il numero di backup"""
+        rotated = sorted(
+            self.path.parent.glob(f"{self.path.stem}-*{self.path.suffix}*"),
+            key=lambda path: path.stat().st_mtime_ns
+        )
+        for old in rotated[:max(0, len(rotated) - self.backups)]:
+            old.unlink(missing_ok=True)
+
+
+_query_logger: Optional[QueryLogger] = None
+_query_logger_lock = threading.Lock()
+
+
+def get_query_logger() -> QueryLogger:
+    """Logger delle query condiviso dal processo (scrive i dati rimasti all'uscita)"""
+    global _query_logger
+    
+    if _query_logger is None:
+        with _query_logger_lock:
+            if _query_logger is None:
+                _query_logger = QueryLogger(
+                    settings.QUERY_LOG_PATH,
+                    max_bytes=settings.QUERY_LOG_MAX_BYTES,
+                    backups=settings.QUERY_LOG_BACKUPS,
+                    compress=settings.QUERY_LOG_COMPRESS,
+                    batch_size=settings.QUERY_LOG_BATCH_SIZE,
+                    flush_interval=settings.QUERY_LOG_FLUSH_SECONDS,
+                    queue_size=settings.QUERY_LOG_QUEUE_SIZE
+                )
+                atexit.register(_query_logger.close)
+    
+    return _query_logger
@@ -0,0 +1,38 @@
+"""
+Retriever LangChain basato su VectorStoreManager
+"""
+from typing import Any, Dict, List
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from config import settings
+from src.instrumentation import query_stage
+
+
+class ManagerRetriever(BaseRetriever):
+    """Retriever LangChain che cerca tramite VectorStoreManager (namespace per marca)"""
+    
+    manager: Any
+    search_kwargs: Dict = {}
+    
+    class Config:
+        arbitrary_types_allowed = True
+    
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        with query_stage("retrieval"):
+            results = self.manager.similarity_search_with_score(
+                query,
+                k=self.search_kwargs.get("k", settings.RETRIEVAL_K),
+                filter_dict=self.search_kwargs.get("filter")
+            )
+        return [doc for doc, _ in results]
+
+
+class StaticRetriever(BaseRetriever):
+    """Retriever con documenti già recuperati (es. da similarity_search_many per un batch)"""
+    
+    documents: List[Document] = []
+    
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return list(self.documents)
@@ -0,0 +1,340 @@
+"""
+Tracing delle richieste (span con trace ID) e profiler a campionamento
+"""
+import sys
+import time
+import uuid
+import random
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Trace:
+    """
+    Span di una richiesta (domanda) con i tempi relativi all'inizio
+    
+    Ogni span ha un ID progressivo, il padre (None per la radice), inizio
+    e durata in ms ed eventuali attributi ed errore.
+    """
+    
+    def __init__(self, name: str, trace_id: Optional[str] = None, **attrs):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.timestamp = datetime.now().isoformat(timespec="milliseconds")
+        self.spans: List[Dict] = []
+        self.profile: Optional[str] = None
+        self.profiler: Optional["SamplingProfiler"] = None
+        self._start = time.perf_counter()
+        self._next_id = 0
+        self._lock = threading.Lock()
+    
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self._start) * 1000, 1)
+    
+    def open_span(self, name: str, parent: Optional[int], **attrs) -> Dict:
+        with self._lock:
+            span = {"id": self._next_id, "parent": parent, "name": name, "start_ms": self.elapsed_ms()}
+            self._next_id += 1
+            self.spans.append(span)
+        if attrs:
+            span["attrs"] = attrs
+        return span
+    
+    def close_span(self, span: Dict, error: Optional[BaseException] = None):
+        span["duration_ms"] = round(self.elapsed_ms() - span["start_ms"], 1)
+        if error is not None:
+            span["error"] = f"{type(error).__name__}: {error}"
+    
+    @property
+    def duration_ms(self) -> float:
+        root = self.spans[0] if self.spans else None
+        return root.get("duration_ms", self.elapsed_ms()) if root else self.elapsed_ms()
+    
+    def to_dict(self) -> Dict:
+        # Copia degli span: una chain scaduta (ask con timeout) può ancora aggiungerne
+        with self._lock:
+            spans = [dict(span) for span in self.spans]
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "timestamp": self.timestamp,
+            "duration_ms": self.duration_ms,
+            "attrs": self.attrs,
+            "profile": self.profile,
+            "spans": spans,
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[int]] = ContextVar("current_span", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Optional[Dict]]:
+    """Span figlio dello span corrente (nessun costo fuori da una traccia)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    
+    item = trace.open_span(name, _current_span.get(), **attrs)
+    token = _current_span.set(item["id"])
+    try:
+        yield item
+    except BaseException as e:
+        trace.close_span(item, e)
+        raise
+    else:
+        trace.close_span(item)
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def start_trace(
+    name: str,
+    trace_id: Optional[str] = None,
+    profile: Optional[bool] = None,
+    **attrs
+) -> Iterator[Trace]:
+    """
+    Traccia di una richiesta: span radice, profilo opzionale e salvataggio
+    
+    Dentro una traccia già attiva (es. /query → ask) apre solo uno span;
+    se la traccia è profilata, il profilo segue il thread che la esegue
+    (es. ask in un worker di asyncio.to_thread).
+    Alla chiusura la traccia viene salvata in TRACE_PATH se campionata
+    (TRACE_SAMPLE_RATE) o se più lenta di TRACE_SLOW_MS.
+    
+    Args:
+        profile: Profilo a campionamento della richiesta (None: PROFILE_QUERIES)
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        with span(name, **attrs), profile_thread():
+            yield trace
+        return
+    
+    trace = Trace(name, trace_id, **attrs)
+    token = _current_trace.set(trace)
+    profiler = None
+    if profile if profile is not None else settings.PROFILE_QUERIES:
+        profiler = trace.profiler = SamplingProfiler(interval=settings.PROFILE_INTERVAL_MS / 1000)
+        profiler.start()
+    try:
+        with span(name):
+            yield trace
+    finally:
+        _current_trace.reset(token)
+        if profiler is not None:
+            trace.profile = str(profiler.stop(Path(settings.PROFILE_DIR) / f"{trace.trace_id}.collapsed"))
+        _finish(trace)
+
+
+@contextmanager
+def profile_thread() -> Iterator[None]:
+    """
+    Campiona il thread corrente se la traccia attiva è profilata
+    
+    Da usare nei thread a cui la richiesta delega il lavoro: finché
+    almeno un thread è registrato il profilo segue questi thread invece
+    di quello che ha aperto la traccia (es. event loop in attesa).
+    """
+    trace = _current_trace.get()
+    profiler = trace.profiler if trace is not None else None
+    thread_id = threading.get_ident()
+    if profiler is None or thread_id == profiler.thread_id:
+        yield
+        return
+    
+    profiler.add_thread(thread_id)
+    try:
+        yield
+    finally:
+        profiler.remove_thread(thread_id)
+
+
+def _finish(trace: Trace):
+    """Salva la traccia (in background) se campionata o lenta"""
+    if not settings.TRACE_ENABLED:
+        return
+    slow = trace.duration_ms >= settings.TRACE_SLOW_MS
+    if slow:
+        logger.info(f"🐢 Richiesta lenta ({trace.duration_ms:.0f} ms), trace {trace.trace_id}")
+    if slow or trace.profile or random.random() < settings.TRACE_SAMPLE_RATE:
+        get_trace_logger().log(trace.to_dict())
+
+
+_trace_logger = None
+_trace_logger_lock = threading.Lock()
+
+
+def get_trace_logger():
+    """Writer JSONL delle tracce (stesso logger in background del log query)"""
+    global _trace_logger
+    
+    if _trace_logger is None:
+        with _trace_logger_lock:
+            if _trace_logger is None:
+                import atexit
+                from src.query_log import QueryLogger
+                
+                _trace_logger = QueryLogger(
+                    settings.TRACE_PATH,
+                    max_bytes=settings.QUERY_LOG_MAX_BYTES,
+                    backups=settings.QUERY_LOG_BACKUPS,
+                    compress=settings.QUERY_LOG_COMPRESS
+                )
+                atexit.register(_trace_logger.close)
+    
+    return _trace_logger
+
+
+_tracing_handler_class = None
+
+
+def tracing_handler(trace: Optional[Trace] = None):
+    """
+    Callback LangChain che registra come span le chain e le chiamate all'LLM
+    
+    Distingue ad esempio il condense della domanda (chain che genera la
+    domanda autonoma) dalla chain che produce la risposta. None fuori da
+    una traccia.
+    """
+    global _tracing_handler_class
+    
+    trace = trace or _current_trace.get()
+    if trace is None:
+        return None
+    
+    if _tracing_handler_class is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+        
+        class TracingHandler(BaseCallbackHandler):
+            def __init__(self, trace, parent):
+                self.trace = trace
+                self.parent = parent
+                self._spans: Dict = {}
+            
+            def _open(self, name, run_id, parent_run_id, **attrs):
+                parent = self._spans.get(parent_run_id, {}).get("id", self.parent)
+                self._spans[run_id] = self.trace.open_span(name, parent, **attrs)
+                # Le fasi misurate dentro la chain (es. retrieval) diventano sue figlie
+                _current_span.set(self._spans[run_id]["id"])
+            
+            def _close(self, run_id, error=None):
+                item = self._spans.pop(run_id, None)
+                if item is not None:
+                    self.trace.close_span(item, error)
+                    _current_span.set(item["parent"])
+            
+            def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+                name = kwargs.get("name") or (serialized or {}).get("name") or "chain"
+                self._open(f"chain:{name}", run_id, parent_run_id)
+            
+            def on_chain_end(self, outputs, *, run_id, **kwargs):
+                self._close(run_id)
+            
+            def on_chain_error(self, error, *, run_id, **kwargs):
+                self._close(run_id, error)
+            
+            def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+                self._open("llm", run_id, parent_run_id, prompt_chars=sum(len(p) for p in prompts))
+            
+            def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+                chars = sum(len(str(m.content)) for batch in messages for m in batch)
+                self._open("llm", run_id, parent_run_id, prompt_chars=chars)
+            
+            def on_llm_end(self, response, *, run_id, **kwargs):
+                self._close(run_id)
+            
+            def on_llm_error(self, error, *, run_id, **kwargs):
+                self._close(run_id, error)
+        
+        _tracing_handler_class = TracingHandler
+    
+    return _tracing_handler_class(trace, _current_span.get())
+
+
+class SamplingProfiler:
+    """
+    Profiler a campionamento di un thread (nessuna dipendenza)
+    
+    Un thread di background legge lo stack del thread profilato (o dei
+    thread registrati con add_thread, a cui è stato delegato il lavoro)
+    ogni interval secondi; gli stack vengono aggregati nel formato "collapsed"
+    (una riga per stack, frame separati da ';' e numero di campioni),
+    leggibile con flamegraph.pl, speedscope o scripts/trace_report.py.
+    """
+    
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = max(0.001, interval)
+        self.samples: Counter = Counter()
+        self.workers: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+    
+    def add_thread(self, thread_id: int):
+        with self._lock:
+            self.workers[thread_id] += 1
+    
+    def remove_thread(self, thread_id: int):
+        with self._lock:
+            self.workers[thread_id] -= 1
+            if self.workers[thread_id] <= 0:
+                del self.workers[thread_id]
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                targets = list(self.workers) or [self.thread_id]
+            frames = sys._current_frames()
+            for thread_id in targets:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+    
+    def stop(self, path: Path) -> Path:
+        """Ferma il campionamento e scrive il profilo"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info(f"🔬 Profilo salvato: {path} ({sum(self.samples.values())} campioni)")
+        return path
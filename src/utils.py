@@ -9,10 +9,14 @@ import json
 
 from config import settings
 
-logging.basicConfig(level=settings.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
 
+def configure_logging(level: str = None):
+    """Logging su console per script e app (i moduli non lo configurano all'import)"""
+    logging.basicConfig(level=level or settings.LOG_LEVEL)
+
+
 def setup_logging(log_file: str = "officina_ai.log"):
     """Setup logging con file e console"""
     log_path = settings.BASE_DIR / "logs" / log_file
@@ -89,12 +93,18 @@ def extract_car_info(text: str) -> Dict[str, str]:
     return info
 
 
-def save_query_log(question: str, answer: str, sources: List[Dict] = None):
-    """Salva log delle query per analisi"""
-    log_dir = settings.BASE_DIR / "logs" / "queries"
-    log_dir.mkdir(parents=True, exist_ok=True)
+def save_query_log(question: str, answer: str, sources: List[Dict] = None, timings: Dict = None):
+    """
+    Salva log delle query per analisi
     
-    log_file = log_dir / "query_log.jsonl"
+    La voce viene accodata e scritta in background (src/query_log.py):
+    nessun I/O su disco nel percorso della richiesta.
+    
+    Args:
+        timings: Tempi per fase e uso delle cache della richiesta
+                 (response["timings"] di OfficinaChatbot.ask)
+    """
+    from src.query_log import get_query_logger
     
     log_entry = {
         "timestamp": __import__('datetime').datetime.now().isoformat(),
@@ -102,13 +112,21 @@ def save_query_log(question: str, answer: str, sources: List[Dict] = None):
         "answer_length": len(answer),
         "sources_count": len(sources) if sources else 0
     }
+    if timings:
+        log_entry["timings_ms"] = timings.get("stages", {})
+        log_entry["cache"] = timings.get("cache", {})
     
-    with open(log_file, 'a', encoding='utf-8') as f:
-        f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
+    get_query_logger().log(log_entry)
 
 
 def get_available_brands() -> List[str]:
-    """Ottieni lista marche disponibili dai manuali"""
+    """Ottieni lista marche disponibili (dal catalogo dell'indice, o dai nomi dei manuali)"""
+    from src.catalog import get_catalog
+    
+    catalog = get_catalog()
+    if catalog:
+        return catalog.get_brands()
+    
     manuals_path = settings.MANUALS_PATH
     
     if not manuals_path.exists():
@@ -127,6 +145,12 @@ def get_available_brands() -> List[str]:
 
 def get_available_models(brand: str = None) -> List[str]:
     """Ottieni lista modelli disponibili (opzionalmente per una marca)"""
+    from src.catalog import get_catalog
+    
+    catalog = get_catalog()
+    if catalog:
+        return catalog.get_models(brand)
+    
     manuals_path = settings.MANUALS_PATH
     
     if not manuals_path.exists():
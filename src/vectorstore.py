@@ -2,27 +2,53 @@
 Modulo per la gestione del vector database (Pinecone)
 """
 import logging
-from typing import List, Dict, Optional
-from langchain.schema import Document
-from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
-from pinecone import Pinecone, ServerlessSpec
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Sequence, Union
+from langchain_core.documents import Document
 import time
+import uuid
+import numpy as np
+from pathlib import Path
 
 from config import settings
+from src.adjacency import chunk_id, get_adjacency, manual_name, range_id
+from src.cache import EmbeddingCache, ResultCache, normalize_query
+from src.catalog import get_catalog, update_catalog
+from src.clients import get_embedding_client, get_pinecone_client, get_pinecone_index, shared
+from src.compression import VectorCompression
+from src.docstore import DocStore, index_metadata
+from src.hierarchy import SummaryBuilder, get_summary_index, update_summary_index
+from src.instrumentation import IngestionReport, count_tokens, query_stage, record_cache
+from src.metrics import ERRORS
 
-logging.basicConfig(level=settings.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
 
 class VectorStoreManager:
     """Gestisce il vector database Pinecone"""
     
+    # Chiave metadata in cui PineconeVectorStore legge il testo del chunk
+    TEXT_KEY = "text"
+    
     def __init__(self):
+        from src.embeddings import embedding_model_name
+        
         self.pc = None
         self.index = None
         self.embeddings = None
         self.vectorstore = None
+        self._namespaces = None
+        self.result_cache = ResultCache(
+            max_size=settings.RESULT_CACHE_SIZE if settings.ENABLE_CACHE else 0,
+            ttl=settings.CACHE_TTL
+        )
+        self.embedding_cache = EmbeddingCache(
+            embedding_model_name(),
+            max_size=settings.EMBEDDING_CACHE_SIZE,
+            path=settings.EMBEDDING_CACHE_PATH or None
+        )
+        self.compression = VectorCompression.from_settings()
+        self.docstore = DocStore(settings.DOCSTORE_PATH) if settings.DOCSTORE_ENABLED else None
         
         self._initialize()
     
@@ -31,13 +57,11 @@ class VectorStoreManager:
         try:
             logger.info("🔌 Connessione a Pinecone...")
             
-            # Inizializza client Pinecone
-            self.pc = Pinecone(api_key=settings.PINECONE_API_KEY)
+            # Client condivisi dal processo: creati una sola volta e riusati dai manager
+            self.pc = get_pinecone_client()
             
-            # Inizializza embeddings con modello locale
-            self.embeddings = OpenAIEmbeddings(
-            openai_api_key=settings.OPENAI_API_KEY
-            )
+            # Inizializza embeddings (OpenAI o modello locale, da EMBEDDING_PROVIDER)
+            self.embeddings = get_embedding_client()
             
             logger.info("✅ Connessione stabilita")
             
@@ -45,22 +69,35 @@ class VectorStoreManager:
             logger.error(f"❌ Errore connessione Pinecone: {e}")
             raise
     
-    def create_index_if_not_exists(self, dimension: int = 1536):
+    def create_index_if_not_exists(self, dimension: Optional[int] = None):
         """
         Crea l'indice Pinecone se non esiste
         
         Args:
-            dimension: Dimensione dei vettori (1536 per OpenAI ada-002)
+            dimension: Dimensione dei vettori (default: quella del provider di
+                embedding, ridotta se VECTOR_COMPRESSION è attiva)
         """
+        if dimension is None:
+            from src.embeddings import embedding_dimension
+            
+            dimension = self.compression.index_dimension(embedding_dimension(self.embeddings))
+        
         try:
             index_name = settings.PINECONE_INDEX_NAME
             
             # Controlla se l'indice esiste già
-            existing_indexes = [index.name for index in self.pc.list_indexes()]
+            existing_indexes = {index.name: index for index in self.pc.list_indexes()}
             
             if index_name in existing_indexes:
                 logger.info(f"📊 Indice '{index_name}' già esistente")
-                self.index = self.pc.Index(index_name)
+                existing_dimension = getattr(existing_indexes[index_name], "dimension", None)
+                if existing_dimension and existing_dimension != dimension:
+                    raise ValueError(
+                        f"L'indice '{index_name}' ha dimensione {existing_dimension}, "
+                        f"il provider di embedding produce vettori di dimensione {dimension}. "
+                        f"Usa un altro PINECONE_INDEX_NAME o reindicizza con --clear."
+                    )
+                self.index = get_pinecone_index(index_name)
                 return
             
             logger.info(f"🆕 Creazione nuovo indice '{index_name}'...")
@@ -79,6 +116,8 @@ class VectorStoreManager:
                 region = 'us-east-1'
             
             # Crea l'indice
+            from pinecone import ServerlessSpec
+            
             self.pc.create_index(
                 name=index_name,
                 dimension=dimension,
@@ -94,40 +133,66 @@ class VectorStoreManager:
             while not self.pc.describe_index(index_name).status['ready']:
                 time.sleep(1)
             
-            self.index = self.pc.Index(index_name)
+            self.index = get_pinecone_index(index_name)
             logger.info(f"✅ Indice '{index_name}' creato con successo")
             
         except Exception as e:
             logger.error(f"❌ Errore creazione indice: {e}")
             raise
     
-    def index_documents(self, documents: List[Document], batch_size: int = 100):
+    def index_documents(
+        self,
+        documents: Sequence[Document],
+        batch_size: int = 100,
+        report: Optional[IngestionReport] = None
+    ):
         """
         Indicizza documenti nel vector store
         
         Args:
-            documents: Lista di documenti da indicizzare
+            documents: Lista di documenti (o ChunkStore) da indicizzare
             batch_size: Dimensione batch per l'indicizzazione
+            report: Report in cui registrare tempi e contatori di embed/upsert
         """
         if not documents:
             logger.warning("⚠️  Nessun documento da indicizzare")
             return
         
+        report = report or IngestionReport(live=False)
+        
         try:
             logger.info(f"📝 Inizio indicizzazione di {len(documents)} documenti...")
             
             # Crea l'indice se non esiste
             self.create_index_if_not_exists()
             
-            # Crea vectorstore usando LangChain
-            self.vectorstore = PineconeVectorStore.from_documents(
-                documents=documents,
-                embedding=self.embeddings,
-                index_name=settings.PINECONE_INDEX_NAME
-            )
+            # Vettori riassuntivi per il retrieval gerarchico (centroidi degli embedding)
+            summaries = SummaryBuilder(settings.HIERARCHY_SECTION_PAGES) if settings.HIERARCHICAL_RETRIEVAL else None
+            
+            # La PCA viene addestrata su un campione dei chunks prima del primo upsert
+            remaining: Sequence[int] = range(len(documents))
+            if self.compression.needs_fit:
+                sampled = set(self._fit_compression(documents, batch_size, report, summaries))
+                remaining = [i for i in remaining if i not in sampled]
+            
+            # I Document vengono materializzati un batch alla volta
+            for start in range(0, len(remaining), batch_size):
+                positions = remaining[start:start + batch_size]
+                batch = [documents[i] for i in positions]
+                try:
+                    self._index_batch(batch, report, summaries=summaries)
+                except Exception as e:
+                    report.record_failure("upsert", f"batch {positions[0]}-{positions[-1] + 1}", e)
+                    raise
             
             logger.info(f"✅ Indicizzazione completata!")
             
+            # Aggiorna il catalogo marche/modelli/anni servito ad API e app
+            update_catalog(lambda catalog: catalog.add_documents(documents))
+            if summaries is not None:
+                summary_index = update_summary_index(lambda index: index.merge(summaries.build()))
+                logger.info(f"🗂️  Indice riassuntivo: {summary_index.manuals} manuali, {len(summary_index)} vettori")
+            
             # Mostra statistiche
             stats = self.get_index_stats()
             logger.info(f"📊 Statistiche indice: {stats.get('total_vector_count', 0)} vettori totali")
@@ -136,14 +201,153 @@ class VectorStoreManager:
             logger.error(f"❌ Errore indicizzazione: {e}")
             raise
     
-    def get_vectorstore(self) -> PineconeVectorStore:
+    def _fit_compression(
+        self,
+        documents: Sequence[Document],
+        batch_size: int,
+        report: IngestionReport,
+        summaries: Optional[SummaryBuilder] = None
+    ) -> List[int]:
+        """
+        Addestra la riduzione PCA su un campione dei chunks e li indicizza riusandone gli embedding
+        
+        Il campione è estratto in modo uniforme da tutto il corpus: i primi
+        chunks vengono dai primi manuali (una o due marche) e sbilancerebbero
+        la base PCA.
+        
+        Returns:
+            Indici dei chunks già indicizzati
+        """
+        size = min(len(documents), max(settings.VECTOR_PCA_SAMPLE, batch_size))
+        # Seme fisso: stesso campione (e stessa base) a parità di corpus
+        positions = sorted(np.random.default_rng(0).choice(len(documents), size=size, replace=False).tolist())
+        sample = [documents[i] for i in positions]
+        vectors = []
+        for start in range(0, len(sample), batch_size):
+            vectors.extend(self._embed_batch([doc.page_content for doc in sample[start:start + batch_size]], report))
+        
+        self.compression.fit(vectors)
+        
+        for start in range(0, len(sample), batch_size):
+            self._index_batch(sample[start:start + batch_size], report, vectors[start:start + batch_size], summaries)
+        return positions
+    
+    def _embed_batch(self, texts: List[str], report: IngestionReport) -> List[List[float]]:
+        """Embedding di un batch di testi"""
+        from src.embeddings import embedding_model_name
+        
+        with report.stage("embed"):
+            embeddings = self.embeddings.embed_documents(texts)
+        report.incr("embedding_calls")
+        report.incr("embedding_tokens", count_tokens(texts, embedding_model_name()))
+        return embeddings
+    
+    def _index_batch(
+        self,
+        batch: List[Document],
+        report: IngestionReport,
+        embeddings: Optional[List[List[float]]] = None,
+        summaries: Optional[SummaryBuilder] = None
+    ):
+        """Calcola gli embedding di un batch (se non forniti) e li carica nell'indice"""
+        texts = [doc.page_content for doc in batch]
+        ids = [self._vector_id(doc) for doc in batch]
+        
+        if self.docstore is not None:
+            # Testo e metadata completi in locale, nell'indice solo i campi filtrabili
+            self.docstore.add(ids, texts, [doc.metadata for doc in batch])
+            fields = list(settings.INDEX_METADATA_FIELDS)
+            if settings.HIERARCHICAL_RETRIEVAL and "filename" not in fields:
+                # Il secondo stadio del retrieval gerarchico filtra per manuale
+                fields.append("filename")
+            metadatas = [index_metadata(doc.metadata, fields) for doc in batch]
+        else:
+            metadatas = [{**doc.metadata, self.TEXT_KEY: doc.page_content} for doc in batch]
+        
+        if embeddings is None:
+            embeddings = self._embed_batch(texts, report)
+        
+        if summaries is not None:
+            summaries.add([doc.metadata for doc in batch], embeddings)
+        
+        # Con la compressione attiva nell'indice vanno i vettori ridotti
+        embeddings = self.compression.prepare(ids, embeddings, [doc.metadata for doc in batch])
+        
+        # Con il partizionamento per marca ogni gruppo va nel proprio namespace
+        by_namespace = {}
+        for vector in zip(ids, embeddings, metadatas):
+            by_namespace.setdefault(self.namespace_for(vector[2].get("marca")), []).append(vector)
+        
+        with report.stage("upsert"):
+            for namespace, vectors in by_namespace.items():
+                self.index.upsert(vectors=vectors, namespace=namespace or None)
+                report.incr("upsert_batches")
+        report.incr("vectors_upserted", len(ids))
+        self._namespaces = None
+        self.result_cache.invalidate()
+    
+    @staticmethod
+    def _vector_id(doc: Document) -> str:
+        """ID del vettore: deterministico (manuale + posizione) in modalità small-to-big"""
+        filename = manual_name(doc.metadata)
+        position = doc.metadata.get("chunk_index")
+        if settings.SMALL_TO_BIG and filename and position is not None:
+            return chunk_id(filename, int(position))
+        return str(uuid.uuid4())
+    
+    def namespace_for(self, marca: Optional[str]) -> str:
+        """Namespace Pinecone di una marca ("" = namespace di default)"""
+        if not settings.NAMESPACE_BY_BRAND or not marca:
+            return ""
+        return str(marca).strip().upper()
+    
+    def list_namespaces(self) -> List[str]:
+        """Namespace presenti nell'indice (in cache fino alla prossima scrittura)"""
+        if self._namespaces is None:
+            stats = self.get_index_stats()
+            self._namespaces = list((stats.get("namespaces") or {}).keys()) or [""]
+        return self._namespaces
+    
+    def _route_filter(self, filter_dict: Optional[Dict]) -> tuple:
+        """
+        Determina i namespace da interrogare per un filtro
+        
+        Returns:
+            Tupla (namespaces, filtro_residuo): namespaces None = tutti,
+            il filtro su marca è rimosso quando è già garantito dal namespace
+        """
+        if not settings.NAMESPACE_BY_BRAND:
+            return [""], filter_dict or None
+        
+        filter_dict = dict(filter_dict or {})
+        marca = filter_dict.pop("marca", None)
+        
+        if marca is None:
+            return None, filter_dict or None
+        
+        if isinstance(marca, dict):
+            if set(marca) == {"$eq"}:
+                marche = [marca["$eq"]]
+            elif set(marca) == {"$in"}:
+                marche = list(marca["$in"])
+            else:
+                # Operatore non instradabile: filtro completo su tutti i namespace
+                return None, {**filter_dict, "marca": marca}
+        else:
+            marche = [marca]
+        
+        return [self.namespace_for(m) for m in marche], filter_dict or None
+    
+    def get_vectorstore(self) -> "PineconeVectorStore":
         """Ottieni il vectorstore (crea connessione se necessario)"""
         if self.vectorstore is None:
             try:
+                from langchain_pinecone import PineconeVectorStore
+                
                 logger.info("🔌 Connessione al vectorstore esistente...")
                 
                 self.vectorstore = PineconeVectorStore(
-                    index_name=settings.PINECONE_INDEX_NAME,
+                    index=self._get_index(),
                     embedding=self.embeddings
                 )
                 
@@ -155,6 +359,365 @@ class VectorStoreManager:
         
         return self.vectorstore
     
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int,
+        filter_dict: Optional[Dict] = None
+    ) -> List[tuple]:
+        """
+        Ricerca per similarità instradata sui namespace (solleva eccezioni)
+        
+        Con un filtro su marca viene interrogata solo la partizione della
+        marca; senza, la query viene eseguita su tutti i namespace in
+        parallelo e i risultati vengono fusi per score. Filtri su
+        marca/modello/anno assenti dal catalogo non generano query.
+        I risultati sono in cache fino alla prossima scrittura sull'indice.
+        """
+        catalog = get_catalog()
+        error = catalog.validate_filters(filter_dict)
+        if error:
+            logger.info(f"🚫 Ricerca evitata: {error}")
+            return []
+        
+        # Scritture da altri processi (es. scripts/index_manuals.py) aggiornano il catalogo
+        self.result_cache.sync(catalog.updated_at)
+        cache_key = self.result_cache.make_key(query, filter_dict, k)
+        cached = self.result_cache.get(cache_key)
+        record_cache("results", cached is not None)
+        if cached is not None:
+            logger.debug(f"⚡ Risultati in cache per: '{query}'")
+            return cached
+        
+        version = self.result_cache.version
+        results = self._query_index(query, k, filter_dict)
+        self.result_cache.put(cache_key, results, version)
+        return results
+    
+    def similarity_search_many(
+        self,
+        queries: Sequence[str],
+        k: int,
+        filters: Optional[Union[Dict, Sequence[Optional[Dict]]]] = None
+    ) -> List[List[tuple]]:
+        """
+        Ricerca per similarità di più query (solleva eccezioni)
+        
+        Le query non in cache vengono calcolate con una sola chiamata di
+        embedding e interrogano l'indice in parallelo (SEARCH_MANY_WORKERS).
+        Query ripetute nel batch vengono eseguite una sola volta.
+        
+        Args:
+            filters: Un filtro per tutte le query o una lista (uno per query)
+        
+        Returns:
+            Lista di risultati (Document, score) nello stesso ordine delle query
+        """
+        queries = list(queries)
+        if filters is None or isinstance(filters, dict):
+            filters = [filters] * len(queries)
+        else:
+            filters = list(filters)
+            if len(filters) != len(queries):
+                raise ValueError(f"Numero di filtri ({len(filters)}) diverso dal numero di query ({len(queries)})")
+        
+        catalog = get_catalog()
+        self.result_cache.sync(catalog.updated_at)
+        version = self.result_cache.version
+        
+        results: List[Optional[List[tuple]]] = [None] * len(queries)
+        pending: Dict[tuple, List[int]] = {}
+        for i, (query, filter_dict) in enumerate(zip(queries, filters)):
+            error = catalog.validate_filters(filter_dict)
+            if error:
+                logger.info(f"🚫 Ricerca evitata: {error}")
+                results[i] = []
+                continue
+            
+            cache_key = self.result_cache.make_key(query, filter_dict, k)
+            if cache_key in pending:
+                pending[cache_key].append(i)
+                continue
+            
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending[cache_key] = [i]
+        
+        if pending:
+            keys = list(pending)
+            first = [pending[key][0] for key in keys]
+            embeddings = self.embed_queries([queries[i] for i in first])
+            
+            def run(item: tuple) -> List[tuple]:
+                i, embedding = item
+                return self._query_index(queries[i], k, filters[i], embedding)
+            
+            with ThreadPoolExecutor(max_workers=max(1, min(settings.SEARCH_MANY_WORKERS, len(keys)))) as executor:
+                outputs = list(executor.map(run, zip(first, embeddings)))
+            
+            for key, output in zip(keys, outputs):
+                self.result_cache.put(key, output, version)
+                for n, i in enumerate(pending[key]):
+                    # Ogni posizione riceve Document propri (i metadata sono modificabili)
+                    results[i] = output if n == 0 else [
+                        (Document(id=doc.id, page_content=doc.page_content, metadata=dict(doc.metadata)), score)
+                        for doc, score in output
+                    ]
+        
+        logger.info(f"🔍 Ricerca multipla: {len(queries)} query, {len(pending)} eseguite sull'indice")
+        return results
+    
+    def _query_index(
+        self,
+        query: str,
+        k: int,
+        filter_dict: Optional[Dict],
+        embedding: Optional[List[float]] = None
+    ) -> List[tuple]:
+        """Embedding della query (se non fornito) e interrogazione dei namespace"""
+        index = self._get_index()
+        if embedding is None:
+            embedding = self.embed_query(query)
+        
+        if settings.HIERARCHICAL_RETRIEVAL:
+            filter_dict = self._narrow_to_manuals(embedding, filter_dict)
+        
+        namespaces, remaining_filter = self._route_filter(filter_dict)
+        if namespaces is None:
+            namespaces = self.list_namespaces()
+        
+        # Con la compressione si interroga l'indice ridotto e si riordinano k × oversample candidati
+        query_vector = self.compression.query_vector(embedding)
+        fetch_k = self.compression.fetch_k(k)
+        
+        def query_namespace(namespace: str) -> list:
+            response = index.query(
+                vector=query_vector,
+                top_k=fetch_k,
+                include_metadata=True,
+                namespace=namespace or None,
+                filter=remaining_filter
+            )
+            return list(response["matches"])
+        
+        with query_stage("search"):
+            try:
+                if len(namespaces) == 1:
+                    matches = query_namespace(namespaces[0])
+                else:
+                    with ThreadPoolExecutor(max_workers=min(8, len(namespaces))) as executor:
+                        matches = [match for partial in executor.map(query_namespace, namespaces) for match in partial]
+                    matches.sort(key=lambda match: match["score"], reverse=True)
+            except Exception:
+                ERRORS.inc(component="pinecone")
+                raise
+        
+        results = self.compression.rescore(embedding, self._to_documents(matches), k)
+        if settings.SMALL_TO_BIG:
+            results = self._expand(results)
+        return results
+    
+    def _narrow_to_manuals(self, embedding: List[float], filter_dict: Optional[Dict]) -> Optional[Dict]:
+        """
+        Primo stadio del retrieval gerarchico: restringe il filtro ai manuali candidati
+        
+        Con un filtro su modello (o su un manuale) la ricerca è già ristretta
+        e il filtro resta invariato; lo stesso se l'indice riassuntivo è
+        vuoto o il filtro non è applicabile ai vettori riassuntivi.
+        """
+        if filter_dict and ("modello" in filter_dict or "filename" in filter_dict):
+            return filter_dict
+        
+        candidates = get_summary_index().candidates(embedding, settings.HIERARCHY_TOP_MANUALS, filter_dict)
+        if not candidates:
+            return filter_dict
+        
+        logger.debug(f"🗂️  Manuali candidati: {[manual['filename'] for manual in candidates]}")
+        narrowed = {**(filter_dict or {}), "filename": {"$in": [manual["filename"] for manual in candidates]}}
+        
+        # Con il partizionamento per marca si interrogano solo i namespace dei candidati
+        marche = {manual["marca"] for manual in candidates}
+        if "marca" not in narrowed and None not in marche:
+            narrowed["marca"] = {"$in": sorted(marche)}
+        return narrowed
+    
+    def _to_documents(self, matches: list) -> List[tuple]:
+        """
+        Ricostruisce i Document dai risultati dell'indice
+        
+        Il testo è nei metadata del vettore (TEXT_KEY) o, per i vettori
+        indicizzati con il docstore, viene letto in locale per ID.
+        """
+        stored = {}
+        if self.docstore is not None:
+            missing = [match["id"] for match in matches if self.TEXT_KEY not in (match.get("metadata") or {})]
+            stored = self.docstore.get(missing)
+        
+        results = []
+        for match in matches:
+            metadata = dict(match.get("metadata") or {})
+            text = metadata.pop(self.TEXT_KEY, None)
+            if text is None:
+                if match["id"] not in stored:
+                    logger.warning(f"⚠️  Testo non trovato per il vettore {match['id']}: risultato ignorato")
+                    continue
+                text, metadata = stored[match["id"]]
+            results.append((Document(id=match["id"], page_content=text, metadata=metadata), match["score"]))
+        
+        return results
+    
+    def _expand(self, results: List[tuple]) -> List[tuple]:
+        """
+        Small-to-big: espande ogni risultato ai chunks adiacenti o alla pagina
+        
+        Gli intervalli sovrapposti o contigui dello stesso manuale vengono
+        fusi in un unico Document (score = migliore dei risultati fusi);
+        il testo dei vicini si legge dal docstore o, senza docstore,
+        dall'indice con una fetch per namespace.
+        """
+        adjacency = get_adjacency()
+        output = []
+        spans: Dict[str, List[list]] = {}
+        
+        for doc, score in results:
+            filename = manual_name(doc.metadata)
+            position = doc.metadata.get("chunk_index")
+            page = doc.metadata.get("page")
+            span = None
+            if filename and position is not None:
+                # Pinecone restituisce i numeri dei metadata come float
+                span = adjacency.expansion(
+                    filename, int(position), None if page is None else int(page),
+                    mode=settings.EXPANSION_MODE, window=settings.EXPANSION_WINDOW
+                )
+                if span is not None and not span[0] <= int(position) <= span[1]:
+                    # Adiacenza non aggiornata (manuale reindicizzato): chunk non espanso
+                    logger.debug(f"⚠️  Adiacenza non aggiornata per {filename}: chunk {int(position)} fuori da {span}")
+                    span = None
+            if span is None:
+                output.append((doc, score))
+            else:
+                spans.setdefault(filename, []).append([span[0], span[1], doc, score])
+        
+        # Intervalli dello stesso manuale sovrapposti o contigui: un solo Document
+        merged = []
+        for filename, items in spans.items():
+            items.sort(key=lambda item: item[0])
+            current = items[0]
+            for item in items[1:]:
+                if item[0] <= current[1] + 1:
+                    current[1] = max(current[1], item[1])
+                    if item[3] > current[3]:
+                        current[2], current[3] = item[2], item[3]
+                else:
+                    merged.append((filename, *current))
+                    current = item
+            merged.append((filename, *current))
+        
+        texts = self._fetch_texts(merged)
+        
+        for filename, first, last, doc, score in merged:
+            pieces = [texts.get(chunk_id(filename, i)) for i in range(first, last + 1)]
+            # Il risultato stesso è sempre incluso, anche se i vicini mancano
+            pieces[int(doc.metadata["chunk_index"]) - first] = doc.page_content
+            
+            metadata = {**doc.metadata, "chunk_range": [first, last]}
+            text = "\n".join(piece for piece in pieces if piece)
+            output.append((Document(id=range_id(filename, first, last), page_content=text, metadata=metadata), score))
+        
+        output.sort(key=lambda item: item[1], reverse=True)
+        return output
+    
+    def _fetch_texts(self, spans: List[tuple]) -> Dict[str, str]:
+        """Testo dei chunks negli intervalli da espandere, per ID vettore"""
+        ids_by_namespace: Dict[str, List[str]] = {}
+        for filename, first, last, doc, _ in spans:
+            namespace = self.namespace_for(doc.metadata.get("marca"))
+            ids_by_namespace.setdefault(namespace, []).extend(
+                chunk_id(filename, i) for i in range(first, last + 1)
+            )
+        
+        if self.docstore is not None:
+            ids = [id_ for ids in ids_by_namespace.values() for id_ in ids]
+            return {id_: text for id_, (text, _) in self.docstore.get(ids).items()}
+        
+        index = self._get_index()
+        texts = {}
+        for namespace, ids in ids_by_namespace.items():
+            for start in range(0, len(ids), 100):
+                response = index.fetch(ids=ids[start:start + 100], namespace=namespace or None)
+                # Client recenti: dataclass; client meno recenti e gRPC: modelli accessibili per chiave
+                vectors = response.vectors if hasattr(response, "vectors") else response["vectors"]
+                for id_, vector in vectors.items():
+                    metadata = vector.metadata if hasattr(vector, "metadata") else vector.get("metadata")
+                    text = (metadata or {}).get(self.TEXT_KEY)
+                    if text is not None:
+                        texts[id_] = text
+        return texts
+    
+    def embed_query(self, query: str) -> List[float]:
+        """
+        Embedding di una query (dalla cache se già calcolato)
+        
+        La forma normalizzata della query è solo la chiave della cache:
+        viene sempre embeddato il testo originale, con o senza cache.
+        """
+        with query_stage("embedding"):
+            use_cache = settings.ENABLE_CACHE
+            vector = self.embedding_cache.get(query) if use_cache else None
+            if use_cache:
+                record_cache("embedding", vector is not None)
+            if vector is None:
+                try:
+                    vector = self.embeddings.embed_query(query)
+                except Exception:
+                    ERRORS.inc(component="embedding")
+                    raise
+                if use_cache:
+                    self.embedding_cache.put(query, vector)
+            return vector
+    
+    def embed_queries(self, queries: Sequence[str]) -> List[List[float]]:
+        """
+        Embedding di più query (dalla cache se già calcolati)
+        
+        Le query mancanti vengono calcolate insieme con la semantica di
+        embed_query (src.embeddings.embed_queries), con gli stessi tempi,
+        hit/miss e conteggio degli errori della singola query.
+        """
+        from src.embeddings import embed_queries
+        
+        with query_stage("embedding"):
+            use_cache = settings.ENABLE_CACHE
+            vectors: Dict[str, List[float]] = {}
+            missing: Dict[str, str] = {}
+            # Query uguali a meno della normalizzazione: embedding della prima
+            for query in queries:
+                key = normalize_query(query)
+                if key in vectors or key in missing:
+                    continue
+                vector = self.embedding_cache.get(key) if use_cache else None
+                if use_cache:
+                    record_cache("embedding", vector is not None)
+                if vector is None:
+                    missing[key] = query
+                else:
+                    vectors[key] = vector
+            
+            if missing:
+                try:
+                    computed = embed_queries(self.embeddings, list(missing.values()))
+                except Exception:
+                    ERRORS.inc(component="embedding")
+                    raise
+                for key, vector in zip(missing, computed):
+                    vectors[key] = vector
+                    if use_cache:
+                        self.embedding_cache.put(key, vector)
+            return [vectors[normalize_query(query)] for query in queries]
+    
     def search(
         self,
         query: str,
@@ -176,12 +739,7 @@ class VectorStoreManager:
             k = settings.RETRIEVAL_K
         
         try:
-            vectorstore = self.get_vectorstore()
-            
-            if filter_dict:
-                results = vectorstore.similarity_search(query, k=k, filter=filter_dict)
-            else:
-                results = vectorstore.similarity_search(query, k=k)
+            results = [doc for doc, _ in self.similarity_search_with_score(query, k, filter_dict)]
             
             logger.info(f"🔍 Trovati {len(results)} risultati per: '{query}'")
             return results
@@ -190,6 +748,35 @@ class VectorStoreManager:
             logger.error(f"❌ Errore ricerca: {e}")
             return []
     
+    def search_many(
+        self,
+        queries: Sequence[str],
+        filters: Optional[Union[Dict, Sequence[Optional[Dict]]]] = None,
+        k: int = None
+    ) -> List[List[Document]]:
+        """
+        Cerca documenti per più query (valutazioni, pre-warming, confronti)
+        
+        Args:
+            queries: Query di ricerca
+            filters: Un filtro per tutte le query o una lista (uno per query)
+            k: Numero di risultati per query
+        
+        Returns:
+            Liste di documenti rilevanti, nello stesso ordine delle query
+        """
+        if k is None:
+            k = settings.RETRIEVAL_K
+        
+        try:
+            return [
+                [doc for doc, _ in results]
+                for results in self.similarity_search_many(queries, k, filters)
+            ]
+        except Exception as e:
+            logger.error(f"❌ Errore ricerca multipla: {e}")
+            return [[] for _ in queries]
+    
     def search_with_score(
         self,
         query: str,
@@ -206,12 +793,7 @@ class VectorStoreManager:
             k = settings.RETRIEVAL_K
         
         try:
-            vectorstore = self.get_vectorstore()
-            
-            if filter_dict:
-                results = vectorstore.similarity_search_with_score(query, k=k, filter=filter_dict)
-            else:
-                results = vectorstore.similarity_search_with_score(query, k=k)
+            results = self.similarity_search_with_score(query, k, filter_dict)
             
             # Filtra per threshold
             filtered_results = [
@@ -230,13 +812,16 @@ class VectorStoreManager:
             logger.error(f"❌ Errore ricerca con score: {e}")
             return []
     
+    def _get_index(self):
+        """Indice Pinecone (connessione al primo utilizzo)"""
+        if self.index is None:
+            self.index = get_pinecone_index()
+        return self.index
+    
     def get_index_stats(self) -> Dict:
         """Ottieni statistiche sull'indice"""
         try:
-            if self.index is None:
-                self.index = self.pc.Index(settings.PINECONE_INDEX_NAME)
-            
-            stats = self.index.describe_index_stats()
+            stats = self._get_index().describe_index_stats()
             return stats
             
         except Exception as e:
@@ -257,10 +842,21 @@ class VectorStoreManager:
         try:
             logger.warning("🗑️  Eliminazione di tutti i vettori...")
             
-            if self.index is None:
-                self.index = self.pc.Index(settings.PINECONE_INDEX_NAME)
-            
-            self.index.delete(delete_all=True)
+            self._get_index()
+            
+            # delete_all agisce su un solo namespace: svuota ogni partizione
+            namespaces = self.list_namespaces() if settings.NAMESPACE_BY_BRAND else [""]
+            for namespace in namespaces:
+                self.index.delete(delete_all=True, namespace=namespace or None)
+            
+            self._namespaces = None
+            self.result_cache.invalidate()
+            self.compression.clear()
+            if self.docstore is not None:
+                self.docstore.clear()
+            if Path(settings.SUMMARY_INDEX_PATH).exists():
+                update_summary_index(lambda summaries: summaries.clear())
+            update_catalog(lambda catalog: catalog.clear())
             logger.info("✅ Tutti i vettori eliminati")
             
         except Exception as e:
@@ -279,13 +875,35 @@ class VectorStoreManager:
             logger.warning("⚠️  Eliminazione annullata. Passa confirm=True per confermare.")
             return
         
+        if not filter_dict:
+            logger.warning("⚠️  Filtro vuoto: usa delete_all per svuotare l'indice.")
+            return
+        
         try:
             logger.info(f"🗑️  Eliminazione vettori con filtro: {filter_dict}")
             
-            if self.index is None:
-                self.index = self.pc.Index(settings.PINECONE_INDEX_NAME)
-            
-            self.index.delete(filter=filter_dict)
+            self._get_index()
+            
+            namespaces, remaining_filter = self._route_filter(filter_dict)
+            if namespaces is None:
+                namespaces = self.list_namespaces()
+            
+            for namespace in namespaces:
+                if remaining_filter:
+                    self.index.delete(filter=remaining_filter, namespace=namespace or None)
+                else:
+                    # Filtro solo su marca: si elimina l'intero namespace
+                    logger.info(f"🗑️  Eliminazione namespace '{namespace}'")
+                    self.index.delete(delete_all=True, namespace=namespace or None)
+            
+            self._namespaces = None
+            self.result_cache.invalidate()
+            if self.docstore is not None:
+                self.docstore.delete_where(filter_dict)
+            self.compression.delete_where(filter_dict)
+            if Path(settings.SUMMARY_INDEX_PATH).exists():
+                update_summary_index(lambda summaries: summaries.remove(filter_dict))
+            update_catalog(lambda catalog: catalog.remove(filter_dict))
             logger.info("✅ Vettori eliminati")
             
         except Exception as e:
@@ -299,12 +917,17 @@ class VectorStoreManager:
         Args:
             search_kwargs: Parametri di ricerca personalizzati
         """
-        vectorstore = self.get_vectorstore()
+        from src.retriever import ManagerRetriever
         
         if search_kwargs is None:
             search_kwargs = {"k": settings.RETRIEVAL_K}
         
-        return vectorstore.as_retriever(search_kwargs=search_kwargs)
+        return ManagerRetriever(manager=self, search_kwargs=search_kwargs)
+
+
+def get_vectorstore_manager() -> VectorStoreManager:
+    """VectorStoreManager condiviso dal processo (client, cache e indici locali riusati)"""
+    return shared("vectorstore_manager", VectorStoreManager)
 
 
 def display_search_results(results: List[tuple], max_content_length: int = 200):
@@ -0,0 +1,171 @@
+"""
+Warm-up del processo: client, indici locali e query di prova prima del traffico
+"""
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Passi del warm-up, nell'ordine di esecuzione
+STEPS = ("chatbot", "index", "local_indexes", "embedding", "search", "llm")
+
+
+class Warmup:
+    """
+    Stato del warm-up di un worker (API)
+    
+    run() esegue i passi in sequenza misurandone la latenza: creazione
+    del chatbot (client Pinecone, embedding e LLM, chain), connessione
+    all'indice, caricamento di catalogo e indici locali e infine una
+    query di prova attraverso embedding, ricerca e LLM. Il worker è
+    pronto solo quando tutti i passi sono riusciti.
+    """
+    
+    def __init__(
+        self,
+        chatbot_factory: Optional[Callable] = None,
+        probe_question: Optional[str] = None,
+        probe_llm: Optional[bool] = None
+    ):
+        self.chatbot_factory = chatbot_factory
+        self.probe_question = probe_question or settings.WARMUP_PROBE_QUESTION
+        self.probe_llm = settings.WARMUP_PROBE_LLM if probe_llm is None else probe_llm
+        self.chatbot = None
+        self.state = "pending"
+        self.attempts = 0
+        self.current_step: Optional[str] = None
+        self.started_at: Optional[str] = None
+        self.ready_at: Optional[str] = None
+        self.error: Optional[str] = None
+        self.steps: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._created = time.time()
+    
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+    
+    def run(self) -> bool:
+        """
+        Esegue il warm-up (bloccante: da chiamare in un thread)
+        
+        Returns:
+            True se il worker è pronto, False se un passo è fallito
+            (lo stato riporta passo ed errore; run() può essere ripetuto)
+        """
+        with self._lock:
+            self.state = "running"
+            self.attempts += 1
+            self.error = None
+            self.started_at = datetime.now().isoformat(timespec="seconds")
+            self.steps = {name: {"status": "pending"} for name in STEPS}
+        
+        logger.info(f"🔥 Warm-up (tentativo {self.attempts})...")
+        
+        for name in STEPS:
+            step = getattr(self, f"_step_{name}")
+            with self._lock:
+                self.current_step = name
+                self.steps[name]["status"] = "running"
+            
+            start = time.perf_counter()
+            try:
+                detail = step()
+            except Exception as e:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.steps[name] = {"status": "failed", "ms": round(elapsed * 1000, 1), "error": str(e)}
+                    self.state = "failed"
+                    self.error = f"{name}: {e}"
+                    self.current_step = None
+                logger.error(f"❌ Warm-up fallito ({name}): {e}")
+                return False
+            
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.steps[name] = {"status": "ok" if detail != "skipped" else "skipped", "ms": round(elapsed * 1000, 1)}
+                if isinstance(detail, dict):
+                    self.steps[name].update(detail)
+        
+        with self._lock:
+            self.state = "ready"
+            self.current_step = None
+            self.ready_at = datetime.now().isoformat(timespec="seconds")
+        
+        total = sum(step.get("ms", 0) for step in self.steps.values())
+        logger.info(f"✅ Warm-up completato in {total / 1000:.1f}s")
+        return True
+    
+    def _step_chatbot(self):
+        """Client condivisi (Pinecone, embedding, LLM) e chain"""
+        if self.chatbot is None:
+            if self.chatbot_factory is None:
+                from src.qa_chain import OfficinaChatbot
+                
+                self.chatbot_factory = OfficinaChatbot
+            self.chatbot = self.chatbot_factory()
+    
+    def _step_index(self):
+        """Connessione all'indice Pinecone (pool HTTP/gRPC aperto)"""
+        stats = self.chatbot.vectorstore_manager.get_index_stats()
+        if not stats:
+            raise RuntimeError("Indice Pinecone non raggiungibile")
+        total = stats.get("total_vector_count") if hasattr(stats, "get") else None
+        return {"vectors": total}
+    
+    def _step_local_indexes(self):
+        """Catalogo, indici di adiacenza/riassuntivo e docstore da disco"""
+        from src.catalog import get_catalog
+        
+        detail = {"brands": len(get_catalog().get_brands())}
+        if settings.SMALL_TO_BIG:
+            from src.adjacency import get_adjacency
+            
+            detail["adjacency_manuals"] = len(get_adjacency())
+        if settings.HIERARCHICAL_RETRIEVAL:
+            from src.hierarchy import get_summary_index
+            
+            detail["summary_manuals"] = get_summary_index().manuals
+        
+        docstore = self.chatbot.vectorstore_manager.docstore
+        if docstore is not None:
+            detail["docstore_chunks"] = len(docstore)
+        return detail
+    
+    def _step_embedding(self):
+        """Embedding della query di prova (carica il modello locale o apre la connessione)"""
+        self.chatbot.vectorstore_manager.embed_query(self.probe_question)
+    
+    def _step_search(self):
+        """Ricerca di prova sull'indice (search() restituirebbe [] anche in caso di errore)"""
+        results = self.chatbot.vectorstore_manager.similarity_search_with_score(self.probe_question, k=1)
+        return {"results": len(results)}
+    
+    def _step_llm(self):
+        """Completamento minimo dell'LLM (disattivabile: consuma token)"""
+        if not self.probe_llm:
+            return "skipped"
+        self.chatbot.llm.invoke(settings.WARMUP_PROBE_PROMPT)
+    
+    def status(self) -> Dict:
+        """Progresso del warm-up e latenza di ogni dipendenza"""
+        with self._lock:
+            done = sum(1 for step in self.steps.values() if step["status"] in ("ok", "skipped"))
+            return {
+                "state": self.state,
+                "ready": self.ready,
+                "attempts": self.attempts,
+                "current_step": self.current_step,
+                "progress": f"{done}/{len(STEPS)}",
+                "started_at": self.started_at,
+                "ready_at": self.ready_at,
+                "uptime_seconds": round(time.time() - self._created, 1),
+                "error": self.error,
+                "steps": {name: dict(step) for name, step in self.steps.items()},
+            }
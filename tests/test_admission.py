@@ -0,0 +1,131 @@
+"""
+Test per il controllo di ammissione dell'API (concorrenza, coda e rate limit)
+"""
+import pytest
+
+
+def test_rate_limiter_per_key_with_retry_after():
+    """Ogni API key ha il proprio bucket; esaurito il burst, 429 con l'attesa per il prossimo token"""
+    from src.admission import Overloaded, RateLimiter, TokenBucket
+    
+    limiter = RateLimiter(per_minute=60, burst=3)
+    for _ in range(3):
+        limiter.check("officina-a")
+    
+    with pytest.raises(Overloaded) as excinfo:
+        limiter.check("officina-a")
+    assert excinfo.value.reason == "rate_limit"
+    assert 0 < excinfo.value.retry_after <= 1
+    assert excinfo.value.retry_after_header == "1"
+    
+    limiter.check("officina-b")
+    
+    bucket = TokenBucket(rate=2, burst=2)
+    assert bucket.take(now=bucket.updated) == 0
+    assert bucket.take(now=bucket.updated) == 0
+    assert bucket.take(now=bucket.updated) == pytest.approx(0.5)
+    assert bucket.take(now=bucket.updated + 0.5) == 0
+
+
+def test_batch_consumes_one_token_per_question():
+    """Un batch consuma un token per domanda: esaurisce il bucket come altrettante richieste"""
+    from src.admission import Overloaded, RateLimiter, TokenBucket
+    
+    limiter = RateLimiter(per_minute=60, burst=10)
+    limiter.check("officina-a", cost=4)
+    limiter.check("officina-a", cost=6)
+    with pytest.raises(Overloaded) as excinfo:
+        limiter.check("officina-a")
+    assert excinfo.value.reason == "rate_limit"
+    
+    # Batch oltre il burst: ammesso a bucket pieno, lascia il bucket in debito
+    bucket = TokenBucket(rate=1, burst=10)
+    start = bucket.updated
+    assert bucket.take(now=start, cost=50) == 0
+    assert bucket.take(now=start, cost=1) == pytest.approx(41)
+    assert bucket.take(now=start + 40, cost=50) == pytest.approx(10)
+    assert bucket.take(now=start + 41, cost=1) == 0
+
+
+def test_admission_queue_bounds_and_timeouts():
+    """Oltre i posti attivi le richieste attendono in coda; a coda piena o ad attesa scaduta, 503"""
+    import asyncio
+    from src.admission import AdmissionController, Overloaded
+    
+    async def scenario():
+        admission = AdmissionController(max_concurrent=2, max_queue=1, queue_timeout=0.2)
+        release = asyncio.Event()
+        order = []
+        
+        async def work(name):
+            async with admission.slot():
+                order.append(name)
+                await release.wait()
+        
+        running = [asyncio.create_task(work(name)) for name in ("a", "b")]
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(work("c"))
+        await asyncio.sleep(0)
+        assert admission.stats()["active"] == 2
+        assert admission.stats()["queued"] == 1
+        
+        with pytest.raises(Overloaded) as full:
+            async with admission.slot():
+                pass
+        assert full.value.reason == "queue_full"
+        
+        release.set()
+        await asyncio.gather(*running, queued)
+        assert order == ["a", "b", "c"]
+        assert admission.stats()["active"] == 0
+        
+        release.clear()
+        blocked = [asyncio.create_task(work(name)) for name in ("d", "e")]
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as timeout:
+            async with admission.slot():
+                pass
+        assert timeout.value.reason == "queue_timeout"
+        assert admission.stats()["queued"] == 0
+        release.set()
+        await asyncio.gather(*blocked)
+    
+    asyncio.run(scenario())
+
+
+def test_admission_slot_held_by_background_work():
+    """Il lavoro ancora in corso dopo la risposta trattiene il posto fino alla sua fine"""
+    import asyncio
+    from concurrent.futures import Future
+    from src.admission import AdmissionController
+    
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=1)
+        background = Future()
+        
+        async with admission.slot() as held:
+            held.append(background)
+        assert admission.stats()["active"] == 1
+        assert admission.stats()["held"] == 1
+        
+        admitted = asyncio.Event()
+        
+        async def next_request():
+            async with admission.slot():
+                admitted.set()
+        
+        waiting = asyncio.create_task(next_request())
+        await asyncio.sleep(0.05)
+        assert not admitted.is_set()
+        
+        background.set_result(None)
+        await asyncio.wait_for(waiting, 1)
+        assert admitted.is_set()
+        assert admission.stats()["held"] == 0
+        assert admission.stats()["active"] == 0
+    
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -25,6 +25,26 @@ def test_config():
     assert settings.RETRIEVAL_K > 0
 
 
+def test_imports_are_lazy():
+    """Test che l'import dei moduli non carichi SDK e catene LangChain"""
+    import json
+    import subprocess
+    import sys
+    
+    heavy = ["langchain.chains", "langchain_pinecone", "pinecone", "openai", "anthropic",
+             "langchain_openai", "langchain_anthropic", "streamlit"]
+    code = (
+        "import json, sys; import config, src, src.vectorstore, src.qa_chain, src.document_processor; "
+        f"print(json.dumps([name for name in {heavy!r} if name in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=Path(__file__).parent.parent, capture_output=True, text=True
+    )
+    
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []
+
 def test_manual_processor():
     """Test processor manuali"""
     from src import ManualProcessor
@@ -0,0 +1,97 @@
+"""
+Test per il catalogo dei manuali indicizzati
+"""
+import pytest
+
+
+def make_catalog():
+    """Catalogo con due marche"""
+    from src.catalog import ManualCatalog
+    
+    catalog = ManualCatalog()
+    catalog.add("FIAT", "500", "2020", 10)
+    catalog.add("FIAT", "Panda", "2018", 5)
+    catalog.add("VW", "Golf", None, 7)
+    return catalog
+
+
+def test_validate_filters_rejects_impossible_combinations():
+    """Filtri senza manuali corrispondenti vengono rifiutati prima della query"""
+    from src.catalog import ManualCatalog
+    
+    catalog = make_catalog()
+    
+    assert catalog.validate_filters({"marca": "fiat", "modello": "500"}) is None
+    assert catalog.validate_filters({"anno": "2018"}) is None
+    assert catalog.validate_filters({"marca": {"$in": ["BMW"]}}) is None
+    assert "BMW" in catalog.validate_filters({"marca": "BMW"})
+    assert "Golf" in catalog.validate_filters({"marca": "FIAT", "modello": "Golf"})
+    assert "2018" in catalog.validate_filters({"marca": "FIAT", "modello": "500", "anno": "2018"})
+    assert ManualCatalog().validate_filters({"marca": "BMW"}) is None
+
+
+def test_add_documents_chunk_store_and_remove():
+    """Il catalogo conta i chunks per manuale e segue le eliminazioni"""
+    from langchain.schema import Document
+    from src.document_processor import ChunkStore
+    from src.catalog import ManualCatalog
+    
+    store = ChunkStore.from_documents([
+        Document(page_content=f"chunk {i}", metadata={"marca": "FIAT", "modello": "500", "anno": "2020"})
+        for i in range(3)
+    ])
+    catalog = ManualCatalog()
+    catalog.add_documents(store)
+    catalog.add("VW", "Golf", "2019")
+    etag = catalog.etag
+    
+    assert catalog.brands["FIAT"] == {"500": {"2020": 3}}
+    assert catalog.get_years("fiat", "500") == ["2020"]
+    
+    catalog.remove({"marca": "VW"})
+    
+    assert catalog.get_brands() == ["FIAT"]
+    assert catalog.etag != etag
+
+
+def test_reindex_replaces_manual_counts(tmp_path):
+    """Reindicizzare un manuale senza --clear ne sostituisce i chunks invece di sommarli"""
+    from langchain.schema import Document
+    from src.catalog import ManualCatalog
+    
+    def chunks(manual, n):
+        metadata = {"marca": "FIAT", "modello": "500", "anno": "2020", "manual": manual, "filename": "FIAT_500_2020.pdf"}
+        return [Document(page_content=f"chunk {i}", metadata=metadata) for i in range(n)]
+    
+    catalog = ManualCatalog()
+    catalog.add_documents(chunks("officina/FIAT_500_2020.pdf", 3) + chunks("carrozzeria/FIAT_500_2020.pdf", 2))
+    catalog.add_documents(chunks("officina/FIAT_500_2020.pdf", 4))
+    assert catalog.brands["FIAT"] == {"500": {"2020": 6}}
+    
+    catalog.save(tmp_path / "catalog.json")
+    catalog = ManualCatalog.load(tmp_path / "catalog.json")
+    catalog.add_documents(chunks("carrozzeria/FIAT_500_2020.pdf", 2))
+    assert catalog.brands["FIAT"] == {"500": {"2020": 6}}
+    
+    catalog.remove({"marca": "FIAT", "modello": "500"})
+    assert catalog.files == {}
+    catalog.add_documents(chunks("officina/FIAT_500_2020.pdf", 1))
+    assert catalog.brands["FIAT"] == {"500": {"2020": 1}}
+
+
+def test_get_catalog_reloads_after_update(tmp_path, monkeypatch):
+    """Il catalogo condiviso viene salvato e riletto da disco"""
+    from config import settings
+    from src import catalog as catalog_module
+    
+    monkeypatch.setattr(settings, "CATALOG_PATH", tmp_path / "catalog.json")
+    monkeypatch.setattr(catalog_module, "_catalog", None)
+    
+    catalog_module.update_catalog(lambda catalog: catalog.add("FIAT", "500", "2020", 2))
+    monkeypatch.setattr(catalog_module, "_catalog", None)
+    
+    assert catalog_module.get_catalog().get_models("FIAT") == ["500"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,48 @@
+"""
+Test per il registro dei client condivisi
+"""
+import pytest
+
+
+def test_shared_creates_client_once():
+    """Ogni client viene creato una sola volta anche con richieste concorrenti"""
+    from concurrent.futures import ThreadPoolExecutor
+    from src.clients import reset_clients, shared
+    
+    created = []
+    
+    def factory():
+        created.append(object())
+        return created[-1]
+    
+    reset_clients()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        clients = list(executor.map(lambda _: shared("test", factory), range(32)))
+    
+    assert len(created) == 1
+    assert all(client is created[0] for client in clients)
+    
+    reset_clients()
+    assert shared("test", factory) is not created[0]
+
+
+def test_llm_client_shared_per_configuration(monkeypatch):
+    """Lo stesso LLM viene riusato finché la configurazione non cambia"""
+    from config import settings
+    from src.clients import get_llm_client, reset_clients
+    
+    monkeypatch.setattr(settings, "LLM_PROVIDER", "openai")
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "sk-test")
+    reset_clients()
+    
+    first = get_llm_client()
+    assert get_llm_client() is first
+    assert first.request_timeout == settings.LLM_TIMEOUT
+    
+    monkeypatch.setattr(settings, "LLM_TEMPERATURE", 0.5)
+    assert get_llm_client() is not first
+    reset_clients()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
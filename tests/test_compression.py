@@ -0,0 +1,79 @@
+"""
+Test per la compressione dei vettori
+"""
+import pytest
+
+
+def make_vectors(n, dim=64, rank=12, seed=0):
+    """Vettori con struttura a basso rango (come gli embedding reali)"""
+    import numpy as np
+    
+    rng = np.random.default_rng(seed)
+    basis = rng.normal(size=(rank, dim))
+    return rng.normal(size=(n, rank)) @ basis + 0.05 * rng.normal(size=(n, dim))
+
+
+def test_evaluate_compression_recall_vs_size():
+    """Il report confronta recall e byte per vettore; il re-scoring recupera recall"""
+    from src.compression import evaluate_compression
+    
+    corpus = make_vectors(400)
+    queries = make_vectors(20, seed=1)
+    
+    rows = evaluate_compression(corpus, queries, k=5, dims=(16,), methods=("truncate", "pca"))
+    by_config = {(row["method"], row["dim"], row["rescore"]): row for row in rows}
+    
+    assert by_config[("none", 64, False)]["recall"] == 1.0
+    assert by_config[("int8", 64, False)]["recall"] >= 0.9
+    assert by_config[("pca", 16, False)]["compression_ratio"] == 4.0
+    assert by_config[("pca", 16, True)]["recall"] >= 0.9
+    assert by_config[("truncate", 16, True)]["recall"] >= by_config[("truncate", 16, False)]["recall"]
+
+
+def test_vector_compression_rescores_with_full_vectors(tmp_path):
+    """L'indice riceve vettori ridotti; i candidati vengono riordinati sui vettori completi"""
+    from langchain.schema import Document
+    from src.compression import VectorCompression
+    
+    vectors = make_vectors(50)
+    compression = VectorCompression("pca", 8, rescore=True, oversample=3, directory=tmp_path)
+    
+    assert compression.needs_fit
+    compression.fit(vectors.tolist())
+    ids = [f"v{i}" for i in range(50)]
+    reduced = compression.prepare(ids, vectors.tolist())
+    
+    assert len(reduced[0]) == compression.index_dimension(64) == 8
+    assert len(compression.query_vector(vectors[0].tolist())) == 8
+    assert compression.fetch_k(5) == 15
+    
+    candidates = [(Document(id=f"v{i}", page_content=str(i)), 0.5) for i in (3, 0, 7)]
+    rescored = compression.rescore(vectors[0].tolist(), candidates, k=2)
+    
+    assert rescored[0][0].id == "v0" and rescored[0][1] == pytest.approx(1.0, abs=1e-5)
+    assert not VectorCompression("pca", 8, directory=tmp_path).needs_fit
+
+
+def test_full_vectors_are_exact_and_pruned_by_filter(tmp_path):
+    """I vettori completi sono float32 esatti e vengono eliminati con i manuali"""
+    import numpy as np
+    from src.compression import FullVectorStore
+    
+    vectors = make_vectors(4).astype(np.float32)
+    store = FullVectorStore(tmp_path / "full_vectors.sqlite")
+    store.add(["a", "b", "c", "d"], vectors, [
+        {"marca": "fiat", "modello": "500", "anno": "2020"},
+        {"marca": "FIAT", "modello": "Panda"},
+        {"marca": "VW", "modello": "Golf"},
+        {},
+    ])
+    
+    assert np.array_equal(store.get(["a"])["a"], vectors[0])
+    assert store.delete_where({"marca": "FIAT", "modello": "500"}) == 1
+    assert store.delete_where({"marca": "fiat"}) == 1
+    assert store.delete_where({"marca": {"$in": ["VW"]}}) is None
+    assert sorted(store.get(["a", "b", "c", "d"])) == ["c", "d"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
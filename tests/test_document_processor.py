@@ -0,0 +1,163 @@
+"""
+Test per l'elaborazione documenti
+"""
+import pytest
+
+
+def test_chunk_store_interns_metadata():
+    """Le pagine dello stesso manuale condividono i metadata"""
+    from langchain.schema import Document
+    from src.document_processor import ChunkStore
+    
+    base = {"filename": "FIAT_500_2020_Manuale.pdf", "marca": "FIAT", "modello": "500"}
+    docs = [
+        Document(page_content=f"Pagina {i} è qui", metadata={**base, "page": i})
+        for i in range(3)
+    ]
+    
+    store = ChunkStore.from_documents(docs)
+    
+    assert len(store) == 3
+    assert len(store._manuals) == 1
+    assert store[1].page_content == "Pagina 1 è qui"
+    assert store[1].metadata == {**base, "page": 1}
+    assert [doc.metadata["page"] for doc in store[-2:]] == [1, 2]
+
+
+def test_chunk_store_split_keeps_page():
+    """Lo split produce chunks con pagina, metadata del manuale e posizione"""
+    from langchain.schema import Document
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from src.document_processor import ChunkStore
+    
+    splitter = RecursiveCharacterTextSplitter(chunk_size=20, chunk_overlap=0)
+    store = ChunkStore.from_documents([
+        Document(page_content="uno due tre quattro cinque sei sette", metadata={"marca": "FIAT", "page": 7})
+    ])
+    
+    chunks = store.split(splitter)
+    
+    assert len(chunks) > 1
+    assert [doc.metadata for doc in chunks] == [
+        {"marca": "FIAT", "page": 7, "chunk_index": i} for i in range(len(chunks))
+    ]
+    assert " ".join(doc.page_content for doc in chunks) == store.text(0)
+
+
+def test_split_positions_are_per_manual_path(tmp_path):
+    """Manuali omonimi in cartelle diverse hanno posizioni e ID distinti"""
+    from langchain.schema import Document
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from src.adjacency import chunk_id, manual_name
+    from src.document_processor import ChunkStore, ManualProcessor
+    
+    processor = ManualProcessor(tmp_path)
+    manuals = [processor.manual_path(tmp_path / folder / "FIAT_500_2020.pdf") for folder in ("officina", "carrozzeria")]
+    assert manuals == ["officina/FIAT_500_2020.pdf", "carrozzeria/FIAT_500_2020.pdf"]
+    
+    splitter = RecursiveCharacterTextSplitter(chunk_size=20, chunk_overlap=0)
+    chunks = ChunkStore.from_documents([
+        Document(page_content="uno due tre quattro", metadata={"filename": "FIAT_500_2020.pdf", "manual": manual, "page": 1})
+        for manual in manuals
+    ]).split(splitter)
+    
+    assert [doc.metadata["chunk_index"] for doc in chunks] == [0, 0]
+    ids = {chunk_id(manual_name(doc.metadata), doc.metadata["chunk_index"]) for doc in chunks}
+    assert len(ids) == 2
+
+
+def test_pdf_extractor_fallback():
+    """Se il motore principale fallisce si passa al successivo"""
+    from pathlib import Path
+    from src.document_processor import ManualProcessor, PDFExtractor, get_pdf_extractor
+    
+    class BrokenExtractor(PDFExtractor):
+        name = "broken"
+        
+        def extract_pages(self, pdf_path, start=0, end=None):
+            raise ValueError("PDF corrotto")
+    
+    class StaticExtractor(PDFExtractor):
+        name = "static"
+        
+        def extract_pages(self, pdf_path, start=0, end=None):
+            return [(0, "Coppia di serraggio 25 Nm")]
+    
+    with pytest.raises(ValueError):
+        get_pdf_extractor("inesistente")
+    
+    processor = ManualProcessor(extractor="pypdf")
+    processor.extractors = [BrokenExtractor(), StaticExtractor()]
+    
+    docs = processor.load_pdf(Path("FIAT_500_2020_Manuale.pdf"))
+    
+    assert len(docs) == 1
+    assert docs[0].metadata["extractor"] == "static"
+    assert docs[0].metadata["marca"] == "FIAT"
+    assert docs[0].metadata["page"] == 0
+
+
+def test_parse_cache_skips_unchanged_manuals(tmp_path, monkeypatch):
+    """Un secondo run (es. dry run ripetuto) riusa il testo estratto finché il PDF non cambia"""
+    from config import settings
+    from src.document_processor import ManualProcessor, PDFExtractor
+    
+    monkeypatch.setattr(settings, "PARSE_CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(settings, "EXTRACT_TABLES", False)
+    manuals = tmp_path / "manuali"
+    (manuals / "officina").mkdir(parents=True)
+    pdf = manuals / "officina" / "FIAT_500_2020.pdf"
+    pdf.write_bytes(b"%PDF-1.4")
+    calls = []
+    
+    class StaticExtractor(PDFExtractor):
+        name = "static"
+        
+        def extract_pages(self, pdf_path, start=0, end=None):
+            calls.append(pdf_path.name)
+            return [(0, "Coppia di serraggio testata 25 Nm"), (1, "Olio motore 5W-30")]
+    
+    def run():
+        processor = ManualProcessor(manuals, workers=1, parse_cache=True)
+        processor.extractors = [StaticExtractor()]
+        return processor, processor.process_all_manuals(use_ocr=False)
+    
+    _, first = run()
+    processor, second = run()
+    
+    assert calls == ["FIAT_500_2020.pdf"]
+    assert processor.report.counters["files_cached"] == 1
+    assert [(doc.page_content, doc.metadata) for doc in second] == [(doc.page_content, doc.metadata) for doc in first]
+    assert second[1].metadata["manual"] == "officina/FIAT_500_2020.pdf"
+    
+    pdf.write_bytes(b"%PDF-1.4 modificato")
+    run()
+    assert len(calls) == 2
+
+
+def test_plan_work_units_shards_large_manuals():
+    """I manuali lunghi vengono divisi in intervalli di pagine ordinati"""
+    from pathlib import Path
+    from src.document_processor import ManualProcessor, PDFExtractor
+    
+    class CountingExtractor(PDFExtractor):
+        name = "counting"
+        
+        def page_count(self, pdf_path):
+            return 450 if "Golf" in pdf_path.name else 30
+    
+    processor = ManualProcessor(workers=4, shard_pages=200)
+    processor.extractors = [CountingExtractor()]
+    
+    units = processor.plan_work_units([Path("FIAT_500_2020.pdf"), Path("VW_Golf_2019.pdf")])
+    
+    assert [(u.pdf_path.name, u.start, u.end) for u in units] == [
+        ("FIAT_500_2020.pdf", 0, None),
+        ("VW_Golf_2019.pdf", 0, 200),
+        ("VW_Golf_2019.pdf", 200, 400),
+        ("VW_Golf_2019.pdf", 400, 450),
+    ]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
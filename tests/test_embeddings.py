@@ -0,0 +1,41 @@
+"""
+Test per i provider di embedding
+"""
+import pytest
+
+
+def test_batcher_groups_concurrent_queries():
+    """Le query concorrenti vengono calcolate in pochi batch, ognuna con il proprio vettore"""
+    from concurrent.futures import ThreadPoolExecutor
+    from src.embeddings import EmbeddingBatcher
+    
+    batch_sizes = []
+    
+    def embed(texts):
+        batch_sizes.append(len(texts))
+        return [[float(len(text))] for text in texts]
+    
+    batcher = EmbeddingBatcher(embed, max_batch_size=4, max_wait_ms=50)
+    texts = ["a" * i for i in range(1, 9)]
+    
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        vectors = list(executor.map(batcher.submit, texts))
+    
+    assert vectors == [[float(i)] for i in range(1, 9)]
+    assert sum(batch_sizes) == 8
+    assert max(batch_sizes) <= 4
+    assert len(batch_sizes) < 8
+
+
+def test_embedding_dimension_from_provider():
+    """La dimensione dell'indice viene dal provider, non da un valore fisso"""
+    from types import SimpleNamespace
+    from src.embeddings import embedding_dimension
+    
+    assert embedding_dimension(SimpleNamespace(dimension=384)) == 384
+    assert embedding_dimension(SimpleNamespace(model="text-embedding-3-large", dimensions=None)) == 3072
+    assert embedding_dimension(SimpleNamespace(model="text-embedding-3-large", dimensions=256)) == 256
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,122 @@
+"""
+Test per la strumentazione dell'indicizzazione
+"""
+import pytest
+
+
+def test_estimate_indexing_uses_reference_throughput():
+    """La stima usa il throughput misurato in un'esecuzione precedente"""
+    from langchain.schema import Document
+    from src.document_processor import ChunkStore
+    from src.instrumentation import IngestionReport, estimate_indexing
+    
+    chunks = ChunkStore.from_documents([
+        Document(page_content="Coppia di serraggio testata " * 10, metadata={"marca": "FIAT", "page": i})
+        for i in range(4)
+    ])
+    report = IngestionReport(live=False)
+    report.add_time("parse", 2.0)
+    reference = {"throughput": {"tokens_per_sec_embed": 100.0, "vectors_per_sec_upsert": 2.0}}
+    
+    estimate = estimate_indexing(chunks, report, reference)
+    
+    assert estimate["vectors"] == 4
+    assert estimate["embedding_tokens"] > 0
+    assert estimate["upsert_seconds"] == 2.0
+    assert estimate["total_seconds"] == pytest.approx(
+        2.0 + estimate["embedding_tokens"] / 100.0 + 2.0, abs=0.01
+    )
+    assert estimate["index_total_bytes"] > estimate["index_vector_bytes"]
+
+
+def test_dry_run_estimates_stored_vector_dimension(tmp_path, monkeypatch):
+    """Il dry run stima l'indice con la dimensione del provider configurato, ridotta dalla compressione"""
+    import importlib.util
+    import json
+    from pathlib import Path
+    from langchain.schema import Document
+    from config import settings
+    from src.document_processor import ChunkStore
+    from src.instrumentation import IngestionReport, estimate_indexing
+    
+    # Modello locale: dimensione dai file di configurazione, senza caricarlo
+    model_dir = tmp_path / "model"
+    (model_dir / "1_Pooling").mkdir(parents=True)
+    (model_dir / "modules.json").write_text(json.dumps([
+        {"idx": 0, "name": "0", "path": "", "type": "sentence_transformers.models.Transformer"},
+        {"idx": 1, "name": "1", "path": "1_Pooling", "type": "sentence_transformers.models.Pooling"},
+    ]))
+    (model_dir / "1_Pooling" / "config.json").write_text(json.dumps({"word_embedding_dimension": 384}))
+    monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "local")
+    monkeypatch.setattr(settings, "LOCAL_EMBEDDING_MODEL", str(model_dir))
+    monkeypatch.setattr(settings, "VECTOR_COMPRESSION", "none")
+    monkeypatch.setattr(settings, "BASE_DIR", tmp_path)
+    
+    chunks = ChunkStore.from_documents([
+        Document(page_content="Pressione pneumatici " * 5, metadata={"marca": "FIAT", "page": i})
+        for i in range(3)
+    ])
+    
+    spec = importlib.util.spec_from_file_location(
+        "index_manuals", Path(__file__).parent.parent / "scripts" / "index_manuals.py"
+    )
+    index_manuals = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(index_manuals)
+    
+    report = IngestionReport(live=False)
+    index_manuals.run_dry_run(chunks, report)
+    estimate = report.extra["estimate"]
+    assert estimate["index_dimension"] == 384
+    assert estimate["index_vector_bytes"] == 3 * 384 * 4
+    
+    # Con la compressione l'indice salva VECTOR_COMPRESSION_DIM componenti
+    monkeypatch.setattr(settings, "VECTOR_COMPRESSION", "pca")
+    monkeypatch.setattr(settings, "VECTOR_COMPRESSION_DIM", 128)
+    estimate = estimate_indexing(chunks, IngestionReport(live=False))
+    assert estimate["index_dimension"] == 128
+    assert estimate["index_vector_bytes"] == 3 * 128 * 4
+    
+    monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "openai")
+    monkeypatch.setattr(settings, "EMBEDDING_MODEL", "text-embedding-3-large")
+    monkeypatch.setattr(settings, "VECTOR_COMPRESSION", "truncate")
+    monkeypatch.setattr(settings, "VECTOR_COMPRESSION_DIM", 4096)
+    assert estimate_indexing(chunks, IngestionReport(live=False))["index_dimension"] == 3072
+
+
+def test_count_tokens_without_download_falls_back_to_estimate(tmp_path, monkeypatch):
+    """Senza tokenizer in cache locale il conteggio offline stima 4 caratteri/token, senza rete"""
+    tiktoken = pytest.importorskip("tiktoken")
+    import tiktoken.load
+    import tiktoken.registry
+    from src import instrumentation
+    
+    downloads = []
+    monkeypatch.setenv("TIKTOKEN_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(tiktoken.registry, "ENCODINGS", {})
+    monkeypatch.setattr(tiktoken.load, "read_file", lambda blobpath: downloads.append(blobpath) or b"")
+    monkeypatch.setattr(instrumentation, "_ENCODINGS", {})
+    
+    assert instrumentation.count_tokens(["a" * 40, "b" * 8], "text-embedding-3-small", download=False) == 12
+    assert downloads == []
+    assert tiktoken.load.read_file is not instrumentation._refuse_download
+
+
+def test_report_to_dict_throughput():
+    """Il report JSON include tempi per fase e throughput"""
+    from src.instrumentation import IngestionReport
+    
+    report = IngestionReport(live=False)
+    with report.stage("parse"):
+        report.incr("pages_parsed", 10)
+    report.finish()
+    
+    data = report.to_dict()
+    
+    assert data["status"] == "completed"
+    assert data["stages"]["parse"]["calls"] == 1
+    assert data["counters"]["pages_parsed"] == 10
+    assert data["throughput"]["pages_per_sec_parse"] > 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
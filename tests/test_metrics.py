@@ -0,0 +1,73 @@
+"""
+Test per le metriche Prometheus
+"""
+import pytest
+
+
+def test_histogram_and_counter_exposition():
+    """Formato testuale Prometheus: bucket cumulativi, somma, conteggio ed etichette"""
+    from src.metrics import MetricsRegistry
+    
+    registry = MetricsRegistry()
+    latency = registry.histogram("test_seconds", "Latenza", ["stage"], buckets=(0.1, 1.0))
+    errors = registry.counter("test_errors_total", "Errori", ["component"])
+    
+    for value in (0.05, 0.5, 0.7, 3.0):
+        latency.observe(value, stage="llm")
+    errors.inc(component='pine"cone')
+    errors.inc(2, component='pine"cone')
+    
+    text = registry.render()
+    assert "# TYPE test_seconds histogram" in text
+    assert 'test_seconds_bucket{stage="llm",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{stage="llm",le="1"} 3' in text
+    assert 'test_seconds_bucket{stage="llm",le="+Inf"} 4' in text
+    assert 'test_seconds_sum{stage="llm"} 4.25' in text
+    assert 'test_seconds_count{stage="llm"} 4' in text
+    assert 'test_errors_total{component="pine\\"cone"} 3' in text
+    
+    with pytest.raises(ValueError):
+        errors.inc(stage="llm")
+
+
+def test_stages_and_cache_feed_metrics():
+    """Fasi e cache registrate durante una richiesta finiscono negli istogrammi e nei contatori"""
+    from src.instrumentation import query_stage, record_cache, request_timings
+    from src.metrics import CACHE_REQUESTS, STAGE_SECONDS, render_metrics
+    
+    before = STAGE_SECONDS.count(stage="search")
+    hits = CACHE_REQUESTS.value(cache="results", result="hit")
+    
+    with request_timings() as timings:
+        with query_stage("search"):
+            pass
+        record_cache("results", True)
+    
+    assert "search" in timings["stages"]
+    assert STAGE_SECONDS.count(stage="search") == before + 1
+    assert CACHE_REQUESTS.value(cache="results", result="hit") == hits + 1
+    assert 'officina_cache_hit_ratio{cache="results"}' in render_metrics()
+
+
+def test_llm_handler_records_latency_and_tokens():
+    """La callback misura la chiamata all'LLM e conta i token di input/output"""
+    import uuid
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, LLMResult
+    from src.metrics import LLM_TOKENS, llm_metrics_handler
+    
+    recorded = {}
+    handler = llm_metrics_handler(lambda name, seconds: recorded.setdefault(name, seconds))
+    output_tokens = LLM_TOKENS.value(type="output")
+    
+    run_id = uuid.uuid4()
+    handler.on_chat_model_start({}, [[]], run_id=run_id)
+    message = AIMessage(content="OK", usage_metadata={"input_tokens": 120, "output_tokens": 7, "total_tokens": 127})
+    handler.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]), run_id=run_id)
+    
+    assert set(recorded) == {"llm_first_token", "llm_call"}
+    assert LLM_TOKENS.value(type="output") == output_tokens + 7
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
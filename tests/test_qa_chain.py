@@ -0,0 +1,222 @@
+"""
+Test per il chatbot RAG (senza Pinecone né LLM reali)
+"""
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_catalog(tmp_path, monkeypatch):
+    """Catalogo dei manuali in una directory temporanea"""
+    from config import settings
+    from src import catalog
+    
+    monkeypatch.setattr(settings, "CATALOG_PATH", tmp_path / "catalog.json")
+    monkeypatch.setattr(catalog, "_catalog", None)
+    monkeypatch.setattr(settings, "TRACE_ENABLED", False)
+
+
+class FakeManager:
+    """VectorStoreManager finto: registra le ricerche e i filtri"""
+    
+    def __init__(self):
+        self.searches = []
+    
+    def similarity_search_with_score(self, query, k=None, filter_dict=None):
+        from langchain_core.documents import Document
+        
+        self.searches.append(filter_dict)
+        doc = Document(page_content="Olio 5W-30, 4.2 litri", metadata={"marca": "FIAT", "modello": "500", "page": 45})
+        return [(doc, 0.9)]
+    
+    def similarity_search_many(self, queries, k, filters=None):
+        self.searches.append(("many", len(queries)))
+        return [self.similarity_search_with_score(query, k, filter_dict) for query, filter_dict in zip(queries, filters)]
+    
+    def get_retriever(self, search_kwargs=None):
+        from src.retriever import ManagerRetriever
+        
+        return ManagerRetriever(manager=self, search_kwargs=search_kwargs or {"k": 4})
+
+
+def make_chatbot(llm):
+    """OfficinaChatbot senza memoria con manager e LLM finti"""
+    from langchain.chains import RetrievalQA
+    from langchain.prompts import PromptTemplate
+    from src.qa_chain import OfficinaChatbot
+    
+    chatbot = OfficinaChatbot.__new__(OfficinaChatbot)
+    chatbot.vectorstore_manager = FakeManager()
+    chatbot.llm = llm
+    chatbot.memory = None
+    chatbot.qa_chain = RetrievalQA.from_chain_type(
+        llm=llm,
+        chain_type="stuff",
+        retriever=chatbot.vectorstore_manager.get_retriever(),
+        return_source_documents=True,
+        chain_type_kwargs={"prompt": PromptTemplate(
+            template="{context}\n{question}", input_variables=["context", "question"]
+        )}
+    )
+    return chatbot
+
+
+def test_identical_concurrent_questions_share_one_computation(monkeypatch):
+    """Domande identiche concorrenti: una sola chiamata all'LLM, stessa risposta per tutti"""
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from config import settings
+    
+    monkeypatch.setattr(settings, "ENABLE_QUERY_COALESCING", True)
+    calls = []
+    started = threading.Event()
+    
+    class SlowLLM(FakeListChatModel):
+        def _call(self, *args, **kwargs):
+            calls.append(1)
+            started.set()
+            time.sleep(0.3)
+            return super()._call(*args, **kwargs)
+    
+    chatbot = make_chatbot(SlowLLM(responses=["Cambia l'olio ogni 15000 km"]))
+    
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        first = pool.submit(chatbot.ask, "Ogni quanto cambio l'olio?", {"marca": "FIAT"})
+        started.wait(5)
+        others = [pool.submit(chatbot.ask, "ogni quanto  cambio l'olio?", {"marca": "FIAT"}) for _ in range(4)]
+        responses = [first.result()] + [future.result() for future in others]
+    
+    assert len(calls) == 1
+    assert {response["answer"] for response in responses} == {"Cambia l'olio ogni 15000 km"}
+    assert [response.get("coalesced", False) for response in responses] == [False] + [True] * 4
+    assert all(response["sources"][0]["pagina"] == 45 for response in responses)
+    assert "coalesced" in responses[1]["timings"]["stages"]
+    assert len({response["trace_id"] for response in responses}) == 5
+
+
+def test_filters_do_not_leak_into_shared_chain():
+    """Il retriever filtrato vale solo per la domanda che lo richiede"""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    
+    chatbot = make_chatbot(FakeListChatModel(responses=["OK"]))
+    chain = chatbot.qa_chain
+    
+    chatbot.ask("coppia di serraggio ruote", {"marca": "FIAT"})
+    chatbot.ask("coppia di serraggio ruote")
+    
+    assert chatbot.qa_chain is chain
+    assert chatbot.vectorstore_manager.searches == [{"marca": "FIAT"}, None]
+
+
+def test_ask_many_shares_retrieval_and_bounds_llm_parallelism(monkeypatch):
+    """Batch: una ricerca di gruppo, LLM in parallelo limitato, errori per singola domanda"""
+    import threading
+    import time
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from config import settings
+    
+    monkeypatch.setattr(settings, "ENABLE_QUERY_COALESCING", False)
+    lock = threading.Lock()
+    running = {"now": 0, "max": 0}
+    
+    class SlowLLM(FakeListChatModel):
+        def _call(self, messages, *args, **kwargs):
+            with lock:
+                running["now"] += 1
+                running["max"] = max(running["max"], running["now"])
+            try:
+                time.sleep(0.1)
+                if "ERRORE" in str(messages[-1].content):
+                    raise RuntimeError("timeout LLM")
+                return "OK"
+            finally:
+                with lock:
+                    running["now"] -= 1
+    
+    chatbot = make_chatbot(SlowLLM(responses=["OK"]))
+    questions = [{"question": f"Controllo {n}", "filters": {"marca": "FIAT"}} for n in range(6)]
+    questions[2]["question"] = "ERRORE"
+    
+    start = time.perf_counter()
+    responses = chatbot.ask_many(questions, max_workers=3)
+    elapsed = time.perf_counter() - start
+    
+    assert chatbot.vectorstore_manager.searches == [("many", 6)] + [{"marca": "FIAT"}] * 6
+    assert running["max"] == 3
+    assert elapsed < 0.5
+    assert [response["answer"] for i, response in enumerate(responses) if i != 2] == ["OK"] * 5
+    assert "timeout LLM" in responses[2]["error"]
+    assert responses[0]["sources"][0]["excerpt"] == "Olio 5W-30, 4.2 litri"
+
+
+def test_slow_llm_returns_partial_answer_with_sources():
+    """LLM oltre il budget: risposta parziale con i passaggi recuperati invece di un errore"""
+    import time
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    
+    class HangingLLM(FakeListChatModel):
+        def _call(self, *args, **kwargs):
+            time.sleep(1.0)
+            return "troppo tardi"
+    
+    chatbot = make_chatbot(HangingLLM(responses=["troppo tardi"]))
+    
+    start = time.perf_counter()
+    response = chatbot.ask("Quantità olio motore?", timeout=0.3)
+    
+    assert time.perf_counter() - start < 0.8
+    assert response["partial"] is True
+    assert response["partial_reason"] == "llm_timeout"
+    assert "error" not in response
+    assert response["sources"][0]["excerpt"] == "Olio 5W-30, 4.2 litri"
+    assert "Olio 5W-30, 4.2 litri" in response["answer"]
+    
+    chatbot.vectorstore_manager.similarity_search_with_score = lambda *args, **kwargs: time.sleep(1.0) or []
+    response = chatbot.ask("Quantità olio motore?", return_sources=False, timeout=0.2)
+    assert response["partial_reason"] == "retrieval_timeout"
+    assert "sources" not in response
+
+
+def test_abandoned_chain_does_not_write_memory():
+    """Chain scaduta: nessuna scrittura nella memoria e Future raccolto per chi trattiene il posto"""
+    import threading
+    from langchain.chains import ConversationalRetrievalChain
+    from langchain.memory import ConversationBufferMemory
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from src.qa_chain import abandoned_chains
+    
+    release = threading.Event()
+    
+    class BlockingLLM(FakeListChatModel):
+        def _call(self, *args, **kwargs):
+            if not release.is_set():
+                release.wait(5)
+                return "risposta mai vista"
+            return super()._call(*args, **kwargs)
+    
+    chatbot = make_chatbot(BlockingLLM(responses=["4.2 litri"]))
+    chatbot.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True, output_key="answer")
+    chatbot.qa_chain = ConversationalRetrievalChain.from_llm(
+        llm=chatbot.llm,
+        retriever=chatbot.vectorstore_manager.get_retriever(),
+        memory=chatbot.memory,
+        return_source_documents=True
+    )
+    
+    with abandoned_chains() as abandoned:
+        response = chatbot.ask("Quantità olio motore?", timeout=0.2)
+    assert response["partial_reason"] == "llm_timeout"
+    assert len(abandoned) == 1 and not abandoned[0].done()
+    
+    release.set()
+    assert abandoned[0].result(timeout=5)["answer"] == "risposta mai vista"
+    assert chatbot.memory.chat_memory.messages == []
+    
+    response = chatbot.ask("Quantità olio motore?", timeout=5)
+    assert response["answer"] == "4.2 litri"
+    assert [message.content for message in chatbot.memory.chat_memory.messages] == ["Quantità olio motore?", "4.2 litri"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
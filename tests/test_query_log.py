@@ -0,0 +1,80 @@
+"""
+Test per il log delle query in background
+"""
+import pytest
+
+
+def test_save_query_log_writes_in_background(tmp_path, monkeypatch):
+    """Le voci vengono scritte dal thread di background con tempi e cache"""
+    import json
+    from config import settings
+    from src import query_log
+    from src.utils import save_query_log
+    
+    monkeypatch.setattr(settings, "QUERY_LOG_PATH", tmp_path / "queries" / "query_log.jsonl")
+    monkeypatch.setattr(query_log, "_query_logger", None)
+    
+    timings = {"stages": {"retrieval": 12.5, "llm": 800.0}, "cache": {"results": "miss"}}
+    save_query_log("cambio olio", "risposta", [{"index": 1}], timings)
+    save_query_log("freni", "altra risposta")
+    
+    logger = query_log.get_query_logger()
+    assert logger.flush(timeout=5)
+    logger.close()
+    
+    lines = (tmp_path / "queries" / "query_log.jsonl").read_text(encoding="utf-8").splitlines()
+    entries = [json.loads(line) for line in lines]
+    assert [entry["question"] for entry in entries] == ["cambio olio", "freni"]
+    assert entries[0]["sources_count"] == 1
+    assert entries[0]["timings_ms"]["llm"] == 800.0
+    assert entries[0]["cache"] == {"results": "miss"}
+    assert "timings_ms" not in entries[1]
+
+
+def test_query_log_rotates_and_compresses(tmp_path):
+    """Oltre max_bytes il file viene ruotato, compresso e i vecchi eliminati"""
+    import gzip
+    from src.query_log import QueryLogger
+    
+    path = tmp_path / "query_log.jsonl"
+    logger = QueryLogger(path, max_bytes=200, backups=2, batch_size=1, flush_interval=0)
+    
+    for i in range(20):
+        logger.log({"question": f"domanda {i}", "padding": "x" * 100})
+        assert logger.flush(timeout=5)
+    logger.close()
+    
+    rotated = sorted(tmp_path.glob("query_log-*.jsonl.gz"))
+    assert logger.rotations > 2
+    assert len(rotated) == 2
+    assert b"domanda" in gzip.decompress(rotated[0].read_bytes())
+    assert path.exists()
+
+
+def test_query_log_never_blocks_on_slow_disk(tmp_path):
+    """Con il disco bloccato log() ritorna subito e scarta le voci oltre la coda"""
+    import threading
+    import time
+    from src.query_log import QueryLogger
+    
+    logger = QueryLogger(tmp_path / "query_log.jsonl", queue_size=3, batch_size=1, flush_interval=0)
+    disk = threading.Event()
+    write = logger._write
+    logger._write = lambda batch: (disk.wait(5), write(batch))
+    
+    start = time.perf_counter()
+    accepted = [logger.log({"question": str(i)}) for i in range(20)]
+    elapsed = time.perf_counter() - start
+    
+    assert elapsed < 0.5
+    assert not all(accepted)
+    assert logger.dropped == accepted.count(False)
+    
+    disk.set()
+    assert logger.flush(timeout=5)
+    logger.close()
+    assert logger.written == accepted.count(True)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
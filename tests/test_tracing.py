@@ -0,0 +1,124 @@
+"""
+Test per tracing, profiler e riepilogo delle tracce
+"""
+import pytest
+
+
+@pytest.fixture
+def trace_file(tmp_path, monkeypatch):
+    """Tracce scritte in una directory temporanea"""
+    from config import settings
+    from src import tracing
+    
+    monkeypatch.setattr(settings, "TRACE_PATH", tmp_path / "traces.jsonl")
+    monkeypatch.setattr(settings, "PROFILE_DIR", tmp_path / "profiles")
+    monkeypatch.setattr(settings, "TRACE_ENABLED", True)
+    monkeypatch.setattr(settings, "TRACE_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(tracing, "_trace_logger", None)
+    yield tmp_path / "traces.jsonl"
+    if tracing._trace_logger is not None:
+        tracing._trace_logger.close()
+
+
+def test_spans_nest_and_trace_is_saved(trace_file):
+    """Gli span annidati (anche dalle fasi delle query) finiscono nella traccia salvata"""
+    import json
+    from src import tracing
+    from src.instrumentation import query_stage
+    
+    with tracing.start_trace("POST /query", trace_id="abc123") as trace:
+        with tracing.start_trace("ask", question="cambio olio") as inner:
+            assert inner is trace
+            with query_stage("retrieval"):
+                with query_stage("search"):
+                    pass
+            with pytest.raises(ValueError):
+                with tracing.span("llm"):
+                    raise ValueError("timeout")
+    
+    assert tracing.current_trace() is None
+    with tracing.span("fuori"):
+        pass
+    
+    assert tracing.get_trace_logger().flush(timeout=5)
+    saved = json.loads(trace_file.read_text(encoding="utf-8").splitlines()[0])
+    spans = {span["name"]: span for span in saved["spans"]}
+    
+    assert saved["trace_id"] == "abc123"
+    assert [span["name"] for span in saved["spans"]] == ["POST /query", "ask", "retrieval", "search", "llm"]
+    assert spans["search"]["parent"] == spans["retrieval"]["id"]
+    assert spans["retrieval"]["parent"] == spans["ask"]["id"]
+    assert spans["ask"]["attrs"] == {"question": "cambio olio"}
+    assert spans["llm"]["error"] == "ValueError: timeout"
+
+
+def test_sampling_profiler_and_report(trace_file):
+    """Il profilo a campionamento e il report CLI individuano la funzione lenta"""
+    import subprocess
+    import sys
+    import time
+    from pathlib import Path
+    from src import tracing
+    
+    def slow_function():
+        end = time.perf_counter() + 0.2
+        while time.perf_counter() < end:
+            pass
+    
+    with tracing.start_trace("ask", profile=True) as trace:
+        with tracing.span("llm"):
+            slow_function()
+    
+    assert tracing.get_trace_logger().flush(timeout=5)
+    profile = Path(trace.profile)
+    assert "slow_function" in profile.read_text(encoding="utf-8")
+    
+    script = Path(__file__).parent.parent / "scripts" / "trace_report.py"
+    result = subprocess.run(
+        [sys.executable, str(script), "--path", str(trace_file), "--trace-id", trace.trace_id],
+        capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    assert trace.trace_id in result.stdout
+    assert "slow_function" in result.stdout
+
+
+
+def test_profiler_follows_worker_thread(trace_file):
+    """Con la domanda eseguita in un worker (come /query) il profilo campiona il worker, non chi attende"""
+    import contextvars
+    import threading
+    import time
+    from pathlib import Path
+    from src import tracing
+    
+    def slow_function():
+        end = time.perf_counter() + 0.2
+        while time.perf_counter() < end:
+            pass
+    
+    def ask():
+        with tracing.start_trace("ask"):
+            slow_function()
+    
+    def wait_for_worker(worker):
+        worker.join()
+    
+    with tracing.start_trace("POST /query", profile=True) as trace:
+        worker = threading.Thread(target=contextvars.copy_context().run, args=(ask,))
+        worker.start()
+        wait_for_worker(worker)
+    
+    samples = {}
+    for line in Path(trace.profile).read_text(encoding="utf-8").splitlines():
+        stack, _, count = line.rpartition(" ")
+        for name in ("slow_function", "wait_for_worker"):
+            if name in stack:
+                samples[name] = samples.get(name, 0) + int(count)
+    # Solo l'istante prima/dopo la registrazione del worker campiona il thread in attesa
+    assert samples["slow_function"] >= 10
+    assert samples.get("wait_for_worker", 0) <= 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,494 @@
+"""
+Test per la gestione del vector store (senza connessione a Pinecone)
+"""
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_catalog(tmp_path, monkeypatch):
+    """Catalogo dei manuali in una directory temporanea"""
+    from config import settings
+    from src import catalog
+    
+    monkeypatch.setattr(settings, "CATALOG_PATH", tmp_path / "catalog.json")
+    monkeypatch.setattr(catalog, "_catalog", None)
+
+
+class FakeEmbeddings:
+    """Embeddings deterministici per i test"""
+    
+    def __init__(self):
+        self.calls = 0
+        self.queries = []
+        self.batches = []
+    
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [[float(len(text)), 1.0] for text in texts]
+    
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [float(len(text)), 1.0]
+    
+    def embed_queries(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+class FakeIndex:
+    """Indice Pinecone in memoria"""
+    
+    def __init__(self, results=None):
+        self.upserts = []
+        self.deletes = []
+        self.results = results or {}
+        self.queries = []
+    
+    def query(self, vector, top_k, include_metadata=True, namespace=None, filter=None):
+        self.queries.append((namespace, filter))
+        return {"matches": self.results.get(namespace or "", [])[:top_k]}
+    
+    def upsert(self, vectors, namespace=None):
+        self.upserts.append((namespace, list(vectors)))
+    
+    def delete(self, **kwargs):
+        self.deletes.append(kwargs)
+    
+    def fetch(self, ids, namespace=None):
+        # Come i client Pinecone recenti: dataclass con attributi, non un dict
+        from types import SimpleNamespace
+        
+        stored = {
+            id_: SimpleNamespace(id=id_, metadata=metadata)
+            for ns, vectors in self.upserts if (ns or "") == (namespace or "")
+            for id_, _, metadata in vectors
+        }
+        return SimpleNamespace(vectors={id_: stored[id_] for id_ in ids if id_ in stored})
+    
+    def describe_index_stats(self):
+        namespaces = {}
+        for namespace, vectors in self.upserts:
+            entry = namespaces.setdefault(namespace or "", {"vector_count": 0})
+            entry["vector_count"] += len(vectors)
+        return {
+            "total_vector_count": sum(len(v) for _, v in self.upserts),
+            "namespaces": namespaces,
+        }
+
+
+def match(id, text, score, **metadata):
+    """Risultato di una query Pinecone"""
+    return {"id": id, "score": score, "metadata": {"text": text, **metadata}}
+
+
+def make_manager():
+    """VectorStoreManager con dipendenze finte"""
+    from src.cache import EmbeddingCache, ResultCache
+    from src.compression import VectorCompression
+    from src.vectorstore import VectorStoreManager
+    
+    manager = VectorStoreManager.__new__(VectorStoreManager)
+    manager.pc = None
+    manager.index = FakeIndex()
+    manager.embeddings = FakeEmbeddings()
+    manager.vectorstore = None
+    manager._namespaces = None
+    manager.result_cache = ResultCache(max_size=16)
+    manager.embedding_cache = EmbeddingCache("test", max_size=16)
+    manager.compression = VectorCompression()
+    manager.docstore = None
+    manager.create_index_if_not_exists = lambda *args, **kwargs: None
+    return manager
+
+
+def test_index_documents_reports_embed_and_upsert():
+    """L'indicizzazione registra chiamate di embedding e batch di upsert"""
+    from langchain.schema import Document
+    from src.catalog import get_catalog
+    from src.instrumentation import IngestionReport
+    
+    manager = make_manager()
+    report = IngestionReport(live=False)
+    docs = [Document(page_content=f"chunk {i}", metadata={"marca": "FIAT", "page": i}) for i in range(5)]
+    
+    manager.index_documents(docs, batch_size=2, report=report)
+    
+    assert report.counters["embedding_calls"] == 3
+    assert report.counters["upsert_batches"] == 3
+    assert report.counters["vectors_upserted"] == 5
+    assert report.counters["embedding_tokens"] > 0
+    _, vectors = manager.index.upserts[0]
+    assert vectors[0][2]["text"] == "chunk 0"
+    assert vectors[0][2]["marca"] == "FIAT"
+    assert get_catalog().get_brands() == ["FIAT"]
+
+
+def test_pca_fit_sample_spans_the_corpus(tmp_path, monkeypatch):
+    """La PCA si addestra su un campione uniforme (non solo i primi manuali) e ogni chunk è indicizzato una volta"""
+    from langchain.schema import Document
+    from config import settings
+    from src.compression import VectorCompression
+    from src.instrumentation import IngestionReport
+    
+    monkeypatch.setattr(settings, "VECTOR_PCA_SAMPLE", 8)
+    manager = make_manager()
+    manager.compression = VectorCompression("pca", 1, directory=tmp_path)
+    docs = [
+        Document(page_content=f"chunk {i}" + " x" * (i % 7), metadata={"marca": "FIAT" if i < 20 else "BMW", "page": i})
+        for i in range(40)
+    ]
+    
+    report = IngestionReport(live=False)
+    manager.index_documents(docs, batch_size=4, report=report)
+    
+    assert not manager.compression.needs_fit
+    sample = [metadata for _, vectors in manager.index.upserts[:2] for _, _, metadata in vectors]
+    assert len(sample) == 8
+    assert {metadata["marca"] for metadata in sample} == {"FIAT", "BMW"}
+    pages = [metadata["page"] for _, vectors in manager.index.upserts for _, _, metadata in vectors]
+    assert sorted(pages) == list(range(40))
+    assert report.counters["vectors_upserted"] == 40
+
+
+def test_brand_namespaces_routing(monkeypatch):
+    """Con NAMESPACE_BY_BRAND ogni marca va (e viene cercata) nel proprio namespace"""
+    from langchain.schema import Document
+    from config import settings
+    
+    monkeypatch.setattr(settings, "NAMESPACE_BY_BRAND", True)
+    manager = make_manager()
+    docs = [
+        Document(page_content="olio", metadata={"marca": "FIAT"}),
+        Document(page_content="freni", metadata={"marca": "VW"}),
+    ]
+    
+    manager.index_documents(docs)
+    
+    assert sorted(namespace for namespace, _ in manager.index.upserts) == ["FIAT", "VW"]
+    assert manager._route_filter({"marca": "fiat", "modello": "500"}) == (["FIAT"], {"modello": "500"})
+    assert manager._route_filter({"marca": {"$in": ["FIAT", "VW"]}}) == (["FIAT", "VW"], None)
+    assert manager._route_filter({"anno": "2020"}) == (None, {"anno": "2020"})
+    
+    manager.delete_by_filter({"marca": "VW"}, confirm=True)
+    assert manager.index.deletes == [{"delete_all": True, "namespace": "VW"}]
+
+
+def test_search_fans_out_over_namespaces(monkeypatch):
+    """Senza filtro su marca i risultati di tutti i namespace vengono fusi per score"""
+    from langchain.schema import Document
+    from config import settings
+    
+    monkeypatch.setattr(settings, "NAMESPACE_BY_BRAND", True)
+    manager = make_manager()
+    manager._namespaces = ["FIAT", "VW"]
+    manager.index.results = {
+        "FIAT": [match("f1", "fiat", 0.9), match("f2", "fiat 2", 0.5)],
+        "VW": [match("v1", "vw", 0.8)],
+    }
+    
+    results = manager.similarity_search_with_score("coppia testata", k=2)
+    
+    assert [doc.page_content for doc, _ in results] == ["fiat", "vw"]
+    
+    manager.index.queries.clear()
+    manager.search("coppia testata", k=2, filter_dict={"marca": "VW"})
+    assert manager.index.queries == [("VW", None)]
+
+
+def test_result_cache_invalidated_by_writes():
+    """Ricerche ripetute usano la cache finché l'indice non viene modificato"""
+    from langchain.schema import Document
+    
+    manager = make_manager()
+    manager._namespaces = [""]
+    manager.index.results = {"": [match("v1", "olio", 0.9)]}
+    
+    first = manager.similarity_search_with_score("Cambio  olio", k=3)
+    first[0][0].metadata["marca"] = "modificato"
+    second = manager.similarity_search_with_score("cambio olio ", k=3)
+    
+    assert len(manager.index.queries) == 1
+    assert second[0][0].id == "v1" and second[0][0].metadata == {}
+    assert manager.result_cache.stats()["hits"] == 1
+    
+    manager.index_documents([Document(page_content="freni", metadata={"marca": "FIAT"})])
+    manager.similarity_search_with_score("cambio olio", k=3)
+    
+    assert len(manager.index.queries) == 2
+
+
+def test_search_records_stage_timings_and_cache_hits():
+    """Ricerca ed embedding registrano tempi e hit/miss nella richiesta corrente"""
+    from src.instrumentation import request_timings
+    
+    manager = make_manager()
+    manager._namespaces = [""]
+    manager.index.results = {"": [match("v1", "olio", 0.9)]}
+    
+    with request_timings() as first:
+        manager.similarity_search_with_score("cambio olio", k=3)
+    with request_timings() as second:
+        manager.similarity_search_with_score("cambio olio", k=3)
+    
+    assert set(first["stages"]) == {"embedding", "search"}
+    assert first["cache"] == {"results": "miss", "embedding": "miss"}
+    assert second["cache"] == {"results": "hit"}
+    assert second["stages"] == {}
+
+def test_query_embedding_does_not_depend_on_cache(monkeypatch):
+    """Stesso embedding con e senza cache: la normalizzazione vale solo per la chiave"""
+    from config import settings
+    from src.metrics import ERRORS
+    
+    class CaseSensitive(FakeEmbeddings):
+        def embed_query(self, text):
+            self.queries.append(text)
+            return [float(len(text)), float(sum(c.isupper() for c in text))]
+        
+        def embed_queries(self, texts):
+            return [self.embed_query(text) for text in texts]
+    
+    query = "Coppia  serraggio TESTATA"
+    vectors = {}
+    for enabled in (True, False):
+        monkeypatch.setattr(settings, "ENABLE_CACHE", enabled)
+        manager = make_manager()
+        manager.embeddings = CaseSensitive()
+        vectors[enabled] = (manager.embed_query(query), manager.embed_queries([query])[0])
+        assert manager.embeddings.queries[0] == query
+    
+    assert vectors[True] == vectors[False]
+    assert len({tuple(vector) for vector in vectors[True] + vectors[False]}) == 1
+    
+    # Errori del provider contati anche senza cache
+    manager.embeddings.embed_query = lambda text: 1 / 0
+    errors = ERRORS.value(component="embedding")
+    with pytest.raises(ZeroDivisionError):
+        manager.embed_query(query)
+    assert ERRORS.value(component="embedding") == errors + 1
+
+
+def test_embedding_cache_normalizes_and_persists(tmp_path):
+    """Query uguali a meno di spazi e maiuscole vengono embeddate una sola volta"""
+    from src.cache import EmbeddingCache
+    
+    embeddings = FakeEmbeddings()
+    cache = EmbeddingCache("test", max_size=4, path=tmp_path / "embeddings.sqlite")
+    
+    first = cache.embed_query(embeddings, "Coppia  serraggio TESTATA")
+    second = cache.embed_query(embeddings, " coppia serraggio testata")
+    shared = EmbeddingCache("test", path=tmp_path / "embeddings.sqlite").get("coppia serraggio testata")
+    
+    assert embeddings.queries == ["Coppia  serraggio TESTATA"]
+    assert first == second == shared
+
+
+def test_search_many_batches_embeddings_and_keeps_order():
+    """search_many calcola gli embedding in un'unica chiamata e restituisce i risultati in ordine"""
+    manager = make_manager()
+    manager._namespaces = [""]
+    manager.index.results = {"": [match("v1", "olio", 0.9)]}
+    manager.embedding_cache.put("freni", [5.0, 1.0])
+    
+    results = manager.similarity_search_many(
+        ["Cambio olio", "freni", "cambio  OLIO", "candele"],
+        k=3,
+        filters=[None, None, None, {"marca": "FIAT"}]
+    )
+    
+    assert len(results) == 4
+    assert [[doc.id for doc, _ in result] for result in results] == [["v1"], ["v1"], ["v1"], ["v1"]]
+    assert manager.embeddings.batches == [["Cambio olio", "candele"]]
+    assert manager.embeddings.calls == 0 and manager.embeddings.queries == []
+    assert len(manager.index.queries) == 3
+    
+    # Query duplicate: Document distinti per posizione
+    results[0][0][0].metadata["marca"] = "modificato"
+    assert results[2][0][0].metadata == {}
+    
+    # Seconda esecuzione: tutto dalla cache dei risultati
+    docs = manager.search_many(["cambio olio", "freni"], k=3)
+    assert [[doc.id for doc in result] for result in docs] == [["v1"], ["v1"]]
+    assert len(manager.index.queries) == 3
+
+
+def test_embed_queries_uses_query_semantics_and_instrumentation():
+    """Embedding di più query: metodo per le query del provider, tempi, hit/miss ed errori"""
+    from src.instrumentation import CACHE_REQUESTS, request_timings
+    from src.metrics import ERRORS
+    
+    manager = make_manager()
+    manager.embedding_cache.put("freni", [5.0, 1.0])
+    hits = CACHE_REQUESTS.value(cache="embedding", result="hit")
+    misses = CACHE_REQUESTS.value(cache="embedding", result="miss")
+    
+    with request_timings() as timings:
+        vectors = manager.embed_queries(["Cambio olio", "freni"])
+    assert vectors == [[11.0, 1.0], [5.0, 1.0]]
+    assert manager.embeddings.batches == [["Cambio olio"]]
+    assert "embedding" in timings["stages"]
+    assert CACHE_REQUESTS.value(cache="embedding", result="hit") == hits + 1
+    assert CACHE_REQUESTS.value(cache="embedding", result="miss") == misses + 1
+    
+    # Provider senza metodo batch per le query: embed_query per ciascuna
+    class QueryOnly:
+        def __init__(self):
+            self.queries = []
+        
+        def embed_documents(self, texts):
+            raise AssertionError("embed_documents non va usato per le query")
+        
+        def embed_query(self, text):
+            self.queries.append(text)
+            if text == "guasto":
+                raise RuntimeError("provider non disponibile")
+            return [float(len(text)), 1.0]
+    
+    manager.embeddings = QueryOnly()
+    assert manager.embed_queries(["candele", "filtro aria"]) == [[7.0, 1.0], [11.0, 1.0]]
+    assert manager.embeddings.queries == ["candele", "filtro aria"]
+    
+    errors = ERRORS.value(component="embedding")
+    with pytest.raises(RuntimeError):
+        manager.embed_queries(["guasto"])
+    assert ERRORS.value(component="embedding") == errors + 1
+
+
+def test_docstore_keeps_text_out_of_index(tmp_path, monkeypatch):
+    """Con il docstore l'indice riceve solo i campi filtrabili e il testo viene letto in locale"""
+    from langchain.schema import Document
+    from src.docstore import DocStore
+    
+    manager = make_manager()
+    manager.docstore = DocStore(tmp_path / "docstore.sqlite")
+    metadata = {"marca": "FIAT", "modello": "500", "anno": "2020", "page": 12, "filename": "FIAT_500_2020.pdf"}
+    
+    manager.index_documents([Document(page_content="Coppia di serraggio 25 Nm", metadata=metadata)])
+    
+    _, vectors = manager.index.upserts[0]
+    vector_id, _, index_metadata = vectors[0]
+    assert index_metadata == {"marca": "FIAT", "modello": "500", "anno": "2020"}
+    
+    manager._namespaces = [""]
+    manager.index.results = {"": [{"id": vector_id, "score": 0.9, "metadata": index_metadata}]}
+    doc, score = manager.similarity_search_with_score("coppia", k=1)[0]
+    
+    assert doc.page_content == "Coppia di serraggio 25 Nm"
+    assert doc.metadata == metadata
+    
+    manager.delete_by_filter({"marca": "fiat"}, confirm=True)
+    assert len(manager.docstore) == 0
+
+
+
+def test_small_to_big_expands_neighbors(tmp_path, monkeypatch):
+    """In modalità small-to-big i risultati vengono espansi ai chunks vicini e fusi"""
+    from langchain.schema import Document
+    from config import settings
+    from src import adjacency
+    from src.adjacency import ChunkAdjacency, chunk_id
+    from src.docstore import DocStore
+    from src.document_processor import ChunkStore
+    
+    monkeypatch.setattr(settings, "SMALL_TO_BIG", True)
+    monkeypatch.setattr(settings, "EXPANSION_MODE", "neighbors")
+    monkeypatch.setattr(settings, "EXPANSION_WINDOW", 1)
+    monkeypatch.setattr(settings, "CHUNK_ADJACENCY_PATH", tmp_path / "adjacency.json")
+    monkeypatch.setattr(adjacency, "_adjacency", None)
+    
+    filename = "FIAT_500_2020.pdf"
+    chunks = ChunkStore.from_documents([
+        Document(
+            page_content=f"passo {i}",
+            metadata={"marca": "FIAT", "filename": filename, "page": 1 + i // 3, "chunk_index": i}
+        )
+        for i in range(8)
+    ])
+    ChunkAdjacency().add_store(chunks).save()
+    
+    manager = make_manager()
+    manager.docstore = DocStore(tmp_path / "docstore.sqlite")
+    manager.index_documents(chunks)
+    
+    _, vectors = manager.index.upserts[0]
+    assert [vector[0] for vector in vectors] == [chunk_id(filename, i) for i in range(8)]
+    
+    manager._namespaces = [""]
+    manager.index.results = {"": [
+        {"id": chunk_id(filename, 3), "score": 0.9, "metadata": {"marca": "FIAT"}},
+        {"id": chunk_id(filename, 1), "score": 0.8, "metadata": {"marca": "FIAT"}},
+        {"id": chunk_id(filename, 7), "score": 0.7, "metadata": {"marca": "FIAT"}},
+    ]}
+    results = manager.similarity_search_with_score("passo", k=3)
+    
+    assert [doc.page_content for doc, _ in results] == [
+        "passo 0\npasso 1\npasso 2\npasso 3\npasso 4",
+        "passo 6\npasso 7",
+    ]
+    assert [score for _, score in results] == [0.9, 0.7]
+    assert results[0][0].metadata["chunk_range"] == [0, 4]
+    assert results[0][0].metadata["chunk_index"] == 3
+    
+    # Senza docstore il testo dei vicini viene letto dall'indice
+    manager.docstore = None
+    manager.index = FakeIndex()
+    manager.index_documents(chunks)
+    hit = Document(page_content="passo 5", metadata={"marca": "FIAT", "filename": filename, "chunk_index": 5})
+    doc, _ = manager._expand([(hit, 0.5)])[0]
+    assert doc.page_content == "passo 4\npasso 5\npasso 6"
+    
+    # Modalità pagina: tutta la pagina del risultato
+    monkeypatch.setattr(settings, "EXPANSION_MODE", "page")
+    hit = Document(page_content="passo 4", metadata={"marca": "FIAT", "filename": filename, "page": 2, "chunk_index": 4})
+    doc, _ = manager._expand([(hit, 0.5)])[0]
+    assert doc.metadata["chunk_range"] == [3, 5]
+    
+    # Adiacenza non aggiornata (chunk oltre quelli noti): risultato non espanso
+    hit = Document(page_content="passo 9", metadata={"marca": "FIAT", "filename": filename, "chunk_index": 9})
+    assert manager._expand([(hit, 0.5)]) == [(hit, 0.5)]
+
+
+
+def test_hierarchical_retrieval_narrows_to_candidate_manuals(tmp_path, monkeypatch):
+    """Senza filtro su modello la ricerca sui chunks è ristretta ai manuali più vicini"""
+    from langchain.schema import Document
+    from config import settings
+    from src import hierarchy
+    from src.hierarchy import get_summary_index
+    
+    monkeypatch.setattr(settings, "HIERARCHICAL_RETRIEVAL", True)
+    monkeypatch.setattr(settings, "HIERARCHY_TOP_MANUALS", 1)
+    monkeypatch.setattr(settings, "NAMESPACE_BY_BRAND", True)
+    monkeypatch.setattr(settings, "SUMMARY_INDEX_PATH", tmp_path / "summaries.npz")
+    monkeypatch.setattr(hierarchy, "_summaries", None)
+    
+    # FakeEmbeddings: il vettore dipende dalla lunghezza del testo
+    docs = [
+        Document(page_content="a" * 2, metadata={"marca": "FIAT", "modello": "500", "filename": "FIAT_500.pdf", "page": 1}),
+        Document(page_content="b" * 60, metadata={"marca": "FORD", "modello": "Fiesta", "filename": "FORD_Fiesta.pdf", "page": 3}),
+    ]
+    manager = make_manager()
+    manager.index_documents(docs)
+    
+    summaries = get_summary_index()
+    assert summaries.manuals == 2
+    assert len(summaries) == 4
+    
+    manager._namespaces = ["FIAT", "FORD"]
+    manager.similarity_search_with_score("c" * 50, k=3)
+    assert manager.index.queries == [("FORD", {"filename": {"$in": ["FORD_Fiesta.pdf"]}})]
+    
+    # Il filtro su marca viene rispettato dal primo stadio
+    manager.similarity_search_with_score("c" * 50, k=3, filter_dict={"marca": "FIAT"})
+    assert manager.index.queries[-1] == ("FIAT", {"filename": {"$in": ["FIAT_500.pdf"]}})
+    
+    # Con un filtro su modello la ricerca resta piatta
+    manager.similarity_search_with_score("c" * 50, k=3, filter_dict={"marca": "FIAT", "modello": "500"})
+    assert manager.index.queries[-1] == ("FIAT", {"modello": "500"})
+    
+    manager.delete_by_filter({"marca": "FORD"}, confirm=True)
+    assert get_summary_index().manuals == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,112 @@
+"""
+Test per il warm-up del worker API (senza Pinecone né LLM)
+"""
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_catalog(tmp_path, monkeypatch):
+    """Catalogo dei manuali in una directory temporanea"""
+    from config import settings
+    from src import catalog
+    
+    monkeypatch.setattr(settings, "CATALOG_PATH", tmp_path / "catalog.json")
+    monkeypatch.setattr(catalog, "_catalog", None)
+    monkeypatch.setattr(settings, "SMALL_TO_BIG", False)
+    monkeypatch.setattr(settings, "HIERARCHICAL_RETRIEVAL", False)
+
+
+class FakeManager:
+    """VectorStoreManager finto: registra le chiamate di prova"""
+    
+    def __init__(self, reachable=True):
+        self.reachable = reachable
+        self.docstore = None
+        self.search_error = None
+        self.calls = []
+    
+    def get_index_stats(self):
+        self.calls.append("stats")
+        return {"total_vector_count": 42} if self.reachable else {}
+    
+    def embed_query(self, query):
+        self.calls.append("embed")
+        return [1.0, 0.0]
+    
+    def similarity_search_with_score(self, query, k, filter_dict=None):
+        self.calls.append("search")
+        if self.search_error:
+            raise ConnectionError(self.search_error)
+        return [("doc", 0.9)]
+
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+    
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        return "OK"
+
+
+class FakeChatbot:
+    def __init__(self, manager):
+        self.vectorstore_manager = manager
+        self.llm = FakeLLM()
+
+
+def test_warmup_runs_probe_and_reports_latencies():
+    """Il worker è pronto dopo embedding, ricerca e LLM di prova"""
+    from src.warmup import STEPS, Warmup
+    
+    manager = FakeManager()
+    warmup = Warmup(chatbot_factory=lambda: FakeChatbot(manager), probe_question="olio motore", probe_llm=True)
+    
+    assert warmup.status()["state"] == "pending"
+    assert warmup.run() is True
+    
+    status = warmup.status()
+    assert status["ready"] and status["progress"] == f"{len(STEPS)}/{len(STEPS)}"
+    assert all("ms" in status["steps"][name] for name in STEPS)
+    assert status["steps"]["index"]["vectors"] == 42
+    assert manager.calls == ["stats", "embed", "search"]
+    assert len(warmup.chatbot.llm.prompts) == 1
+
+
+def test_warmup_failure_is_retryable():
+    """Un passo fallito lascia il worker non pronto; il tentativo successivo riparte"""
+    from src.warmup import Warmup
+    
+    manager = FakeManager(reachable=False)
+    warmup = Warmup(chatbot_factory=lambda: FakeChatbot(manager), probe_llm=False)
+    
+    assert warmup.run() is False
+    status = warmup.status()
+    assert status["state"] == "failed" and not status["ready"]
+    assert status["steps"]["index"]["status"] == "failed"
+    assert status["steps"]["search"]["status"] == "pending"
+    
+    manager.reachable = True
+    assert warmup.run() is True
+    assert warmup.status()["attempts"] == 2
+    assert warmup.status()["steps"]["llm"]["status"] == "skipped"
+    assert warmup.chatbot.llm.prompts == []
+
+
+def test_warmup_search_failure_is_not_ready():
+    """Una ricerca di prova non riuscita fa fallire il warm-up (non conta come 0 risultati)"""
+    from src.warmup import Warmup
+    
+    manager = FakeManager()
+    manager.search_error = "indice non raggiungibile"
+    warmup = Warmup(chatbot_factory=lambda: FakeChatbot(manager), probe_llm=False)
+    
+    assert warmup.run() is False
+    status = warmup.status()
+    assert status["steps"]["search"]["status"] == "failed"
+    assert "indice non raggiungibile" in status["error"]
+    assert status["steps"]["llm"]["status"] == "pending"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])